@@ -0,0 +1,58 @@
+""" Report the per-call latency of each backend for each kind of helper.
+
+Uses cheap ioctls on a pipe: FIONREAD (read), FIONBIO (write and read/write
+through a pointer) and FIOCLEX (no argument). The ioctl_fn_w row passes FIONBIO
+an integer instead of a pointer, which the kernel rejects with EFAULT after
+entering the system call, so it still measures the full path of a value call.
+The mock backend column shows the overhead of the library itself, without any
+system call.
+Run from the source directory with ``python -m benchmarks.bench_backends``.
+"""
+import ctypes
+import os
+import timeit
+
+import ioctl
+import ioctl.backends
+
+FIONREAD = 0x541B
+FIONBIO = 0x5421
+FIOCLEX = 0x5451
+
+def _bench(fn, number):
+    elapsed = min(timeit.repeat(fn, number=number, repeat=5))
+    return elapsed * 1e9 / number
+
+def main(number=100000):
+    rfd, wfd = os.pipe()
+    try:
+        os.write(wfd, b'x' * 10)
+        pending = ctypes.c_int()
+        helpers = [
+            ('ioctl_fn_ptr_r', ioctl.ioctl_fn_ptr_r(FIONREAD, ctypes.c_int), (rfd,)),
+            ('ioctl_fn_ptr_w', ioctl.ioctl_fn_ptr_w(FIONBIO, ctypes.c_int), (rfd, 0)),
+            ('ioctl_fn_ptr_wr', ioctl.ioctl_fn_ptr_wr(FIONBIO, ctypes.c_int), (rfd, 0)),
+            ('ioctl_fn_w', ioctl.ioctl_fn_w(FIONBIO, ctypes.c_int, check=False), (rfd, 0)),
+            ('ioctl (pointer)', ioctl.ioctl, (rfd, FIONREAD, ctypes.byref(pending))),
+            ('ioctl (none)', ioctl.ioctl, (rfd, FIOCLEX)),
+            ('compile r', ioctl.compile(FIONREAD, ctypes.c_int, 'r'), (rfd,)),
+        ]
+        backends = [ 'ctypes', 'fcntl', ioctl.backends.MockBackend() ]
+        header = '{:<18}'.format('helper kind') + ''.join('{:>12}'.format(b if isinstance(b, str) else b.name) for b in backends) + '{:>12}'.format('auto')
+        print(header + '   (ns/call)')
+        for name, fn, call_args in helpers:
+            row = '{:<18}'.format(name)
+            for backend in backends + [ None ]:
+                # The helpers follow the pinned backend, like calls compiled without a backend.
+                ioctl.backends.set_backend(backend)
+                try:
+                    row += '{:>12.1f}'.format(_bench(lambda: fn(*call_args), number))
+                finally:
+                    ioctl.backends.set_backend(None)
+            print(row)
+    finally:
+        os.close(rfd)
+        os.close(wfd)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+""" Compare the per-call overhead of compiled ioctl calls and the helper functions.
+
+Runs FIONREAD on a pipe, which is a cheap ioctl on Linux, and prints the time per call.
+Run from the source directory with ``python -m benchmarks.bench_compiled``.
+"""
+import ctypes
+import os
+import timeit
+
+import ioctl
+
+FIONREAD = 0x541B
+
+def _bench(name, fn, number, per_call=1):
+    elapsed = min(timeit.repeat(fn, number=number, repeat=5))
+    print('{name:<28} {ns:8.1f} ns/call'.format(name=name, ns=elapsed * 1e9 / number / per_call))
+
+def main(number=200000):
+    rfd, wfd = os.pipe()
+    try:
+        os.write(wfd, b'x' * 10)
+        helper = ioctl.ioctl_fn_ptr_r(FIONREAD, ctypes.c_int)
+        compiled = ioctl.compile(FIONREAD, ctypes.c_int, 'r')
+        value = ctypes.c_int()
+        value_ptr = ctypes.byref(value)
+        _bench('ioctl.ioctl()', lambda: ioctl.ioctl(rfd, FIONREAD, value_ptr), number)
+        _bench('ioctl.ioctl_fn_ptr_r()', lambda: helper(rfd), number)
+        _bench('ioctl.compile(..., \'r\')', lambda: compiled(rfd), number)
+        fds = [ rfd ] * 1000
+        _bench('ioctl.ioctl_many() per fd', lambda: ioctl.ioctl_many(fds, FIONREAD, ctypes.c_int), number // 1000, per_call=1000)
+    finally:
+        os.close(rfd)
+        os.close(wfd)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+""" Compare PendingReader with plain read(65536) loops on pipes and Unix sockets.
+
+A writer thread sends a stream of messages of mixed sizes, and the reader consumes it
+until end of file. The table shows the throughput, the number of read system calls, and
+the number of bytes allocated for the data by each reader.
+Run from the source directory with ``python -m benchmarks.bench_reader``.
+"""
+import os
+import random
+import socket
+import threading
+import time
+
+import ioctl.reader
+
+def _messages(total, seed=1):
+    rng = random.Random(seed)
+    sizes = []
+    while total > 0:
+        size = min(total, rng.choice((64, 512, 4096, 200000)))
+        sizes.append(size)
+        total -= size
+    return sizes
+
+def _writer(write, close, sizes):
+    payload = b'x' * max(sizes)
+    for size in sizes:
+        view = memoryview(payload)[:size]
+        while view:
+            view = view[write(view):]
+    close()
+
+def _read_plain(fd):
+    reads = 0
+    allocated = 0
+    while True:
+        data = os.read(fd, 65536)
+        reads += 1
+        allocated += 65536
+        if not data:
+            return reads, allocated
+
+def _read_pending(fd):
+    reader = ioctl.reader.PendingReader(fd)
+    for data in reader:
+        pass
+    allocated = sum(len(buf) for buf in reader._ring)
+    return reader.reads, allocated
+
+def _pipe():
+    rfd, wfd = os.pipe()
+    return rfd, (lambda data: os.write(wfd, data)), (lambda: os.close(wfd)), (lambda: os.close(rfd))
+
+def _socketpair():
+    a, b = socket.socketpair()
+    return b.fileno(), a.send, a.close, b.close
+
+def _run(transport, read, sizes):
+    rfd, write, close_writer, close_reader = transport()
+    thread = threading.Thread(target=_writer, args=(write, close_writer, sizes))
+    start = time.perf_counter()
+    thread.start()
+    reads, allocated = read(rfd)
+    elapsed = time.perf_counter() - start
+    thread.join()
+    close_reader()
+    return elapsed, reads, allocated
+
+def main(total=256 * 1024 * 1024):
+    sizes = _messages(total)
+    print('{:<12}{:<16}{:>12}{:>12}{:>14}'.format('transport', 'reader', 'MiB/s', 'reads', 'alloc MiB'))
+    for transport_name, transport in (('pipe', _pipe), ('unix socket', _socketpair)):
+        for reader_name, read in (('read(65536)', _read_plain), ('PendingReader', _read_pending)):
+            elapsed, reads, allocated = _run(transport, read, sizes)
+            print('{:<12}{:<16}{:>12.1f}{:>12}{:>14.1f}'.format(
+                transport_name, reader_name, total / elapsed / 2**20, reads, allocated / 2**20))
+
+if __name__ == '__main__':
+    main()
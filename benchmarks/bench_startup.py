@@ -0,0 +1,50 @@
+""" Measure the cost of importing ioctl and making the first ioctl() call in a fresh process.
+
+Every measurement runs in a new interpreter, so that nothing is cached between runs.
+Run from the source directory with ``python -m benchmarks.bench_startup``.
+"""
+import os
+import subprocess
+import sys
+
+_code = '''
+import time
+t0 = time.perf_counter()
+import ctypes, os
+import ioctl
+import ioctl.linux
+t1 = time.perf_counter()
+rfd, wfd = os.pipe()
+ioctl.ioctl(rfd, 0x541B, ctypes.byref(ctypes.c_int()))
+t2 = time.perf_counter()
+print(t1 - t0, t2 - t1)
+'''
+
+_find_library_code = '''
+import time
+t0 = time.perf_counter()
+import ctypes.util
+ctypes.util.find_library('c')
+print(time.perf_counter() - t0, 0.0)
+'''
+
+def _run(code, runs, env=None):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = []
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, '-c', code], cwd=root, env=env)
+        results.append([ float(v) for v in output.split() ])
+    return min(r[0] for r in results), min(r[1] for r in results)
+
+def main(runs=10):
+    import_time, call_time = _run(_code, runs)
+    print('import ioctl, ioctl.linux    {ms:8.2f} ms'.format(ms=import_time * 1e3))
+    print('first ioctl() call           {ms:8.2f} ms'.format(ms=call_time * 1e3))
+    import_time, call_time = _run(_code, runs, env=dict(os.environ, IOCTL_EAGER='1'))
+    print('import with IOCTL_EAGER=1    {ms:8.2f} ms'.format(ms=import_time * 1e3))
+    print('first call with IOCTL_EAGER  {ms:8.2f} ms'.format(ms=call_time * 1e3))
+    find_time, _ = _run(_find_library_code, runs)
+    print('ctypes.util.find_library(c)  {ms:8.2f} ms (for reference)'.format(ms=find_time * 1e3))
+
+if __name__ == '__main__':
+    main()
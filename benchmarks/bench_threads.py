@@ -0,0 +1,79 @@
+""" Report how ioctl() calls scale with the number of threads.
+
+Each thread calls FIONREAD on its own pipe for a fixed time, and the table shows the
+total number of calls per second for each way of making the call. With the GIL, the
+total stays roughly flat as threads are added. On a free-threaded build of CPython
+(3.13t and later) it should grow with the number of cores.
+Run from the source directory with ``python -m benchmarks.bench_threads``.
+"""
+import ctypes
+import os
+import sys
+import threading
+import time
+
+import ioctl
+
+FIONREAD = 0x541B
+
+def _calls(name):
+    if name == 'ioctl.ioctl':
+        def make():
+            value = ctypes.c_int()
+            ref = ctypes.byref(value)
+            return lambda fd: ioctl.ioctl(fd, FIONREAD, ref)
+    elif name == 'ioctl_fn_ptr_r':
+        fn = ioctl.ioctl_fn_ptr_r(FIONREAD, ctypes.c_int, scratch=True)
+        def make():
+            return fn
+    else:
+        call = ioctl.compile(FIONREAD, ctypes.c_int, 'r', scratch=True)
+        def make():
+            return call
+    return make
+
+def _run(make, threads, duration):
+    counts = [0] * threads
+    barrier = threading.Barrier(threads + 1)
+    stop = threading.Event()
+
+    def worker(index):
+        rfd, wfd = os.pipe()
+        os.write(wfd, b'x')
+        fn = make()
+        barrier.wait()
+        count = 0
+        while not stop.is_set():
+            for n in range(100):
+                fn(rfd)
+            count += 100
+        counts[index] = count
+        os.close(rfd)
+        os.close(wfd)
+
+    workers = [ threading.Thread(target=worker, args=(index,)) for index in range(threads) ]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    time.sleep(duration)
+    stop.set()
+    for thread in workers:
+        thread.join()
+    return sum(counts) / (time.perf_counter() - start)
+
+def main(duration=0.5):
+    gil = getattr(sys, '_is_gil_enabled', lambda: True)()
+    print('Python {}, GIL {}, {} CPUs'.format(sys.version.split()[0], 'enabled' if gil else 'disabled', os.cpu_count()))
+    ioctl.warm_up()
+    thread_counts = [ n for n in (1, 2, 4, 8, 16) if n <= max(os.cpu_count() or 1, 2) ]
+    print('{:<18}'.format('call') + ''.join('{:>12}'.format('{} thr'.format(n)) for n in thread_counts) + '   (kcalls/s)')
+    for name in ('ioctl.ioctl', 'ioctl_fn_ptr_r', 'compile'):
+        make = _calls(name)
+        row = '{:<18}'.format(name)
+        for threads in thread_counts:
+            row += '{:>12.0f}'.format(_run(make, threads, duration) / 1000)
+        print(row)
+
+if __name__ == '__main__':
+    main()
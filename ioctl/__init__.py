@@ -1,47 +1,149 @@
 import ctypes
-import ctypes.util
+import errno
 import os
-
+import threading
+
+from . import _libc
+from . import backends as _backends
+from ._buffers import (
+    VarBuffer,
+    get_buffer as _get_buffer,
+    set_buffer as _set_buffer,
+)
+from ._compiled import (
+    IoctlCall,
+    compile,
+)
+from ._many import (
+    IoctlManyResult,
+    ioctl_many,
+)
 from ._paramcheck import (
     check_ctypes_datatype,
     check_fd,
     check_request,
+    check_result_options,
 )
 
 __all__ = (
+    'IoctlCall',
+    'IoctlManyResult',
+    'VarBuffer',
+    'compile',
     'ioctl',
     'ioctl_fn_ptr_r',
+    'ioctl_fn_ptr_var',
     'ioctl_fn_ptr_w',
     'ioctl_fn_ptr_wr',
     'ioctl_fn_w',
+    'ioctl_many',
+    'set_libc',
+    'warm_up',
 )
 
 _ioctl_fn = None
+_ioctl_fn_lock = threading.Lock()
+
 def _get_ioctl_fn():
     global _ioctl_fn
-    if _ioctl_fn is not None:
+    fn = _ioctl_fn
+    if fn is not None:
+        return fn
+    # Only the first calls take the lock. After that, the function is read without locking.
+    with _ioctl_fn_lock:
+        if _ioctl_fn is None:
+            _ioctl_fn = _libc.get_libc().ioctl
         return _ioctl_fn
-    libc_name = ctypes.util.find_library('c')
-    if not libc_name:
-        raise Exception('Unable to find c library')
-    libc = ctypes.CDLL(libc_name, use_errno=True)
-    _ioctl_fn = libc.ioctl
-    return _ioctl_fn
-
-def ioctl(fd, request, *args):
+
+def set_libc(libc):
+    """ Override the C library used for ioctl() calls.
+
+    By default the C library is resolved automatically the first time it is needed.
+    The C library can also be selected with the ``IOCTL_LIBC`` environment variable.
+
+    Calls that have already been compiled with :func:`compile` keep using the C library they were compiled with.
+
+    :param libc: A :class:`ctypes.CDLL` instance created with ``use_errno=True``, the name or path of a library,
+                 or None to resolve the C library automatically again.
+    """
+
+    global _ioctl_fn
+    with _ioctl_fn_lock:
+        _libc.set_libc(libc)
+        _ioctl_fn = None
+    _backends._reset_libc()
+
+def warm_up():
+    """ Resolve the C library and the ioctl() function immediately.
+
+    This moves the cost of loading the C library from the first ioctl() call to the
+    time of this call. Setting the ``IOCTL_EAGER`` environment variable to a non-empty
+    value does the same when this module is imported.
+    """
+
+    try:
+        _get_ioctl_fn()
+    except Exception as e:
+        raise NotImplementedError('Unable to get ioctl()-function from C library: {err}'.format(err=str(e)))
+
+def ioctl(fd, request, *args, **kwargs):
     """ Call the C library ioctl()-function directly.
 
     This function invokes ioctl() through ctypes. This gives
     greater control over the parameters passed to ioctl().
 
+    If a backend has been pinned with :func:`ioctl.backends.set_backend`, the call is
+    passed to that backend instead. Backends take at most one argument, so calls with more
+    arguments, or with an argument that the backend does not support, always call the C
+    library ioctl()-function directly.
+
+    By default a failed call raises an :class:`OSError`. With ``check=False`` the error is
+    returned as a value instead, which avoids the cost of creating and catching an exception
+    for errors that are expected, such as ``EAGAIN``.
+
     :param fd: File descriptor to operate on.
     :param request: The ioctl request to call.
     :param args: parameter to pass to ioctl.
+    :param check: Keyword argument. Whether to raise an :class:`OSError` if the call fails. If False, a tuple
+                  ``(result, errno)`` is returned, where errno is 0 if the call succeeded, and result is None if it failed.
+    :param retry_eintr: Keyword argument. Whether to repeat the call if it fails with ``EINTR``. True retries until the
+                        call is not interrupted, and a number is the maximum number of seconds to keep retrying.
     :return: The return value of the ioctl-call.
+
+    :Example:
+      ::
+
+          import errno
+          import ioctl
+          res, err = ioctl.ioctl(fd, request, check=False, retry_eintr=1.0)
+          if err == errno.EAGAIN:
+              pass # Try again later.
     """
 
+    check = kwargs.pop('check', True)
+    retry_eintr = kwargs.pop('retry_eintr', False)
+    if kwargs:
+        raise TypeError('Unexpected keyword arguments: {}'.format(', '.join(sorted(kwargs))))
     check_fd(fd)
     check_request(request)
+    if check is not True or retry_eintr is not False:
+        check_result_options(check, retry_eintr)
+
+    backend = _backends._pinned if len(args) <= 1 else None
+    if backend is not None:
+        try:
+            kind, datatype, arg = _backends._unwrap_arg(args[0] if args else None)
+        except TypeError:
+            kind = None
+        if kind is None or not backend.supports(kind, datatype):
+            # The backend cannot pass this argument. Call the C library directly, as if no backend was pinned.
+            backend = None
+    if backend is not None:
+        res = backend.ioctl(fd, request, arg)
+        if res < 0:
+            return _failed(backend.ioctl, (fd, request, arg), backend.errno, res, check, retry_eintr)
+        return res if check else (res, 0)
+
     ioctl_args = [ ctypes.c_int(fd), ctypes.c_ulong(request)] + list(args)
 
     try:
@@ -51,11 +153,31 @@ def ioctl(fd, request, *args):
 
     res = ioctl_fn(*ioctl_args)
     if res < 0:
-        err = ctypes.get_errno()
-        raise OSError(err, os.strerror(err))
-    return res
-
-def ioctl_fn_ptr_r(request, datatype, return_python=None):
+        return _failed(ioctl_fn, ioctl_args, _ctypes_errno, res, check, retry_eintr)
+    return res if check else (res, 0)
+
+def _ctypes_errno(res):
+    return ctypes.get_errno()
+
+def _failed(fn, args, errno_fn, res, check, retry_eintr):
+    err = errno_fn(res)
+    if err == errno.EINTR and retry_eintr is not False:
+        res, err = _backends._retry_eintr(fn, args, errno_fn, retry_eintr)
+        if not err:
+            return res if check else (res, 0)
+    if check:
+        raise _backends._oserror(err)
+    return None, err
+
+def _result_options(check, retry_eintr):
+    """ Get the keyword arguments that helper functions pass to :func:`ioctl`. """
+
+    check_result_options(check, retry_eintr)
+    if check and retry_eintr is False:
+        return {}
+    return { 'check': check, 'retry_eintr': retry_eintr }
+
+def ioctl_fn_ptr_r(request, datatype, return_python=None, scratch=False, check=True, retry_eintr=False):
     """ Create a helper function for invoking a ioctl() read call.
 
     This function creates a helper function for creating a ioctl() read function.
@@ -64,9 +186,18 @@ def ioctl_fn_ptr_r(request, datatype, return_python=None):
 
     If the datatype is a integer type (int, long, etc), it will be returned as a python int or long.
 
+    The returned function accepts an optional ``into`` parameter. This can be an instance of the datatype,
+    or a writable buffer such as a :class:`bytearray`, :class:`memoryview` or :class:`mmap.mmap`.
+    The ioctl() then operates directly on that memory, without allocating or copying data.
+
     :param request: The ioctl request to call.
     :param datatype: The data type of the data returned by the ioctl() call.
     :param return_python: Whether we should attempt to convert the return data to a Python value. Defaults to True for fundamental ctypes data types.
+    :param scratch: Whether to reuse a per-thread scratch buffer instead of allocating new data for each call.
+                    The returned data is then only valid until the next call with the same datatype in the same thread.
+    :param check: Whether the returned function raises an :class:`OSError` if the call fails. If False, it returns
+                  a tuple ``(result, errno)`` instead, where errno is 0 if the call succeeded, and result is None if it failed.
+    :param retry_eintr: Whether to repeat the call if it fails with ``EINTR``, as for :func:`ioctl`.
     :return: A function for invoking the specified ioctl().
 
     :Example:
@@ -86,22 +217,27 @@ def ioctl_fn_ptr_r(request, datatype, return_python=None):
     check_ctypes_datatype(datatype)
     if return_python is not None and not isinstance(return_python, bool):
         raise TypeError('return_python must be None or a boolean, but was {}'.format(return_python.__class__.__name__))
-
+    if not isinstance(scratch, bool):
+        raise TypeError('scratch must be a boolean, but was {}'.format(scratch.__class__.__name__))
+    options = _result_options(check, retry_eintr)
 
     if return_python is None:
         return_python = issubclass(datatype, ctypes._SimpleCData)
 
-    def fn(fd):
+    def fn(fd, into=None):
         check_fd(fd)
-        value = datatype()
-        ioctl(fd, request, ctypes.byref(value))
+        value = _get_buffer(datatype, into, scratch)
+        res = ioctl(fd, request, ctypes.byref(value), **options)
+        if not check and res[1]:
+            return None, res[1]
         if return_python:
-            return value.value
-        else:
-            return value
+            value = value.value
+        if not check:
+            return value, 0
+        return value
     return fn
 
-def ioctl_fn_ptr_w(request, datatype):
+def ioctl_fn_ptr_w(request, datatype, check=True, retry_eintr=False):
     """ Create a helper function for invoking a ioctl() write call.
 
     This function creates a helper function for creating a ioctl() write function that uses a pointer argument.
@@ -112,6 +248,9 @@ def ioctl_fn_ptr_w(request, datatype):
 
     :param request: The ioctl request to call.
     :param datatype: The data type of the data to be passed to the ioctl() call.
+    :param check: Whether the returned function raises an :class:`OSError` if the call fails. If False, it returns
+                  a tuple ``(result, errno)`` instead, where errno is 0 if the call succeeded, and result is None if it failed.
+    :param retry_eintr: Whether to repeat the call if it fails with ``EINTR``, as for :func:`ioctl`.
     :return: A function for invoking the specified ioctl().
 
     :Example:
@@ -129,14 +268,18 @@ def ioctl_fn_ptr_w(request, datatype):
 
     check_request(request)
     check_ctypes_datatype(datatype)
+    options = _result_options(check, retry_eintr)
 
     def fn(fd, value):
         check_fd(fd)
-        value = datatype(value)
-        ioctl(fd, request, ctypes.byref(value))
+        if not isinstance(value, datatype):
+            value = datatype(value)
+        res = ioctl(fd, request, ctypes.byref(value), **options)
+        if not check:
+            return None, res[1]
     return fn
 
-def ioctl_fn_ptr_wr(request, datatype, return_python=None):
+def ioctl_fn_ptr_wr(request, datatype, return_python=None, scratch=False, check=True, retry_eintr=False):
     """ Create a helper function for invoking a ioctl() read & write call.
 
     This function creates a helper function for a ioctl() operation that both reads and writes data.
@@ -147,9 +290,17 @@ def ioctl_fn_ptr_wr(request, datatype, return_python=None):
       ioctl(fd, WDIOF_SETTIMEOUT, &timeout);
       printf("Actual timeout: %d\n", timeout);
 
+    The returned function accepts an optional ``into`` parameter, like the function returned by :func:`ioctl_fn_ptr_r`.
+    If ``into`` is specified, the value can be omitted, and the current contents of ``into`` are passed to the ioctl().
+
     :param request: The ioctl request to call.
     :param datatype: The data type of the data to be passed to the ioctl() call.
     :param return_python: Whether we should attempt to convert the return data to a Python value. Defaults to True for fundamental ctypes data types.
+    :param scratch: Whether to reuse a per-thread scratch buffer instead of allocating new data for each call.
+                    The returned data is then only valid until the next call with the same datatype in the same thread.
+    :param check: Whether the returned function raises an :class:`OSError` if the call fails. If False, it returns
+                  a tuple ``(result, errno)`` instead, where errno is 0 if the call succeeded, and result is None if it failed.
+    :param retry_eintr: Whether to repeat the call if it fails with ``EINTR``, as for :func:`ioctl`.
     :return: A function for invoking the specified ioctl().
 
     :Example:
@@ -168,21 +319,78 @@ def ioctl_fn_ptr_wr(request, datatype, return_python=None):
     check_ctypes_datatype(datatype)
     if return_python is not None and not isinstance(return_python, bool):
         raise TypeError('return_python must be None or a boolean, but was {}'.format(return_python.__class__.__name__))
+    if not isinstance(scratch, bool):
+        raise TypeError('scratch must be a boolean, but was {}'.format(scratch.__class__.__name__))
+    options = _result_options(check, retry_eintr)
 
     if return_python is None:
         return_python = issubclass(datatype, ctypes._SimpleCData)
 
-    def fn(fd, value):
+    def fn(fd, value=None, into=None):
         check_fd(fd)
-        value = datatype(value)
-        ioctl(fd, request, ctypes.byref(value))
-        if return_python:
-            return value.value
+        if into is None and not scratch:
+            value = datatype(value)
         else:
-            return value
+            data = _get_buffer(datatype, into, scratch)
+            if value is not None:
+                _set_buffer(data, value)
+            elif into is None:
+                raise TypeError('value must be specified when into is not specified')
+            value = data
+        res = ioctl(fd, request, ctypes.byref(value), **options)
+        if not check and res[1]:
+            return None, res[1]
+        if return_python:
+            value = value.value
+        if not check:
+            return value, 0
+        return value
     return fn
 
-def ioctl_fn_w(request, datatype):
+def ioctl_fn_ptr_var(request, header_type, item_type, check=True, retry_eintr=False):
+    """ Create a helper function for invoking a ioctl() call with variable-length data.
+
+    This function creates a helper function for a ioctl() operation that takes a pointer to a
+    structure followed by a variable-length array, such as ``FS_IOC_FIEMAP``. The data is kept
+    in a :class:`VarBuffer`, which is updated in place by the call.
+
+    :param request: The ioctl request to call.
+    :param header_type: The data type of the structure before the array.
+    :param item_type: The data type of the array items.
+    :param check: Whether the returned function raises an :class:`OSError` if the call fails. If False, it returns
+                  a tuple ``(result, errno)`` instead, where errno is 0 if the call succeeded, and result is None if it failed.
+    :param retry_eintr: Whether to repeat the call if it fails with ``EINTR``, as for :func:`ioctl`.
+    :return: A function ``fn(fd, buf)`` for invoking the specified ioctl(), returning the return value of the ioctl-call.
+             ``buf`` must be a :class:`VarBuffer` for the same data types.
+
+    :Example:
+      ::
+
+          import ioctl
+          import ioctl.fiemap
+          fiemap = ioctl.ioctl_fn_ptr_var(ioctl.fiemap.FS_IOC_FIEMAP, ioctl.fiemap.Fiemap, ioctl.fiemap.FiemapExtent)
+          buf = ioctl.VarBuffer(ioctl.fiemap.Fiemap, ioctl.fiemap.FiemapExtent, 32)
+          buf.header.fm_length = ioctl.fiemap.FIEMAP_MAX_OFFSET
+          buf.header.fm_extent_count = buf.capacity
+          fiemap(fd, buf)
+          extents = buf.items[:buf.header.fm_mapped_extents]
+    """
+
+    check_request(request)
+    check_ctypes_datatype(header_type)
+    check_ctypes_datatype(item_type)
+    options = _result_options(check, retry_eintr)
+
+    def fn(fd, buf):
+        check_fd(fd)
+        if not isinstance(buf, VarBuffer) or buf.header_type is not header_type or buf.item_type is not item_type:
+            raise TypeError('buf must be a VarBuffer for {} and {}'.format(header_type.__name__, item_type.__name__))
+        # Pass the whole buffer, not just the header. Backends such as fcntl.ioctl() only
+        # make the memory of the argument available to the kernel.
+        return ioctl(fd, request, ctypes.byref(buf.raw), **options)
+    return fn
+
+def ioctl_fn_w(request, datatype, check=True, retry_eintr=False):
     """ Create a helper function for invoking a ioctl() write call.
 
     This function creates a helper function for creating a ioctl() write function that directly passes a single argument.
@@ -193,6 +401,9 @@ def ioctl_fn_w(request, datatype):
 
     :param request: The ioctl request to call.
     :param datatype: The data type of the data to be passed to the ioctl() call.
+    :param check: Whether the returned function raises an :class:`OSError` if the call fails. If False, it returns
+                  a tuple ``(result, errno)`` instead, where errno is 0 if the call succeeded, and result is None if it failed.
+    :param retry_eintr: Whether to repeat the call if it fails with ``EINTR``, as for :func:`ioctl`.
     :return: A function for invoking the specified ioctl().
 
     :Example:
@@ -210,9 +421,15 @@ def ioctl_fn_w(request, datatype):
 
     check_request(request)
     check_ctypes_datatype(datatype)
+    options = _result_options(check, retry_eintr)
 
     def fn(fd, value):
         check_fd(fd)
         value = datatype(value)
-        ioctl(fd, request, value)
+        res = ioctl(fd, request, value, **options)
+        if not check:
+            return None, res[1]
     return fn
+
+if os.environ.get('IOCTL_EAGER'):
+    warm_up()
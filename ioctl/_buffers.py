@@ -0,0 +1,147 @@
+import ctypes
+import threading
+
+class ScratchPool(object):
+    """ A per-thread pool of reusable ctypes data buffers.
+
+    Each thread gets its own buffer for each datatype, so the buffers can be reused
+    without any locking. A buffer returned by :meth:`get` is reused by the next call
+    for the same datatype in the same thread.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def get(self, datatype):
+        """ Get the zero-filled scratch buffer for a datatype in the current thread.
+
+        :param datatype: The ctypes data type of the buffer.
+        :return: An instance of the datatype.
+        """
+
+        try:
+            buffers = self._local.buffers
+        except AttributeError:
+            buffers = self._local.buffers = {}
+        value = buffers.get(datatype)
+        if value is None:
+            value = buffers[datatype] = datatype()
+        else:
+            ctypes.memset(ctypes.byref(value), 0, ctypes.sizeof(value))
+        return value
+
+    def clear(self):
+        """ Release the scratch buffers of the current thread. """
+
+        self._local.buffers = {}
+
+scratch_pool = ScratchPool()
+
+def get_buffer(datatype, into=None, scratch=False):
+    """ Get the data buffer for a single ioctl() call.
+
+    :param datatype: The ctypes data type of the data.
+    :param into: Caller-supplied memory to operate on in place, or None.
+                 This can be an instance of the datatype, or any writable buffer, such as a
+                 :class:`bytearray`, :class:`memoryview` or :class:`mmap.mmap`.
+    :param scratch: Whether to use the per-thread scratch buffer when ``into`` is None.
+    :return: An instance of the datatype.
+    """
+
+    if into is not None:
+        if isinstance(into, datatype):
+            return into
+        return datatype.from_buffer(into)
+    if scratch:
+        return scratch_pool.get(datatype)
+    return datatype()
+
+def set_buffer(data, value):
+    """ Store a value in a data buffer.
+
+    :param data: The ctypes instance to update.
+    :param value: The new value. Either a Python value or an instance of the same ctypes data type.
+    """
+
+    datatype = type(data)
+    if isinstance(data, ctypes._SimpleCData) and not isinstance(value, ctypes._SimpleCData):
+        data.value = value
+        return
+    if not isinstance(value, datatype):
+        value = datatype(value)
+    ctypes.memmove(ctypes.byref(data), ctypes.byref(value), ctypes.sizeof(data))
+
+class VarBuffer(object):
+    """ A growable buffer for a structure followed by a variable-length array.
+
+    Many ioctl() calls take a fixed header followed by a flexible array member, e.g.::
+
+      struct fiemap {
+          ...
+          struct fiemap_extent fm_extents[];
+      };
+
+    The buffer holds the header and room for ``capacity`` items directly after it. The
+    memory is reused between calls, and only reallocated when :meth:`reserve` needs more room.
+
+    :param header_type: The ctypes data type of the header.
+    :param item_type: The ctypes data type of the array items.
+    :param capacity: The initial number of items to make room for.
+
+    :ivar header: The header, as an instance of ``header_type``.
+    :ivar items: The items, as a ctypes array of ``item_type`` with ``capacity`` items.
+    :ivar raw: The whole memory, header and items, as a ctypes array of :class:`ctypes.c_char`.
+               This is what is passed to ioctl(), so that backends see the items as well as the header.
+    """
+
+    def __init__(self, header_type, item_type, capacity=0):
+        if not isinstance(capacity, int):
+            raise TypeError('capacity must be an integer, but was {}'.format(capacity.__class__.__name__))
+        if capacity < 0:
+            raise ValueError('capacity cannot be negative')
+        self.header_type = header_type
+        self.item_type = item_type
+        self.header_size = ctypes.sizeof(header_type)
+        self.item_size = ctypes.sizeof(item_type)
+        self.capacity = 0
+        self.data = None
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        data = bytearray(self.header_size + capacity * self.item_size)
+        if self.data is not None:
+            data[:self.header_size] = self.data[:self.header_size]
+        # Release the views of the old memory before the memory itself.
+        self.header = self.items = self.raw = None
+        self.data = data
+        self.capacity = capacity
+        self.header = self.header_type.from_buffer(data)
+        self.items = (self.item_type * capacity).from_buffer(data, self.header_size)
+        self.raw = (ctypes.c_char * len(data)).from_buffer(data)
+
+    def reserve(self, capacity):
+        """ Make room for at least the given number of items.
+
+        The buffer grows geometrically, so repeated small increases are cheap. The
+        header is preserved, but the items are not. Views returned by :meth:`item_bytes`
+        and references to :attr:`header` and :attr:`items` from before the call refer to the old memory.
+
+        :param capacity: The number of items needed.
+        """
+
+        if capacity > self.capacity:
+            self._allocate(max(capacity, 2 * self.capacity))
+
+    def item_bytes(self, count=None):
+        """ Get the raw memory of the first items.
+
+        :param count: The number of items, or None for all items.
+        :return: A :class:`memoryview` of the memory of the items.
+        """
+
+        if count is None:
+            count = self.capacity
+        if count > self.capacity:
+            raise ValueError('count cannot be larger than the capacity')
+        start = self.header_size
+        return memoryview(self.data)[start:start + count * self.item_size]
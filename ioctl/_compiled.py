@@ -0,0 +1,294 @@
+import ctypes
+import errno
+
+from . import backends as _backends
+from ._buffers import (
+    get_buffer,
+    set_buffer,
+)
+from ._paramcheck import (
+    check_ctypes_datatype,
+    check_request,
+    check_result_options,
+)
+
+class IoctlCall(object):
+    """ A precompiled ioctl() call.
+
+    Instances are created by :func:`compile`. All parameters are validated when the
+    call is compiled, and the call is bound to a backend function for its call shape
+    (see :mod:`ioctl.backends`). Calling the object only performs the work that cannot
+    be avoided: allocating the data (if any), calling ioctl() and checking the result.
+
+    Note that the file descriptor is not validated on each call. Invalid file
+    descriptors are reported by the C library as an :class:`OSError`.
+
+    If the call was compiled with ``check=False``, calling it returns a tuple
+    ``(result, errno)`` instead of raising an :class:`OSError`. The result is None
+    if the call failed, and errno is 0 if the call succeeded.
+
+    Calls can be pickled if their datatype can be pickled, i.e. if it is defined at module
+    level. Unpickling compiles the call again, so it is bound to a backend in the process
+    where it is unpickled. This makes it possible to send calls to worker processes, as
+    :mod:`ioctl.fleet` does.
+    """
+
+    __slots__ = (
+        'request',
+        'datatype',
+        'direction',
+        'pointer',
+        'return_python',
+        'scratch',
+        'check',
+        'retry_eintr',
+        '_bound',
+        '__weakref__',
+    )
+
+    _kind = None
+
+    def __init__(self, request, datatype, direction, pointer, return_python, scratch, backend, check=True, retry_eintr=False):
+        self.request = request
+        self.datatype = datatype
+        self.direction = direction
+        self.pointer = pointer
+        self.return_python = return_python
+        self.scratch = scratch
+        self.check = check
+        self.retry_eintr = retry_eintr
+        self._bind(backend)
+
+    def _bind(self, backend):
+        # The backend and its function are replaced together, so that a call never decodes
+        # the result of one backend with the errno() of another.
+        self._bound = (backend, backend.bind(self._kind, self.datatype))
+
+    @property
+    def backend(self):
+        """ The :class:`ioctl.backends.Backend` the call is bound to. """
+
+        return self._bound[0]
+
+    def _failed(self, backend, fn, fd, arg, res):
+        """ Handle a failed call.
+
+        Retries the call if it was interrupted and retrying is enabled, and raises an
+        :class:`OSError` if it still fails, unless the call does not check for errors.
+
+        :return: A tuple ``(res, err)``, where err is 0 if a retried call succeeded.
+        """
+
+        err = backend.errno(res)
+        if err == errno.EINTR and self.retry_eintr is not False:
+            res, err = _backends._retry_eintr(fn, (fd, self.request, arg), backend.errno, self.retry_eintr)
+        if err and self.check:
+            raise _backends._oserror(err)
+        return res, err
+
+    def __reduce__(self):
+        backend = self.backend
+        if self in _backends._auto_calls:
+            backend = None
+        elif _backends._backends.get(backend.name) is backend:
+            backend = backend.name
+        return (compile, (
+            self.request,
+            self.datatype,
+            self.direction,
+            self.pointer,
+            self.return_python,
+            self.scratch,
+            backend,
+            self.check,
+            self.retry_eintr,
+        ))
+
+    def __repr__(self):
+        return '{cls}(request=0x{request:08x}, datatype={datatype}, direction={direction!r}, pointer={pointer!r})'.format(
+            cls=self.__class__.__name__,
+            request=self.request,
+            datatype=self.datatype.__name__ if self.datatype is not None else None,
+            direction=self.direction,
+            pointer=self.pointer,
+            )
+
+class _IoctlCallNone(IoctlCall):
+    __slots__ = ()
+    _kind = 'none'
+
+    def __call__(self, fd):
+        backend, fn = self._bound
+        res = fn(fd, self.request, None)
+        err = 0
+        if res < 0:
+            res, err = self._failed(backend, fn, fd, None, res)
+            if err:
+                return None, err
+        if self.check:
+            return res
+        return res, err
+
+class _IoctlCallValue(IoctlCall):
+    __slots__ = ()
+    _kind = 'value'
+
+    def __call__(self, fd, value):
+        if isinstance(value, ctypes._SimpleCData):
+            # Backends take integer arguments. fcntl.ioctl() would pass a ctypes instance as a buffer.
+            value = value.value
+        backend, fn = self._bound
+        res = fn(fd, self.request, value)
+        err = 0
+        if res < 0:
+            res, err = self._failed(backend, fn, fd, value, res)
+            if err:
+                return None, err
+        if self.check:
+            return res
+        return res, err
+
+class _IoctlCallR(IoctlCall):
+    __slots__ = ()
+    _kind = 'pointer'
+
+    def __call__(self, fd, into=None):
+        if into is None and not self.scratch:
+            value = self.datatype()
+        else:
+            value = get_buffer(self.datatype, into, self.scratch)
+        backend, fn = self._bound
+        res = fn(fd, self.request, value)
+        if res < 0:
+            err = self._failed(backend, fn, fd, value, res)[1]
+            if err:
+                return None, err
+        if self.return_python:
+            value = value.value
+        if self.check:
+            return value
+        return value, 0
+
+class _IoctlCallW(IoctlCall):
+    __slots__ = ()
+    _kind = 'pointer'
+
+    def __call__(self, fd, value):
+        if not isinstance(value, self.datatype):
+            value = self.datatype(value)
+        backend, fn = self._bound
+        res = fn(fd, self.request, value)
+        err = 0
+        if res < 0:
+            err = self._failed(backend, fn, fd, value, res)[1]
+        if not self.check:
+            return None, err
+
+class _IoctlCallWR(IoctlCall):
+    __slots__ = ()
+    _kind = 'pointer'
+
+    def __call__(self, fd, value=None, into=None):
+        if into is None and not self.scratch:
+            value = self.datatype(value)
+        else:
+            data = get_buffer(self.datatype, into, self.scratch)
+            if value is not None:
+                set_buffer(data, value)
+            elif into is None:
+                raise TypeError('value must be specified when into is not specified')
+            value = data
+        backend, fn = self._bound
+        res = fn(fd, self.request, value)
+        if res < 0:
+            err = self._failed(backend, fn, fd, value, res)[1]
+            if err:
+                return None, err
+        if self.return_python:
+            value = value.value
+        if self.check:
+            return value
+        return value, 0
+
+_pointer_call_classes = {
+    'r': _IoctlCallR,
+    'w': _IoctlCallW,
+    'rw': _IoctlCallWR,
+}
+
+def compile(request, datatype=None, direction=None, pointer=True, return_python=None, scratch=False, backend=None, check=True, retry_eintr=False):
+    """ Compile a ioctl() call into a reusable call object.
+
+    This performs all parameter validation once, and returns an :class:`IoctlCall`
+    object that can be called repeatedly with very little overhead. The shape of the
+    returned call depends on the parameters:
+
+    * ``datatype=None``: ``call(fd)`` passes no data, and returns the ioctl() return value.
+    * ``direction='r'``: ``call(fd)`` is equivalent to :func:`ioctl_fn_ptr_r`.
+    * ``direction='w'``: ``call(fd, value)`` is equivalent to :func:`ioctl_fn_ptr_w`.
+    * ``direction='rw'``: ``call(fd, value)`` is equivalent to :func:`ioctl_fn_ptr_wr`.
+    * ``direction='w', pointer=False``: ``call(fd, value)`` is equivalent to :func:`ioctl_fn_w`,
+      but returns the ioctl() return value.
+
+    Read and read/write calls accept the same ``into`` parameter as the functions returned by
+    :func:`ioctl_fn_ptr_r` and :func:`ioctl_fn_ptr_wr`.
+
+    :param request: The ioctl request to call.
+    :param datatype: The data type of the data passed to the ioctl() call, or None if no data is passed.
+    :param direction: Direction of data transfer. One of ``None``, ``'r'``, ``'w'`` or ``'rw'``.
+    :param pointer: Whether the data is passed as a pointer. If False, the value is passed directly.
+    :param return_python: Whether we should attempt to convert the return data to a Python value. Defaults to True for fundamental ctypes data types.
+    :param scratch: Whether read and read/write calls reuse a per-thread scratch buffer instead of allocating new data for each call.
+    :param backend: The backend to use for the call, as a :class:`ioctl.backends.Backend` instance or a backend name.
+                    Defaults to the backend pinned with :func:`ioctl.backends.set_backend`, or else the fastest backend for the call shape.
+    :param check: Whether the call raises an :class:`OSError` if it fails. If False, the call returns a tuple ``(result, errno)``.
+    :param retry_eintr: Whether to repeat the call if it fails with ``EINTR``, as for :func:`ioctl`.
+    :return: An :class:`IoctlCall` instance.
+
+    :Example:
+      ::
+
+          import ctypes
+          import os
+          import ioctl
+          import ioctl.linux
+          RNDGETENTCNT = ioctl.linux.IOR('R', 0x00, ctypes.c_int)
+          rndgetentcnt = ioctl.compile(RNDGETENTCNT, ctypes.c_int, 'r')
+          fd = os.open('/dev/random', os.O_RDONLY)
+          entropy_avail = rndgetentcnt(fd)
+    """
+
+    check_request(request)
+    if direction not in (None, 'r', 'w', 'rw'):
+        raise ValueError('direction must be None, \'r\', \'w\' or \'rw\'.')
+    if not isinstance(pointer, bool):
+        raise TypeError('pointer must be a boolean, but was {}'.format(pointer.__class__.__name__))
+    if return_python is not None and not isinstance(return_python, bool):
+        raise TypeError('return_python must be None or a boolean, but was {}'.format(return_python.__class__.__name__))
+    if not isinstance(scratch, bool):
+        raise TypeError('scratch must be a boolean, but was {}'.format(scratch.__class__.__name__))
+    check_result_options(check, retry_eintr)
+
+    if datatype is None:
+        if direction is not None:
+            raise ValueError('datatype must be specified when direction is not None.')
+        cls = _IoctlCallNone
+    else:
+        check_ctypes_datatype(datatype)
+        if direction is None:
+            raise ValueError('direction must be specified when datatype is not None.')
+        if pointer:
+            cls = _pointer_call_classes[direction]
+        else:
+            if direction != 'w':
+                raise ValueError('Only direction \'w\' is supported when pointer is False.')
+            cls = _IoctlCallValue
+
+    if return_python is None:
+        return_python = datatype is not None and issubclass(datatype, ctypes._SimpleCData)
+
+    selected = _backends.select_backend(cls._kind, datatype, backend)
+    call = cls(request, datatype, direction, pointer, return_python, scratch, selected, check, retry_eintr)
+    if backend is None:
+        _backends._register_auto_call(call)
+    return call
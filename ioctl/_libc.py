@@ -0,0 +1,96 @@
+import ctypes
+import os
+import threading
+
+LIBC_ENV = 'IOCTL_LIBC'
+
+# Well-known names of the C library, tried in order if the C library is not
+# already available through the main program.
+_libc_names = (
+    'libc.so.6',
+    'libc.so.7',
+    'libc.so',
+    'libc.dylib',
+    '/usr/lib/libc.dylib',
+)
+
+def _load(name):
+    libc = ctypes.CDLL(name, use_errno=True)
+    # Looking up the function raises AttributeError if the library does not provide it.
+    libc.ioctl
+    return libc
+
+def _find_libc():
+    name = os.environ.get(LIBC_ENV)
+    if name:
+        return _load(name)
+
+    candidates = (None,) + _libc_names
+    for name in candidates:
+        try:
+            return _load(name)
+        except (OSError, AttributeError):
+            pass
+
+    # Last resort. This can spawn subprocesses (ldconfig, gcc, ...), so it is slow.
+    import ctypes.util
+    name = ctypes.util.find_library('c')
+    if not name:
+        raise Exception('Unable to find c library')
+    return _load(name)
+
+_libc = None
+_libc_lock = threading.Lock()
+
+def get_libc():
+    """ Load the C library.
+
+    The library is loaded once, and the same handle is returned on subsequent calls.
+    The C library is resolved without spawning any subprocesses in the common case:
+
+    1. The library named by the ``IOCTL_LIBC`` environment variable, if set.
+    2. The symbols already loaded into the process (``CDLL(None)``).
+    3. A list of well-known C library names.
+    4. :func:`ctypes.util.find_library`, as a last resort.
+
+    The library is loaded by a single thread, even if several threads need it at the same time.
+
+    :return: A :class:`ctypes.CDLL` instance for the C library.
+    """
+
+    global _libc
+    libc = _libc
+    if libc is not None:
+        return libc
+    with _libc_lock:
+        if _libc is None:
+            _libc = _find_libc()
+        return _libc
+
+def set_libc(libc):
+    """ Override the C library used for ioctl() calls.
+
+    :param libc: A :class:`ctypes.CDLL` instance, the name or path of a library, or None to resolve the C library automatically again.
+    """
+
+    global _libc
+    if isinstance(libc, str):
+        libc = _load(libc)
+    elif libc is not None and not isinstance(libc, ctypes.CDLL):
+        raise TypeError('libc must be None, a string or a ctypes.CDLL instance, but was {}'.format(libc.__class__.__name__))
+    with _libc_lock:
+        _libc = libc
+
+def bind_ioctl(argtype):
+    """ Create a dedicated foreign function pointer for ioctl().
+
+    Unlike the shared ``libc.ioctl`` attribute, the returned function has fixed
+    ``argtypes`` and ``restype``, so ctypes does not need to guess how to convert
+    the arguments on every call.
+
+    :param argtype: The ctypes type of the third argument to ioctl().
+    :return: A ctypes function pointer for ioctl(fd, request, arg).
+    """
+
+    prototype = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_int, ctypes.c_ulong, argtype, use_errno=True)
+    return prototype(('ioctl', get_libc()))
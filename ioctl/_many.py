@@ -0,0 +1,116 @@
+import array
+import collections
+import ctypes
+
+from . import _libc
+from . import backends as _backends
+from ._paramcheck import (
+    check_ctypes_datatype,
+    check_fd,
+    check_request,
+)
+
+class IoctlManyResult(collections.namedtuple('IoctlManyResult', ('values', 'errnos'))):
+    """ Result of :func:`ioctl_many`.
+
+    :ivar values: The data returned for each file descriptor.
+    :ivar errnos: The errno for each file descriptor, or 0 if the call succeeded.
+    """
+
+    __slots__ = ()
+
+def _values_column(values, datatype):
+    typecode = getattr(datatype, '_type_', None)
+    if isinstance(typecode, str) and typecode in array.typecodes:
+        if array.array(typecode).itemsize == ctypes.sizeof(datatype):
+            return array.array(typecode, bytes(values))
+    return values
+
+def ioctl_many(fds, request, datatype, numpy=False, out=None):
+    """ Invoke the same ioctl() read call on many file descriptors.
+
+    This is the batch version of :func:`ioctl_fn_ptr_r`. All parameters are validated once,
+    and the data for all file descriptors is placed in a single preallocated array. Failures
+    do not raise an exception, but are reported through the errno column of the result.
+
+    Values for fundamental ctypes data types are returned as an :class:`array.array`. Other
+    data types are returned as a ctypes array of the datatype. If ``numpy`` is True, both
+    columns are returned as NumPy arrays instead.
+
+    :param fds: A sequence of file descriptors. This can also be an :class:`array.array` or a NumPy array.
+    :param request: The ioctl request to call.
+    :param datatype: The data type of the data returned by the ioctl() call.
+    :param numpy: Whether to return the result columns as NumPy arrays. Cannot be combined with ``out``.
+    :param out: A tuple ``(values, errnos)`` of preallocated columns to fill, instead of allocating new ones.
+                Both must be writable buffers with room for one item per file descriptor, such as an
+                :class:`array.array` or a NumPy array. The values column holds items of the size of the
+                datatype, and the errnos column holds C ints. They are returned as they are in the result.
+    :return: A :class:`IoctlManyResult` with the ``values`` and ``errnos`` columns.
+
+    :Example:
+      ::
+
+          import ctypes
+          import os
+          import ioctl
+          FIONREAD = 0x541B
+          res = ioctl.ioctl_many(fds, FIONREAD, ctypes.c_int)
+          for fd, pending, err in zip(fds, res.values, res.errnos):
+              if not err:
+                  print(fd, pending)
+    """
+
+    check_request(request)
+    check_ctypes_datatype(datatype)
+    if not isinstance(numpy, bool):
+        raise TypeError('numpy must be a boolean, but was {}'.format(numpy.__class__.__name__))
+    if numpy and out is not None:
+        raise ValueError('numpy cannot be combined with out. The columns in out are returned as they are.')
+
+    if hasattr(fds, 'tolist'):
+        fds = fds.tolist()
+    for fd in fds:
+        check_fd(fd)
+    count = len(fds)
+
+    size = ctypes.sizeof(datatype)
+    if out is None:
+        values = (datatype * count)()
+        errnos = array.array('i', [0]) * count
+        errno_data = (ctypes.c_int * count).from_buffer(errnos)
+    else:
+        out_values, errnos = out
+        try:
+            values = (datatype * count).from_buffer(out_values)
+            errno_data = (ctypes.c_int * count).from_buffer(errnos)
+        except (TypeError, ValueError) as e:
+            raise ValueError('out must be a tuple of writable buffers with room for {} items: {}'.format(count, e))
+        ctypes.memset(values, 0, count * size)
+        ctypes.memset(errno_data, 0, count * ctypes.sizeof(ctypes.c_int))
+
+    backend = _backends._pinned
+    if backend is not None:
+        fn = backend.bind('pointer', datatype)
+        for index, fd in enumerate(fds):
+            res = fn(fd, request, datatype.from_buffer(values, index * size))
+            if res < 0:
+                errno_data[index] = backend.errno(res)
+    else:
+        try:
+            fn = _libc.bind_ioctl(ctypes.c_void_p)
+        except Exception as e:
+            raise NotImplementedError('Unable to get ioctl()-function from C library: {err}'.format(err=str(e)))
+        base = ctypes.addressof(values)
+        get_errno = ctypes.get_errno
+        index = 0
+        for fd, address in zip(fds, range(base, base + count * size, size)):
+            if fn(fd, request, address) < 0:
+                errno_data[index] = get_errno()
+            index += 1
+
+    if out is not None:
+        return IoctlManyResult(out_values, errnos)
+    if numpy:
+        import numpy as np
+        return IoctlManyResult(np.ctypeslib.as_array(values), np.array(errnos, dtype=np.intc))
+    return IoctlManyResult(_values_column(values, datatype), errnos)
@@ -26,6 +26,24 @@ def check_request(request):
     if request < 0:
         raise ValueError('request cannot be negative')
 
+def check_result_options(check, retry_eintr):
+    """ Validate the check and retry_eintr parameters.
+
+    Raises an exception if a parameter is invalid.
+
+    :param check: Whether failed calls raise an exception.
+    :param retry_eintr: False, True, or a number of seconds.
+    """
+
+    if not isinstance(check, bool):
+        raise TypeError('check must be a boolean, but was {}'.format(check.__class__.__name__))
+    if isinstance(retry_eintr, bool):
+        return
+    if not isinstance(retry_eintr, (int, float)):
+        raise TypeError('retry_eintr must be a boolean or a number, but was {}'.format(retry_eintr.__class__.__name__))
+    if retry_eintr < 0:
+        raise ValueError('retry_eintr cannot be negative')
+
 def check_ctypes_datatype(datatype):
     valid_datatypes = (
         ctypes._SimpleCData,
@@ -0,0 +1,170 @@
+""" asyncio versions of the ioctl functions.
+
+The functions in this module run ioctl() calls on a dedicated thread pool, so that they
+do not block the event loop. The thread pool is shared by all event loops, and its size
+can be set with :func:`set_max_workers`.
+
+All coroutines accept these keyword-only parameters:
+
+* ``timeout``: The maximum number of seconds to wait for the call. Raises :class:`asyncio.TimeoutError` if exceeded.
+* ``deadline``: An absolute deadline for the call, in the time of the event loop (:meth:`asyncio.loop.time`).
+* ``wait_readable``: Wait until the file descriptor is readable before calling ioctl(). This is useful for
+  event-driven devices, where the ioctl() should only be called once an event is pending.
+
+Cancelling a call, or exceeding its timeout, stops waiting for it. If the ioctl() call has already
+started on a worker thread, it still runs to completion, but its result is discarded.
+"""
+import asyncio
+import concurrent.futures
+import functools
+import threading
+
+import ioctl as _ioctl
+
+__all__ = (
+    'get_executor',
+    'ioctl',
+    'ioctl_fn_ptr_r',
+    'ioctl_fn_ptr_w',
+    'ioctl_fn_ptr_wr',
+    'ioctl_fn_w',
+    'run',
+    'set_max_workers',
+    'wrap',
+)
+
+DEFAULT_MAX_WORKERS = 32
+
+_executor = None
+_executor_lock = threading.Lock()
+_max_workers = DEFAULT_MAX_WORKERS
+
+def set_max_workers(max_workers):
+    """ Set the number of worker threads used for ioctl() calls.
+
+    If the thread pool has already been created, it is replaced by a new thread pool.
+    Calls that are already running on the old thread pool complete normally.
+
+    :param max_workers: The maximum number of worker threads.
+    """
+
+    global _executor, _max_workers
+    if not isinstance(max_workers, int):
+        raise TypeError('max_workers must be an integer, but was {}'.format(max_workers.__class__.__name__))
+    if max_workers < 1:
+        raise ValueError('max_workers must be at least 1')
+    with _executor_lock:
+        old_executor = _executor
+        _executor = None
+        _max_workers = max_workers
+    if old_executor is not None:
+        old_executor.shutdown(wait=False)
+
+def get_executor():
+    """ Get the thread pool used for ioctl() calls.
+
+    :return: A :class:`concurrent.futures.ThreadPoolExecutor`.
+    """
+
+    global _executor
+    executor = _executor
+    if executor is not None:
+        return executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(max_workers=_max_workers, thread_name_prefix='ioctl-aio')
+        return _executor
+
+async def _wait_readable(loop, fd):
+    future = loop.create_future()
+    def _readable():
+        if not future.done():
+            future.set_result(None)
+    loop.add_reader(fd, _readable)
+    try:
+        await future
+    finally:
+        loop.remove_reader(fd)
+
+async def _call(loop, fn, fd, args, wait_readable):
+    if wait_readable:
+        await _wait_readable(loop, fd)
+    return await loop.run_in_executor(get_executor(), functools.partial(fn, fd, *args))
+
+async def run(fn, fd, *args, timeout=None, deadline=None, wait_readable=False):
+    """ Run a blocking ioctl function without blocking the event loop.
+
+    :param fn: The function to call as ``fn(fd, *args)``. This can be :func:`ioctl.ioctl`,
+               a compiled call from :func:`ioctl.compile`, or a helper function.
+    :param fd: File descriptor to operate on.
+    :param args: Additional arguments to the function.
+    :return: The result of the function.
+    """
+
+    loop = asyncio.get_running_loop()
+    if deadline is not None:
+        remaining = deadline - loop.time()
+        timeout = remaining if timeout is None else min(timeout, remaining)
+    coro = _call(loop, fn, fd, args, wait_readable)
+    if timeout is None:
+        return await coro
+    return await asyncio.wait_for(coro, max(timeout, 0))
+
+async def ioctl(fd, request, *args, timeout=None, deadline=None, wait_readable=False, check=True, retry_eintr=False):
+    """ asyncio version of :func:`ioctl.ioctl`.
+
+    :param fd: File descriptor to operate on.
+    :param request: The ioctl request to call.
+    :param args: parameter to pass to ioctl.
+    :param check: Whether to raise an :class:`OSError` if the call fails, as for :func:`ioctl.ioctl`.
+    :param retry_eintr: Whether to repeat the call if it fails with ``EINTR``, as for :func:`ioctl.ioctl`.
+    :return: The return value of the ioctl-call.
+    """
+
+    fn = _ioctl.ioctl
+    if check is not True or retry_eintr is not False:
+        fn = functools.partial(_ioctl.ioctl, check=check, retry_eintr=retry_eintr)
+    return await run(fn, fd, request, *args, timeout=timeout, deadline=deadline, wait_readable=wait_readable)
+
+def wrap(fn):
+    """ Create a coroutine function from a blocking ioctl function.
+
+    :param fn: A function that takes a file descriptor as its first parameter, such as a compiled call from :func:`ioctl.compile`.
+    :return: A coroutine function with the same parameters as ``fn``, and the keyword-only parameters described in the module documentation.
+    """
+
+    @functools.wraps(fn)
+    async def async_fn(fd, *args, timeout=None, deadline=None, wait_readable=False):
+        return await run(fn, fd, *args, timeout=timeout, deadline=deadline, wait_readable=wait_readable)
+    return async_fn
+
+def ioctl_fn_ptr_r(request, datatype, return_python=None, check=True, retry_eintr=False):
+    """ asyncio version of :func:`ioctl.ioctl_fn_ptr_r`.
+
+    :Example:
+      ::
+
+          import ctypes
+          import ioctl.aio
+          import ioctl.linux
+          RNDGETENTCNT = ioctl.linux.IOR('R', 0x00, ctypes.c_int)
+          rndgetentcnt = ioctl.aio.ioctl_fn_ptr_r(RNDGETENTCNT, ctypes.c_int)
+          entropy_avail = await rndgetentcnt(fd, timeout=1.0)
+    """
+
+    return wrap(_ioctl.ioctl_fn_ptr_r(request, datatype, return_python=return_python, check=check, retry_eintr=retry_eintr))
+
+def ioctl_fn_ptr_w(request, datatype, check=True, retry_eintr=False):
+    """ asyncio version of :func:`ioctl.ioctl_fn_ptr_w`. """
+
+    return wrap(_ioctl.ioctl_fn_ptr_w(request, datatype, check=check, retry_eintr=retry_eintr))
+
+def ioctl_fn_ptr_wr(request, datatype, return_python=None, check=True, retry_eintr=False):
+    """ asyncio version of :func:`ioctl.ioctl_fn_ptr_wr`. """
+
+    return wrap(_ioctl.ioctl_fn_ptr_wr(request, datatype, return_python=return_python, check=check, retry_eintr=retry_eintr))
+
+def ioctl_fn_w(request, datatype, check=True, retry_eintr=False):
+    """ asyncio version of :func:`ioctl.ioctl_fn_w`. """
+
+    return wrap(_ioctl.ioctl_fn_w(request, datatype, check=check, retry_eintr=retry_eintr))
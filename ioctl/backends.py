@@ -0,0 +1,419 @@
+""" Backends for calling ioctl().
+
+A backend is responsible for actually issuing ioctl() calls. The library normally
+picks the fastest backend that can handle each call shape, but a backend can be
+pinned for the whole process with :func:`set_backend`, or for a single compiled
+call with the ``backend`` parameter of :func:`ioctl.compile`.
+
+Three backends are included:
+
+* :class:`CtypesBackend` calls the C library ioctl()-function through ctypes. It supports every call shape.
+* :class:`FcntlBackend` uses :func:`fcntl.ioctl`. It avoids the ctypes argument conversion machinery,
+  and is usually faster, but it only supports integer arguments that fit in a C int, and it passes
+  buffers of at most 1024 bytes through a temporary copy.
+* :class:`MockBackend` does not call ioctl() at all. It records the calls and delegates them to a handler function.
+
+A call shape is one of:
+
+* ``'none'``: No argument is passed.
+* ``'value'``: An integer is passed directly.
+* ``'pointer'``: A pointer to a ctypes instance is passed.
+"""
+import ctypes
+import errno as _errno
+import os
+import threading
+import time
+import weakref
+
+from . import _libc
+
+__all__ = (
+    'Backend',
+    'CtypesBackend',
+    'FcntlBackend',
+    'MockBackend',
+    'get_backend',
+    'pinned_backend',
+    'select_backend',
+    'set_backend',
+)
+
+_kinds = ('none', 'value', 'pointer')
+
+def _check_kind(kind):
+    if kind not in _kinds:
+        raise ValueError('kind must be \'none\', \'value\' or \'pointer\'.')
+
+def _oserror(err):
+    """ Create an :class:`OSError` for an errno value. """
+
+    return OSError(err, os.strerror(err))
+
+def _retry_eintr(fn, args, errno_fn, retry_eintr):
+    """ Repeat a call that failed with EINTR.
+
+    :param fn: The function to call as ``fn(*args)``. It returns a negative value on failure.
+    :param args: The arguments to the function.
+    :param errno_fn: Function mapping a failure result to an errno value.
+    :param retry_eintr: True to retry until the call does not fail with EINTR, or the number of
+                        seconds after which to stop retrying.
+    :return: A tuple ``(res, err)`` with the result of the last call, and its errno, or 0 if it succeeded.
+    """
+
+    deadline = None if retry_eintr is True else time.monotonic() + retry_eintr
+    while deadline is None or time.monotonic() < deadline:
+        res = fn(*args)
+        if res >= 0:
+            return res, 0
+        err = errno_fn(res)
+        if err != _errno.EINTR:
+            return res, err
+    return -1, _errno.EINTR
+
+def _int_datatype(value):
+    """ Get the ctypes data type that the C library ioctl() call passes a Python integer as. """
+
+    if -2**31 <= value < 2**31:
+        return ctypes.c_int
+    return ctypes.c_longlong
+
+def _unwrap_arg(arg):
+    """ Convert an argument for :func:`ioctl.ioctl` to the form used by backends.
+
+    :param arg: The argument. This can be None, an integer, a ctypes integer, a ctypes pointer,
+                the result of :func:`ctypes.byref` or a ctypes array.
+    :return: A tuple ``(kind, datatype, value)`` with the call shape and data type of the argument
+             for :meth:`Backend.supports`, and None, an integer passed by value, or a ctypes
+             instance passed by pointer.
+    :raises TypeError: If backends cannot pass the argument.
+    """
+
+    if arg is None:
+        return 'none', None, None
+    if isinstance(arg, int):
+        return 'value', _int_datatype(arg), arg
+    if isinstance(arg, ctypes._Pointer):
+        obj = arg.contents
+        return 'pointer', type(obj), obj
+    if isinstance(arg, ctypes._SimpleCData) and isinstance(arg.value, int):
+        return 'value', type(arg), arg.value
+    if isinstance(arg, ctypes.Array):
+        return 'pointer', type(arg), arg
+    obj = getattr(arg, '_obj', None) # Result of ctypes.byref()
+    if obj is not None:
+        # Backends pass a pointer to the start of the object, so an offset cannot be kept.
+        if ctypes.cast(arg, ctypes.c_void_p).value != ctypes.addressof(obj):
+            raise TypeError('ctypes.byref() arguments with an offset are not supported by backends')
+        return 'pointer', type(obj), obj
+    raise TypeError('Unsupported ioctl() argument type: {}'.format(arg.__class__.__name__))
+
+class Backend(object):
+    """ Base class for ioctl() backends.
+
+    Backend methods do not raise exceptions for failed ioctl() calls. They return a negative
+    value instead, and :meth:`errno` translates that value into the errno of the failure.
+    """
+
+    name = None
+
+    def supports(self, kind, datatype):
+        """ Check whether the backend supports a call shape.
+
+        :param kind: The call shape: ``'none'``, ``'value'`` or ``'pointer'``.
+        :param datatype: The ctypes data type of the argument, or None.
+        :return: True if the backend can handle the call shape.
+        """
+
+        return True
+
+    def ioctl(self, fd, request, arg=None):
+        """ Call ioctl().
+
+        :param fd: File descriptor to operate on.
+        :param request: The ioctl request to call.
+        :param arg: None, an integer passed by value, or a ctypes instance passed by pointer.
+        :return: The return value of the ioctl() call. A negative value on failure.
+        """
+
+        raise NotImplementedError()
+
+    def bind(self, kind, datatype):
+        """ Create a function for calling ioctl() with a fixed call shape.
+
+        :param kind: The call shape: ``'none'``, ``'value'`` or ``'pointer'``.
+        :param datatype: The ctypes data type of the argument, or None.
+        :return: A function ``fn(fd, request, arg)`` that returns the same as :meth:`ioctl`.
+        """
+
+        return self.ioctl
+
+    def errno(self, res):
+        """ Get the errno of a failed call.
+
+        This must be called in the same thread as the failed call, before any other ioctl() call.
+
+        :param res: The negative value returned by the failed call.
+        :return: The errno value.
+        """
+
+        return -res
+
+    def __repr__(self):
+        return '<{cls} {name!r}>'.format(cls=self.__class__.__name__, name=self.name)
+
+_ctypes_backends = weakref.WeakSet()
+# Serializes binding the generic functions of CtypesBackend instances with discarding them.
+_generic_lock = threading.Lock()
+
+def _reset_libc():
+    """ Discard the functions that :class:`CtypesBackend` instances bound from the previous C library. """
+
+    with _generic_lock:
+        for backend in list(_ctypes_backends):
+            backend._generic = None
+
+class CtypesBackend(Backend):
+    """ Backend calling the C library ioctl()-function through ctypes. """
+
+    name = 'ctypes'
+
+    def __init__(self):
+        # Function for calls without a fixed argument type. It is bound on first use, and
+        # discarded by ioctl.set_libc().
+        self._generic = None
+        _ctypes_backends.add(self)
+
+    def ioctl(self, fd, request, arg=None):
+        fn = self._generic
+        if fn is None:
+            with _generic_lock:
+                fn = self._generic
+                if fn is None:
+                    fn = self._generic = self.bind('none', None)
+        if arg is not None and not isinstance(arg, int):
+            arg = ctypes.byref(arg)
+        return fn(fd, request, arg)
+
+    def bind(self, kind, datatype):
+        _check_kind(kind)
+        if kind == 'none':
+            argtype = ctypes.c_void_p
+        elif kind == 'value':
+            argtype = datatype
+        else:
+            argtype = ctypes.POINTER(datatype)
+        try:
+            return _libc.bind_ioctl(argtype)
+        except Exception as e:
+            raise NotImplementedError('Unable to get ioctl()-function from C library: {err}'.format(err=str(e)))
+
+    def errno(self, res):
+        return ctypes.get_errno()
+
+class FcntlBackend(Backend):
+    """ Backend calling ioctl() through :func:`fcntl.ioctl`. """
+
+    name = 'fcntl'
+
+    def __init__(self):
+        import fcntl
+        self._ioctl = fcntl.ioctl
+
+    def supports(self, kind, datatype):
+        if kind == 'value':
+            # fcntl.ioctl() passes integer arguments as a C int.
+            return datatype is None or (
+                issubclass(datatype, ctypes._SimpleCData) and
+                datatype._type_ in 'bBhHi' and
+                ctypes.sizeof(datatype) <= ctypes.sizeof(ctypes.c_int)
+                )
+        return True
+
+    def ioctl(self, fd, request, arg=None):
+        try:
+            if arg is None:
+                return self._ioctl(fd, request)
+            if isinstance(arg, int):
+                return self._ioctl(fd, request, arg)
+            return self._ioctl(fd, request, arg, True)
+        except OSError as e:
+            return -e.errno
+
+    def bind(self, kind, datatype):
+        _check_kind(kind)
+        fcntl_ioctl = self._ioctl
+        if kind == 'none':
+            def fn(fd, request, arg):
+                try:
+                    return fcntl_ioctl(fd, request)
+                except OSError as e:
+                    return -e.errno
+        elif kind == 'value':
+            def fn(fd, request, arg):
+                try:
+                    return fcntl_ioctl(fd, request, arg)
+                except OSError as e:
+                    return -e.errno
+        else:
+            def fn(fd, request, arg):
+                try:
+                    return fcntl_ioctl(fd, request, arg, True)
+                except OSError as e:
+                    return -e.errno
+        return fn
+
+class MockBackend(Backend):
+    """ Backend that records calls instead of calling ioctl().
+
+    Each call is appended to :attr:`calls` as a ``(fd, request, arg)`` tuple, and then passed
+    to the handler function. The handler can modify the data passed by pointer, and returns
+    the result of the call. A handler that returns None is treated as returning 0, and a
+    handler that raises :class:`OSError` makes the call fail with that errno.
+
+    :param handler: A function ``handler(fd, request, arg)``, or None to make all calls return 0.
+
+    :Example:
+      ::
+
+          import ctypes
+          import ioctl
+          import ioctl.backends
+
+          def handler(fd, request, arg):
+              arg.value = 42
+
+          backend = ioctl.backends.MockBackend(handler)
+          fn = ioctl.compile(0x541B, ctypes.c_int, 'r', backend=backend)
+          assert fn(3) == 42
+          assert backend.calls[0][:2] == (3, 0x541B)
+    """
+
+    name = 'mock'
+
+    def __init__(self, handler=None):
+        self.handler = handler
+        self.calls = []
+
+    def ioctl(self, fd, request, arg=None):
+        self.calls.append((fd, request, arg))
+        if self.handler is None:
+            return 0
+        try:
+            res = self.handler(fd, request, arg)
+        except OSError as e:
+            return -e.errno
+        if res is None:
+            return 0
+        return res
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+def get_backend(name):
+    """ Get one of the included backends by name.
+
+    :param name: ``'ctypes'`` or ``'fcntl'``.
+    :return: The shared :class:`Backend` instance.
+    """
+
+    backend = _backends.get(name)
+    if backend is not None:
+        return backend
+    with _backends_lock:
+        backend = _backends.get(name)
+        if backend is not None:
+            return backend
+        if name == 'ctypes':
+            backend = CtypesBackend()
+        elif name == 'fcntl':
+            backend = FcntlBackend()
+        else:
+            raise ValueError('Unknown backend: {name!r}'.format(name=name))
+        _backends[name] = backend
+        return backend
+
+_pinned = None
+_auto_calls = weakref.WeakSet()
+# Serializes changes of the pinned backend with registering and rebinding auto calls.
+_auto_calls_lock = threading.Lock()
+
+def _auto_backend(kind, datatype):
+    try:
+        backend = get_backend('fcntl')
+    except ImportError:
+        # fcntl is not available on this platform.
+        return get_backend('ctypes')
+    if backend.supports(kind, datatype):
+        return backend
+    return get_backend('ctypes')
+
+def select_backend(kind, datatype, backend=None):
+    """ Select the backend for a call shape.
+
+    :param kind: The call shape: ``'none'``, ``'value'`` or ``'pointer'``.
+    :param datatype: The ctypes data type of the argument, or None.
+    :param backend: A :class:`Backend` instance or backend name, or None to use the pinned backend.
+                    If no backend is pinned, or the pinned backend does not support the call shape,
+                    the fastest backend that supports the call shape is picked.
+    :return: A :class:`Backend` instance.
+    """
+
+    _check_kind(kind)
+    if backend is None:
+        backend = _pinned
+        if backend is None or not backend.supports(kind, datatype):
+            return _auto_backend(kind, datatype)
+        return backend
+    if isinstance(backend, str):
+        backend = get_backend(backend)
+    elif not isinstance(backend, Backend):
+        raise TypeError('backend must be None, a string or a Backend instance, but was {}'.format(backend.__class__.__name__))
+    if not backend.supports(kind, datatype):
+        raise ValueError('Backend {name!r} does not support this call.'.format(name=backend.name))
+    return backend
+
+def set_backend(backend):
+    """ Pin a backend for all ioctl() calls in the process.
+
+    This affects :func:`ioctl.ioctl`, the helper functions, :func:`ioctl.ioctl_many`, and all calls
+    compiled with :func:`ioctl.compile` without an explicit backend, including calls compiled earlier.
+
+    Changing the backend is safe while other threads compile calls. Calls that are running
+    in other threads while the backend changes may still use the previous backend.
+
+    :param backend: A :class:`Backend` instance or backend name, or None to pick backends automatically again.
+    :return: The previously pinned backend, or None.
+    """
+
+    global _pinned
+    if isinstance(backend, str):
+        backend = get_backend(backend)
+    elif backend is not None and not isinstance(backend, Backend):
+        raise TypeError('backend must be None, a string or a Backend instance, but was {}'.format(backend.__class__.__name__))
+    with _auto_calls_lock:
+        previous = _pinned
+        _pinned = backend
+        for call in list(_auto_calls):
+            call._bind(select_backend(call._kind, call.datatype))
+    return previous
+
+def pinned_backend():
+    """ Get the backend pinned with :func:`set_backend`.
+
+    :return: The pinned :class:`Backend` instance, or None.
+    """
+
+    return _pinned
+
+def _register_auto_call(call):
+    """ Register a compiled call that follows the backend pinned with :func:`set_backend`.
+
+    The call is bound again if the pinned backend changed after the call selected its backend.
+    """
+
+    with _auto_calls_lock:
+        _auto_calls.add(call)
+        backend = select_backend(call._kind, call.datatype)
+        if backend is not call.backend:
+            call._bind(backend)
@@ -0,0 +1,377 @@
+""" Block device geometry, planning of aligned I/O, and range operations.
+
+Direct I/O must be aligned to the logical block size of the device, and performs best
+when it is aligned to the physical block size and issued in multiples of the optimal I/O
+size. :func:`get_geometry` reads all of these with one call per device, and caches them
+by device number. :class:`IoPlanner` splits byte ranges into chunks that follow them.
+
+:func:`discard` and :func:`zeroout` discard or zero ranges of a device with ``BLKDISCARD``
+and ``BLKZEROOUT``. A single call for a whole device can block for minutes, so the range
+is split into chunks, which can run in parallel, report progress, and be cancelled.
+
+:Example:
+  ::
+
+      import os
+      import ioctl.blkdev
+      fd = os.open('/dev/nvme0n1', os.O_RDONLY | os.O_DIRECT)
+      planner = ioctl.blkdev.IoPlanner(ioctl.blkdev.get_geometry(fd))
+      for offset, length in planner.plan(0, 10 * 1024 * 1024):
+          os.preadv(fd, [ planner.buffer(length) ], offset)
+"""
+import collections
+import concurrent.futures
+import ctypes
+import errno
+import mmap
+import os
+import stat
+import threading
+import time
+
+import ioctl
+from . import linux
+from .executor import IoctlExecutor
+
+__all__ = (
+    'BLKDISCARD',
+    'BLKGETSIZE64',
+    'BLKIOMIN',
+    'BLKIOOPT',
+    'BLKPBSZGET',
+    'BLKSECDISCARD',
+    'BLKSSZGET',
+    'BLKZEROOUT',
+    'DEFAULT_CHUNK_SIZE',
+    'DEFAULT_RANGE_CHUNK_SIZE',
+    'Geometry',
+    'IoChunk',
+    'IoPlanner',
+    'RangeProgress',
+    'clear_cache',
+    'discard',
+    'get_discard_granularity',
+    'get_geometry',
+    'zeroout',
+)
+
+BLKSSZGET = linux.IO(0x12, 104)
+BLKDISCARD = linux.IO(0x12, 119)
+BLKIOMIN = linux.IO(0x12, 120)
+BLKIOOPT = linux.IO(0x12, 121)
+BLKPBSZGET = linux.IO(0x12, 123)
+BLKSECDISCARD = linux.IO(0x12, 125)
+BLKZEROOUT = linux.IO(0x12, 127)
+BLKGETSIZE64 = linux.IOR(0x12, 114, ctypes.c_size_t)
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+DEFAULT_RANGE_CHUNK_SIZE = 1024 * 1024 * 1024
+
+class Geometry(collections.namedtuple('Geometry', (
+    'logical_block_size',
+    'physical_block_size',
+    'minimum_io_size',
+    'optimal_io_size',
+    'size',
+))):
+    """ The geometry of a block device.
+
+    :ivar logical_block_size: The smallest unit the device can address, in bytes (``BLKSSZGET``).
+    :ivar physical_block_size: The smallest unit the device can write without a read-modify-write cycle, in bytes (``BLKPBSZGET``).
+    :ivar minimum_io_size: The preferred minimum I/O size, in bytes (``BLKIOMIN``).
+    :ivar optimal_io_size: The optimal I/O size, in bytes, or 0 if the device does not report one (``BLKIOOPT``).
+    :ivar size: The size of the device, in bytes (``BLKGETSIZE64``).
+    """
+
+    __slots__ = ()
+
+class IoChunk(collections.namedtuple('IoChunk', ('offset', 'length'))):
+    """ A chunk of I/O planned by :class:`IoPlanner`.
+
+    :ivar offset: The offset on the device, in bytes.
+    :ivar length: The length of the chunk, in bytes.
+    """
+
+    __slots__ = ()
+
+# BLKSSZGET takes an int, and the other size requests an unsigned int, although they are encoded without a size.
+_blksszget = ioctl.compile(BLKSSZGET, ctypes.c_int, 'r')
+_blkpbszget = ioctl.compile(BLKPBSZGET, ctypes.c_uint, 'r')
+_blkiomin = ioctl.compile(BLKIOMIN, ctypes.c_uint, 'r')
+_blkioopt = ioctl.compile(BLKIOOPT, ctypes.c_uint, 'r')
+_blkgetsize64 = ioctl.compile(BLKGETSIZE64, ctypes.c_uint64, 'r')
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+def clear_cache(rdev=None):
+    """ Forget cached device geometry.
+
+    :param rdev: The device number of the device to forget, or None to forget all devices.
+    """
+
+    with _cache_lock:
+        if rdev is None:
+            _cache.clear()
+        else:
+            _cache.pop(rdev, None)
+
+def get_geometry(fd, cache=True):
+    """ Get the geometry of a block device.
+
+    The geometry is cached by device number, so later calls for the same device, even
+    through other file descriptors, do not call ioctl() at all. Use ``cache=False`` or
+    :func:`clear_cache` after the device has been resized.
+
+    :param fd: File descriptor of the block device.
+    :param cache: Whether to use and update the cache.
+    :return: A :class:`Geometry`.
+    """
+
+    st = os.fstat(fd)
+    if not stat.S_ISBLK(st.st_mode):
+        raise OSError(errno.ENOTBLK, os.strerror(errno.ENOTBLK))
+    rdev = st.st_rdev
+    if cache:
+        geometry = _cache.get(rdev)
+        if geometry is not None:
+            return geometry
+    geometry = Geometry(
+        _blksszget(fd),
+        _blkpbszget(fd),
+        _blkiomin(fd),
+        _blkioopt(fd),
+        _blkgetsize64(fd),
+        )
+    if cache:
+        with _cache_lock:
+            _cache[rdev] = geometry
+    return geometry
+
+def _round_up(value, multiple):
+    return -(-value // multiple) * multiple
+
+class IoPlanner(object):
+    """ Planner for aligned, optimally sized I/O on a block device.
+
+    :param geometry: The :class:`Geometry` of the device.
+    :param chunk_size: The maximum size of each chunk, in bytes. Defaults to the optimal I/O size of the
+                       device, or :data:`DEFAULT_CHUNK_SIZE` if the device does not report one. The chunk
+                       size is rounded up to a multiple of the physical block size and minimum I/O size.
+    """
+
+    def __init__(self, geometry, chunk_size=None):
+        if not isinstance(geometry, Geometry):
+            raise TypeError('geometry must be a Geometry, but was {}'.format(geometry.__class__.__name__))
+        if chunk_size is not None:
+            if not isinstance(chunk_size, int):
+                raise TypeError('chunk_size must be None or an integer, but was {}'.format(chunk_size.__class__.__name__))
+            if chunk_size < 1:
+                raise ValueError('chunk_size must be at least 1')
+        self.geometry = geometry
+        self.alignment = max(geometry.logical_block_size, 1)
+        unit = max(self.alignment, geometry.physical_block_size, geometry.minimum_io_size)
+        if chunk_size is None:
+            chunk_size = geometry.optimal_io_size or max(DEFAULT_CHUNK_SIZE, unit)
+        self.chunk_size = _round_up(chunk_size, unit)
+
+    def align_down(self, offset):
+        """ Round an offset down to the logical block size. """
+
+        return offset - offset % self.alignment
+
+    def align_up(self, offset):
+        """ Round an offset up to the logical block size. """
+
+        return _round_up(offset, self.alignment)
+
+    def plan(self, offset, length):
+        """ Split a byte range into aligned chunks.
+
+        The range is first extended to the logical block size, and limited to the size
+        of the device. Chunks then end at multiples of the chunk size, so that all chunks
+        except the first and last ones are aligned and have the full chunk size.
+
+        :param offset: The offset of the range, in bytes.
+        :param length: The length of the range, in bytes.
+        :return: An iterator of :class:`IoChunk` tuples.
+        """
+
+        if offset < 0 or length < 0:
+            raise ValueError('offset and length cannot be negative')
+        start = self.align_down(offset)
+        end = self.align_up(offset + length)
+        if self.geometry.size:
+            end = min(end, self.geometry.size)
+        chunk_size = self.chunk_size
+        while start < end:
+            chunk_end = min((start // chunk_size + 1) * chunk_size, end)
+            yield IoChunk(start, chunk_end - start)
+            start = chunk_end
+
+    def buffer(self, length):
+        """ Allocate a buffer suitable for direct I/O.
+
+        The buffer is page aligned, and its length is rounded up to the logical block size.
+
+        :param length: The minimum length of the buffer, in bytes.
+        :return: An anonymous :class:`mmap.mmap`.
+        """
+
+        return mmap.mmap(-1, max(self.align_up(length), self.alignment))
+
+class RangeProgress(collections.namedtuple('RangeProgress', ('done', 'total', 'elapsed', 'cancelled'))):
+    """ Progress of a range operation.
+
+    :ivar done: The number of bytes completed.
+    :ivar total: The total number of bytes in the range.
+    :ivar elapsed: The number of seconds since the operation started.
+    :ivar cancelled: Whether the operation was cancelled.
+    """
+
+    __slots__ = ()
+
+    @property
+    def throughput(self):
+        """ The average throughput, in bytes per second. """
+
+        if self.elapsed <= 0:
+            return 0.0
+        return self.done / self.elapsed
+
+def _read_queue_attribute(rdev, name):
+    base = '/sys/dev/block/{}:{}'.format(os.major(rdev), os.minor(rdev))
+    # Partitions share the queue of the whole disk, which is their parent directory.
+    for path in (os.path.join(base, 'queue', name), os.path.join(base, '..', 'queue', name)):
+        try:
+            with open(path) as f:
+                return int(f.read())
+        except (IOError, OSError, ValueError):
+            pass
+    return None
+
+def get_discard_granularity(fd):
+    """ Get the discard granularity of a block device.
+
+    The granularity is read from ``/sys/dev/block/<major>:<minor>/queue/discard_granularity``.
+    If it is not available, the logical block size is returned instead.
+
+    :param fd: File descriptor of the block device.
+    :return: The discard granularity, in bytes.
+    """
+
+    granularity = _read_queue_attribute(os.fstat(fd).st_rdev, 'discard_granularity')
+    if not granularity:
+        granularity = get_geometry(fd).logical_block_size
+    return granularity
+
+def _range_chunks(offset, end, chunk_size):
+    while offset < end:
+        chunk_end = min((offset // chunk_size + 1) * chunk_size, end)
+        yield offset, chunk_end - offset
+        offset = chunk_end
+
+def _range_operation(fd, request, offset, length, alignment, chunk_size, max_workers, progress, cancel):
+    geometry = get_geometry(fd)
+    if length is None:
+        length = geometry.size - offset
+    block_size = geometry.logical_block_size
+    if offset < 0 or length < 0:
+        raise ValueError('offset and length cannot be negative')
+    if offset % block_size or length % block_size:
+        raise ValueError('offset and length must be multiples of the logical block size ({})'.format(block_size))
+    if not isinstance(chunk_size, int):
+        raise TypeError('chunk_size must be an integer, but was {}'.format(chunk_size.__class__.__name__))
+    if chunk_size < 1:
+        raise ValueError('chunk_size must be at least 1')
+    if not isinstance(max_workers, int):
+        raise TypeError('max_workers must be an integer, but was {}'.format(max_workers.__class__.__name__))
+    if max_workers < 1:
+        raise ValueError('max_workers must be at least 1')
+
+    chunk_size = _round_up(chunk_size, max(alignment, block_size))
+    chunks = _range_chunks(offset, offset + length, chunk_size)
+    start = time.monotonic()
+    done = 0
+
+    def _report(cancelled=False):
+        res = RangeProgress(done, length, time.monotonic() - start, cancelled)
+        if progress is not None:
+            progress(res)
+        return res
+
+    def _call(fd, chunk_offset, chunk_length):
+        value = (ctypes.c_uint64 * 2)(chunk_offset, chunk_length)
+        ioctl.ioctl(fd, request, ctypes.byref(value))
+        return chunk_length
+
+    if max_workers == 1:
+        for chunk_offset, chunk_length in chunks:
+            if cancel is not None and cancel.is_set():
+                return _report(cancelled=True)
+            done += _call(fd, chunk_offset, chunk_length)
+            _report()
+        return _report()
+
+    cancelled = False
+    with IoctlExecutor(max_workers=max_workers) as executor:
+        pending = set()
+        try:
+            while True:
+                while len(pending) < max_workers and not cancelled:
+                    if cancel is not None and cancel.is_set():
+                        cancelled = True
+                        break
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        break
+                    pending.add(executor.submit(_call, fd, *chunk, device=fd))
+                if not pending:
+                    break
+                completed, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in completed:
+                    done += future.result()
+                    _report()
+        finally:
+            concurrent.futures.wait(pending)
+    return _report(cancelled=cancelled)
+
+def discard(fd, offset=0, length=None, chunk_size=DEFAULT_RANGE_CHUNK_SIZE, max_workers=1, progress=None, cancel=None, secure=False):
+    """ Discard a range of a block device.
+
+    The range is split into chunks that end at multiples of the chunk size, and each chunk
+    is discarded with a separate ``BLKDISCARD`` call. The chunk size is rounded up to the
+    discard granularity of the device.
+
+    :param fd: File descriptor of the block device, open for writing.
+    :param offset: The offset of the range, in bytes. Must be a multiple of the logical block size.
+    :param length: The length of the range, in bytes, or None for the rest of the device. Must be a multiple of the logical block size.
+    :param chunk_size: The maximum size of each chunk, in bytes.
+    :param max_workers: The number of chunks to discard in parallel.
+    :param progress: A function that is called with a :class:`RangeProgress` after each chunk.
+    :param cancel: A :class:`threading.Event`. If it is set, no further chunks are started.
+    :param secure: Whether to use ``BLKSECDISCARD`` instead of ``BLKDISCARD``.
+    :return: A :class:`RangeProgress` with the final progress.
+    """
+
+    request = BLKSECDISCARD if secure else BLKDISCARD
+    return _range_operation(fd, request, offset, length, get_discard_granularity(fd), chunk_size, max_workers, progress, cancel)
+
+def zeroout(fd, offset=0, length=None, chunk_size=DEFAULT_RANGE_CHUNK_SIZE, max_workers=1, progress=None, cancel=None):
+    """ Zero a range of a block device.
+
+    The range is split into chunks like for :func:`discard`, and each chunk is zeroed with
+    a separate ``BLKZEROOUT`` call. The chunk size is rounded up to the physical block size.
+
+    :param fd: File descriptor of the block device, open for writing.
+    :param offset: The offset of the range, in bytes. Must be a multiple of the logical block size.
+    :param length: The length of the range, in bytes, or None for the rest of the device. Must be a multiple of the logical block size.
+    :param chunk_size: The maximum size of each chunk, in bytes.
+    :param max_workers: The number of chunks to zero in parallel.
+    :param progress: A function that is called with a :class:`RangeProgress` after each chunk.
+    :param cancel: A :class:`threading.Event`. If it is set, no further chunks are started.
+    :return: A :class:`RangeProgress` with the final progress.
+    """
+
+    alignment = get_geometry(fd).physical_block_size
+    return _range_operation(fd, BLKZEROOUT, offset, length, alignment, chunk_size, max_workers, progress, cancel)
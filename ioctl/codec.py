@@ -0,0 +1,341 @@
+""" Fast conversion of ctypes data to Python values.
+
+Reading the fields of a ctypes structure one at a time is slow. A :class:`Codec` analyses
+the layout of a ctypes data type once, and derives a :class:`struct.Struct` and a decoder
+function from it. Decoding a result is then a single ``unpack_from()`` call, followed by
+building the result from the unpacked values.
+
+Structures, unions, nested structures, arrays and bitfields are supported. Character arrays
+are decoded as :class:`bytes`, truncated at the first NUL byte, like ctypes does. Pointers
+are decoded as integer addresses.
+
+:Example:
+  ::
+
+      import ioctl
+      import ioctl.codec
+      codec = ioctl.codec.get_codec(Stats)
+      stats_ioctl = ioctl.compile(GET_STATS, Stats, 'r')
+      row = codec.to_namedtuple(stats_ioctl(fd))
+"""
+import collections
+import ctypes
+import struct
+import sys
+import threading
+
+__all__ = (
+    'Codec',
+    'get_codec',
+)
+
+_float_codes = {
+    4: 'f',
+    8: 'd',
+}
+
+_int_codes = {
+    1: 'b',
+    2: 'h',
+    4: 'i',
+    8: 'q',
+}
+
+def _is_signed(datatype):
+    return datatype(-1).value == -1
+
+def _simple_code(datatype):
+    """ Get the struct format code with standard size for a fundamental ctypes type. """
+
+    type_code = datatype._type_
+    size = ctypes.sizeof(datatype)
+    if type_code == 'c':
+        return 'c'
+    if type_code == '?':
+        return '?'
+    if type_code in 'fd' or (type_code == 'g' and size in _float_codes):
+        return _float_codes[size]
+    if type_code in 'bBhHiIlLqQ':
+        code = _int_codes[size]
+        return code if _is_signed(datatype) else code.upper()
+    if type_code in 'PzZO':
+        return _int_codes[size].upper()
+    # Types without a struct equivalent, such as long double or wide characters, are returned as raw bytes.
+    return '{}s'.format(size)
+
+def _byte_order(datatype):
+    if issubclass(datatype, ctypes.BigEndianStructure) and sys.byteorder == 'little':
+        return '>'
+    if issubclass(datatype, ctypes.LittleEndianStructure) and sys.byteorder == 'big':
+        return '<'
+    if sys.byteorder == 'little':
+        return '<'
+    return '>'
+
+def _cstr(value):
+    end = value.find(b'\0')
+    if end < 0:
+        return value
+    return value[:end]
+
+def _sign_extend(value, bits):
+    if value & (1 << (bits - 1)):
+        return value - (1 << bits)
+    return value
+
+class _Layout(object):
+    """ Collects the leaf values of a data type, and the expressions that build the result. """
+
+    def __init__(self):
+        self.leaves = [] # (offset, code, size)
+        self._leaf_index = {}
+        self.namedtuples = {}
+        self.byte_order = None
+
+    def leaf(self, offset, code, size):
+        key = (offset, code)
+        index = self._leaf_index.get(key)
+        if index is None:
+            index = self._leaf_index[key] = len(self.leaves)
+            self.leaves.append((offset, code, size))
+        return index
+
+    def namedtuple_name(self, datatype):
+        name = self.namedtuples.get(datatype)
+        if name is None:
+            name = '_nt{}'.format(len(self.namedtuples))
+            self.namedtuples[datatype] = name
+        return name
+
+    def expression(self, datatype, offset, mode):
+        """ Build the expression for a value of the given data type at the given offset. """
+
+        if issubclass(datatype, ctypes._SimpleCData):
+            return 't[{}]'.format(self.leaf(offset, _simple_code(datatype), ctypes.sizeof(datatype)))
+        if issubclass(datatype, ctypes.Array):
+            item = datatype._type_
+            if item is ctypes.c_char:
+                return '_cstr(t[{}])'.format(self.leaf(offset, '{}s'.format(datatype._length_), datatype._length_))
+            item_size = ctypes.sizeof(item)
+            items = [ self.expression(item, offset + n * item_size, mode) for n in range(datatype._length_) ]
+            return '(' + ''.join(expr + ', ' for expr in items) + ')'
+        if issubclass(datatype, (ctypes.Structure, ctypes.Union)):
+            byte_order = _byte_order(datatype)
+            if self.byte_order is None:
+                self.byte_order = byte_order
+            elif self.byte_order != byte_order:
+                raise TypeError('Mixed byte orders are not supported: {}'.format(datatype.__name__))
+            names = []
+            values = []
+            for field in datatype._fields_:
+                name, field_type = field[0], field[1]
+                descriptor = getattr(datatype, name)
+                if len(field) > 2:
+                    values.append(self._bitfield_expression(field_type, field[2], descriptor, offset))
+                else:
+                    values.append(self.expression(field_type, offset + descriptor.offset, mode))
+                names.append(name)
+            if mode == 'dict':
+                return '{' + ''.join('{!r}: {}, '.format(name, value) for name, value in zip(names, values)) + '}'
+            if mode == 'namedtuple':
+                return '{}({})'.format(self.namedtuple_name(datatype), ', '.join(values))
+            return '(' + ''.join(value + ', ' for value in values) + ')'
+        raise TypeError('Unsupported data type: {}'.format(datatype.__name__))
+
+    def _bitfield_expression(self, field_type, bits, descriptor, offset):
+        if hasattr(descriptor, 'bit_offset'):
+            bit_offset = descriptor.bit_offset
+        else:
+            bit_offset = descriptor.size & 0xffff
+        index = self.leaf(offset + descriptor.offset, _simple_code(field_type), ctypes.sizeof(field_type))
+        expr = '((t[{index}] >> {shift}) & 0x{mask:x})'.format(index=index, shift=bit_offset, mask=(1 << bits) - 1)
+        if _is_signed(field_type):
+            expr = '_sign_extend({expr}, {bits})'.format(expr=expr, bits=bits)
+        return expr
+
+def _structs(leaves, byte_order):
+    """ Group the leaves into as few non-overlapping structs as possible. """
+
+    order = sorted(range(len(leaves)), key=lambda index: leaves[index][0])
+    groups = []
+    current = None
+    for index in order:
+        offset, code, size = leaves[index]
+        if current is None or offset < current['end']:
+            current = { 'base': offset, 'end': offset, 'fmt': byte_order, 'indexes': [] }
+            groups.append(current)
+        if offset > current['end']:
+            current['fmt'] += '{}x'.format(offset - current['end'])
+        current['fmt'] += code
+        current['end'] = offset + size
+        current['indexes'].append(index)
+    return groups
+
+class Codec(object):
+    """ Converter from ctypes data to Python values.
+
+    All methods that take data accept an instance of the data type, or any buffer
+    (:class:`bytes`, :class:`bytearray`, :class:`memoryview`, ...) containing the data.
+
+    :param datatype: The ctypes data type.
+    """
+
+    def __init__(self, datatype):
+        if not isinstance(datatype, type) or not issubclass(datatype, (ctypes._SimpleCData, ctypes.Structure, ctypes.Union, ctypes.Array)):
+            raise TypeError('datatype must be a ctypes data type, but was {}'.format(getattr(datatype, '__name__', datatype.__class__.__name__)))
+        self.datatype = datatype
+        self.size = ctypes.sizeof(datatype)
+        self._decoders = {}
+        self._lock = threading.Lock()
+        self._numpy_dtype = None
+        self.field_names = tuple(field[0] for field in getattr(datatype, '_fields_', ()))
+        self.namedtuple = collections.namedtuple(datatype.__name__, self.field_names, rename=True) if self.field_names else None
+
+    def _decoder(self, mode):
+        decoder = self._decoders.get(mode)
+        if decoder is not None:
+            return decoder
+        with self._lock:
+            decoder = self._decoders.get(mode)
+            if decoder is None:
+                decoder = self._decoders[mode] = self._compile(mode)
+        return decoder
+
+    def _compile(self, mode):
+        layout = _Layout()
+        expr = layout.expression(self.datatype, 0, mode)
+        if layout.byte_order is None:
+            layout.byte_order = '<' if sys.byteorder == 'little' else '>'
+        groups = _structs(layout.leaves, layout.byte_order)
+
+        namespace = {
+            '_cstr': _cstr,
+            '_sign_extend': _sign_extend,
+        }
+        for datatype, name in layout.namedtuples.items():
+            if datatype is self.datatype:
+                namespace[name] = self.namedtuple
+            else:
+                fields = tuple(field[0] for field in datatype._fields_)
+                namespace[name] = collections.namedtuple(datatype.__name__, fields, rename=True)
+
+        # The unpacked values are reordered so that t[index] is the value of leaf index.
+        unpack = []
+        positions = []
+        for number, group in enumerate(groups):
+            namespace['_s{}'.format(number)] = struct.Struct(group['fmt'])
+            unpack.append('_s{number}.unpack_from(data, {base})'.format(number=number, base=group['base']))
+            positions.extend(group['indexes'])
+        if positions == list(range(len(positions))):
+            body = 't = ' + ' + '.join(unpack)
+        else:
+            inverse = [0] * len(positions)
+            for position, index in enumerate(positions):
+                inverse[index] = position
+            body = 'u = ' + ' + '.join(unpack) + '\n    t = (' + ''.join('u[{}], '.format(p) for p in inverse) + ')'
+        source = 'def decode(data):\n    {body}\n    return {expr}\n'.format(body=body, expr=expr)
+        exec(source, namespace)
+        return namespace['decode']
+
+    def to_tuple(self, data):
+        """ Decode data to nested tuples.
+
+        :param data: The data to decode.
+        :return: A tuple of field values for structures and arrays, or the value of fundamental data types.
+        """
+
+        return self._decoder('tuple')(data)
+
+    def to_namedtuple(self, data):
+        """ Decode data to nested named tuples.
+
+        :param data: The data to decode.
+        :return: A named tuple for structures. Nested structures are also decoded as named tuples.
+        """
+
+        return self._decoder('namedtuple')(data)
+
+    def to_dict(self, data):
+        """ Decode data to nested dictionaries.
+
+        :param data: The data to decode.
+        :return: A dictionary mapping field names to values for structures. Nested structures are also decoded as dictionaries.
+        """
+
+        return self._decoder('dict')(data)
+
+    def iter_tuples(self, data):
+        """ Decode consecutive values from a buffer.
+
+        :param data: A buffer containing a whole number of values, e.g. a ctypes array of the data type.
+        :return: An iterator of tuples, as returned by :meth:`to_tuple`.
+        """
+
+        view = memoryview(data).cast('B')
+        if len(view) % self.size:
+            raise ValueError('Buffer size must be a multiple of {}'.format(self.size))
+        decode = self._decoder('tuple')
+        for offset in range(0, len(view), self.size):
+            yield decode(view[offset:offset + self.size])
+
+    @property
+    def numpy_dtype(self):
+        """ The NumPy dtype equivalent to the data type.
+
+        Bitfields are not supported by NumPy.
+        """
+
+        if self._numpy_dtype is None:
+            import numpy as np
+            self._numpy_dtype = np.dtype(self.datatype)
+        return self._numpy_dtype
+
+    def to_numpy(self, data):
+        """ Decode data to a row of a NumPy structured array.
+
+        The row shares memory with the data if the data is writable.
+
+        :param data: The data to decode.
+        :return: A :class:`numpy.void` structured scalar.
+        """
+
+        import numpy as np
+        return np.frombuffer(data, dtype=self.numpy_dtype, count=1)[0]
+
+    def decode_many(self, data):
+        """ Decode many values into a single NumPy structured array.
+
+        No Python objects are created per value.
+
+        :param data: A buffer containing a whole number of values, such as a ctypes array of the
+                     data type, or a sequence of instances of the data type.
+        :return: A :class:`numpy.ndarray` with the structured dtype.
+        """
+
+        import numpy as np
+        if isinstance(data, (list, tuple)):
+            result = np.empty(len(data), dtype=self.numpy_dtype)
+            target = result.view(np.uint8)
+            size = self.size
+            for index, item in enumerate(data):
+                target[index * size:(index + 1) * size] = memoryview(item).cast('B')
+            return result
+        return np.frombuffer(data, dtype=self.numpy_dtype)
+
+_codecs = {}
+_codecs_lock = threading.Lock()
+
+def get_codec(datatype):
+    """ Get the shared :class:`Codec` for a data type.
+
+    :param datatype: The ctypes data type.
+    :return: A :class:`Codec` instance.
+    """
+
+    codec = _codecs.get(datatype)
+    if codec is None:
+        with _codecs_lock:
+            codec = _codecs.get(datatype)
+            if codec is None:
+                codec = _codecs[datatype] = Codec(datatype)
+    return codec
@@ -0,0 +1,662 @@
+""" Generate Python modules with ioctl request numbers and ctypes structures.
+
+Defining ioctl requests at runtime means building ctypes structures and computing
+request numbers with :func:`ioctl.linux.IOC` on every import, and getting them right
+means comparing them with a compiled C program. This module does that work once: it reads
+a :class:`Spec` from a small declarative description or from the ``_IO``/``_IOR``/
+``_IOW``/``_IOWR`` definitions and plain structures of a kernel uapi header, and writes a
+Python module with the request numbers as integer literals, the ctypes structures, and
+helper functions bound with the ``ioctl_fn_ptr_*`` functions.
+
+:func:`verify` compiles a C program that prints the sizes and field offsets of the
+structures and the request numbers from the real headers, and compares them with the
+values computed by this module.
+
+A spec is a dictionary, which is usually loaded from a JSON file::
+
+    {
+        "headers": ["linux/fs.h"],
+        "structs": [
+            {"c_name": "struct file_clone_range", "fields": [
+                ["src_fd", "__s64"], ["src_offset", "__u64"],
+                ["src_length", "__u64"], ["dest_offset", "__u64"]]}
+        ],
+        "requests": [
+            {"name": "FICLONE", "direction": "w", "type": 148, "nr": 9, "argtype": "int", "helper": "value"},
+            {"name": "FICLONERANGE", "direction": "w", "type": 148, "nr": 13, "argtype": "struct file_clone_range"}
+        ]
+    }
+
+Types are written as in C. A field can have a third item with an array length.
+
+:Example:
+  ::
+
+      python -m ioctl.codegen /usr/include/linux/fs.h --include linux/fs.h -o fs_ioctls.py --verify
+"""
+import argparse
+import ast
+import collections
+import ctypes
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+
+from . import linux
+
+__all__ = (
+    'Field',
+    'Mismatch',
+    'RequestSpec',
+    'Spec',
+    'StructSpec',
+    'generate',
+    'layout',
+    'load_spec',
+    'main',
+    'parse_header',
+    'probe_source',
+    'verify',
+)
+
+class Field(collections.namedtuple('Field', ('name', 'c_type', 'length'))):
+    """ A field of a structure.
+
+    :ivar name: The name of the field.
+    :ivar c_type: The C type of the field, e.g. ``'__u32'`` or ``'struct input_id'``.
+    :ivar length: The array length, or None if the field is not an array.
+    """
+
+    __slots__ = ()
+
+class StructSpec(collections.namedtuple('StructSpec', ('name', 'c_name', 'fields', 'pack'))):
+    """ A structure.
+
+    :ivar name: The name of the Python class.
+    :ivar c_name: The C name, e.g. ``'struct file_clone_range'``.
+    :ivar fields: A tuple of :class:`Field` tuples.
+    :ivar pack: The ``_pack_`` value of the class, or None for the native alignment.
+    """
+
+    __slots__ = ()
+
+class RequestSpec(collections.namedtuple('RequestSpec', ('name', 'direction', 'request_type', 'request_nr', 'argtype', 'helper'))):
+    """ An ioctl request.
+
+    :ivar name: The name of the request, which is also the name of the C macro.
+    :ivar direction: None, ``'r'``, ``'w'`` or ``'rw'``.
+    :ivar request_type: The request type, as an integer.
+    :ivar request_nr: The request number.
+    :ivar argtype: The C type of the argument, or None.
+    :ivar helper: ``'pointer'`` for a helper created with ``ioctl_fn_ptr_r``, ``ioctl_fn_ptr_w`` or
+                  ``ioctl_fn_ptr_wr`` according to the direction, ``'value'`` for one created with
+                  ``ioctl_fn_w``, or None for no helper.
+    """
+
+    __slots__ = ()
+
+class Mismatch(collections.namedtuple('Mismatch', ('key', 'expected', 'actual'))):
+    """ A value that differs between the C headers and the spec.
+
+    :ivar key: ``'sizeof:<type>'``, ``'offsetof:<type>.<field>'`` or the name of a request.
+    :ivar expected: The value from the compiled C program.
+    :ivar actual: The value computed from the spec.
+    """
+
+    __slots__ = ()
+
+_C_TYPES = {
+    'char': 'c_char',
+    'signed char': 'c_byte',
+    'unsigned char': 'c_ubyte',
+    'short': 'c_short',
+    'short int': 'c_short',
+    'unsigned short': 'c_ushort',
+    'unsigned short int': 'c_ushort',
+    'int': 'c_int',
+    'signed int': 'c_int',
+    'unsigned': 'c_uint',
+    'unsigned int': 'c_uint',
+    'long': 'c_long',
+    'long int': 'c_long',
+    'unsigned long': 'c_ulong',
+    'unsigned long int': 'c_ulong',
+    'long long': 'c_longlong',
+    'unsigned long long': 'c_ulonglong',
+    'size_t': 'c_size_t',
+    '__kernel_size_t': 'c_size_t',
+    'ssize_t': 'c_ssize_t',
+    '__kernel_ssize_t': 'c_ssize_t',
+    '__kernel_long_t': 'c_long',
+    '__kernel_ulong_t': 'c_ulong',
+    '__u8': 'c_uint8',
+    '__s8': 'c_int8',
+    '__u16': 'c_uint16',
+    '__s16': 'c_int16',
+    '__u32': 'c_uint32',
+    '__s32': 'c_int32',
+    '__u64': 'c_uint64',
+    '__s64': 'c_int64',
+    '__le16': 'c_uint16',
+    '__le32': 'c_uint32',
+    '__le64': 'c_uint64',
+    '__be16': 'c_uint16',
+    '__be32': 'c_uint32',
+    '__be64': 'c_uint64',
+    # Only differs from __u64 on architectures where 64 bit integers are less aligned.
+    '__aligned_u64': 'c_uint64',
+    'uint8_t': 'c_uint8',
+    'int8_t': 'c_int8',
+    'uint16_t': 'c_uint16',
+    'int16_t': 'c_int16',
+    'uint32_t': 'c_uint32',
+    'int32_t': 'c_int32',
+    'uint64_t': 'c_uint64',
+    'int64_t': 'c_int64',
+}
+
+def _normalize_type(c_type):
+    return ' '.join(c_type.replace('const ', ' ').split())
+
+def _class_name(c_name):
+    """ Get the Python class name for a C structure name, e.g. ``FileCloneRange`` for ``struct file_clone_range``. """
+
+    name = c_name.split()[-1]
+    return ''.join(part[:1].upper() + part[1:] for part in name.split('_') if part)
+
+class Spec(object):
+    """ The structures and requests to generate a module for.
+
+    :param structs: An iterable of :class:`StructSpec` tuples. A structure can only refer to structures before it.
+    :param requests: An iterable of :class:`RequestSpec` tuples.
+    :param constants: An iterable of ``(name, value)`` tuples of integer constants to include in the module.
+    :param headers: The C headers that define the structures and requests, for :func:`verify`.
+    :param skipped: A list of ``(name, reason)`` tuples for definitions that could not be converted.
+
+    :ivar structs: A list of :class:`StructSpec` tuples.
+    :ivar requests: A list of :class:`RequestSpec` tuples.
+    :ivar constants: A list of ``(name, value)`` tuples.
+    :ivar headers: A list of header names. Names starting with ``/`` or ``.`` are included with quotes, others with angle brackets.
+    :ivar skipped: A list of ``(name, reason)`` tuples.
+    """
+
+    def __init__(self, structs=(), requests=(), constants=(), headers=(), skipped=()):
+        self.structs = list(structs)
+        self.requests = list(requests)
+        self.constants = list(constants)
+        self.headers = list(headers)
+        self.skipped = list(skipped)
+
+    @classmethod
+    def from_dict(cls, data):
+        """ Create a spec from a dictionary, as described in the module documentation.
+
+        :param data: The dictionary.
+        :return: A :class:`Spec`.
+        """
+
+        structs = []
+        for struct in data.get('structs', ()):
+            c_name = _normalize_type(struct['c_name'])
+            fields = []
+            for field in struct['fields']:
+                if len(field) not in (2, 3):
+                    raise ValueError('Invalid field in {}: {!r}'.format(c_name, field))
+                length = field[2] if len(field) == 3 else None
+                fields.append(Field(field[0], _normalize_type(field[1]), length))
+            structs.append(StructSpec(struct.get('name', _class_name(c_name)), c_name, tuple(fields), struct.get('pack')))
+        requests = []
+        for request in data.get('requests', ()):
+            direction = request.get('direction')
+            argtype = request.get('argtype')
+            request_type = request['type']
+            if isinstance(request_type, str):
+                request_type = ord(request_type)
+            helper = request.get('helper', 'pointer' if direction is not None and argtype is not None else None)
+            requests.append(RequestSpec(
+                request['name'],
+                direction,
+                request_type,
+                request['nr'],
+                None if argtype is None else _normalize_type(argtype),
+                helper,
+            ))
+        constants = [ tuple(constant) for constant in data.get('constants', ()) ]
+        return cls(structs, requests, constants, data.get('headers', ()))
+
+    def struct(self, c_name):
+        """ Find a structure by its C name.
+
+        :param c_name: The C name of the structure.
+        :return: A :class:`StructSpec`, or None if the spec does not have the structure.
+        """
+
+        c_name = _normalize_type(c_name)
+        for struct in self.structs:
+            if struct.c_name == c_name:
+                return struct
+        return None
+
+_comment_re = re.compile(r'/\*.*?\*/|//[^\n]*', re.S)
+_if0_re = re.compile(r'^[ \t]*#[ \t]*if[ \t]+0\b.*?^[ \t]*#[ \t]*endif\b', re.S | re.M)
+_define_re = re.compile(r'^[ \t]*#[ \t]*define[ \t]+(\w+)[ \t]+(.+?)[ \t]*$', re.M)
+_request_re = re.compile(r'^_IO(|R|W|WR)\s*\(\s*(.+?)\s*\)$', re.S)
+_struct_re = re.compile(r'\bstruct\s+(\w+)\s*\{([^{}]*)\}\s*((?:__attribute__\s*\(\(.*?\)\)\s*)?);', re.S)
+_declarator_re = re.compile(r'^(\w+)\s*(?:\[\s*(\w*)\s*\])?$')
+
+_DIRECTIONS = {
+    '': None,
+    'R': 'r',
+    'W': 'w',
+    'WR': 'rw',
+}
+
+def _parse_int(text, constants):
+    text = text.strip()
+    while text.startswith('(') and text.endswith(')'):
+        text = text[1:-1].strip()
+    if text in constants:
+        return constants[text]
+    match = re.match(r"^'(\\?.)'$", text)
+    if match:
+        return ord(ast.literal_eval(text))
+    match = re.match(r'^(0[xX][0-9a-fA-F]+|0[0-7]*|[1-9][0-9]*)[uUlL]*$', text)
+    if match:
+        return int(match.group(1), 0)
+    return None
+
+def _split_args(text):
+    args = []
+    depth = 0
+    current = ''
+    for char in text:
+        if char == ',' and depth == 0:
+            args.append(current.strip())
+            current = ''
+            continue
+        if char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        current += char
+    args.append(current.strip())
+    return args
+
+def _parse_type(text, constants):
+    """ Split a type like ``char[16]`` into the normalized base type and the array length. """
+
+    text = _normalize_type(text)
+    match = re.match(r'^(.+?)\s*\[\s*(\w+)\s*\]$', text)
+    if not match:
+        return text, None
+    length = _parse_int(match.group(2), constants)
+    if length is None:
+        raise ValueError('unknown array length {}'.format(match.group(2)))
+    return match.group(1), length
+
+def _parse_struct(name, body, attributes, constants, known):
+    fields = []
+    for declaration in body.split(';'):
+        declaration = ' '.join(declaration.split())
+        if not declaration:
+            continue
+        if ':' in declaration:
+            raise ValueError('bitfields are not supported')
+        match = re.match(r'^((?:(?:const|unsigned|signed|struct)\s+)*\w+(?:\s+(?:long|int)\b)*)\s+(.+)$', declaration)
+        if not match:
+            raise ValueError('unable to parse {!r}'.format(declaration))
+        c_type = _normalize_type(match.group(1))
+        if c_type not in _C_TYPES and c_type not in known:
+            raise ValueError('unsupported type {!r}'.format(c_type))
+        for declarator in match.group(2).split(','):
+            declarator = declarator.strip()
+            if declarator.startswith('*'):
+                raise ValueError('pointers are not supported')
+            decl = _declarator_re.match(declarator)
+            if not decl:
+                raise ValueError('unable to parse {!r}'.format(declarator))
+            length = None
+            if decl.group(2) is not None:
+                # A flexible array member takes no space in the structure.
+                length = _parse_int(decl.group(2), constants) if decl.group(2) else 0
+                if length is None:
+                    raise ValueError('unknown array length {}'.format(decl.group(2)))
+            fields.append(Field(decl.group(1), c_type, length))
+    pack = 1 if 'packed' in attributes else None
+    c_name = 'struct ' + name
+    return StructSpec(_class_name(c_name), c_name, tuple(fields), pack)
+
+def parse_header(text, include=None):
+    """ Create a spec from the definitions in a C header.
+
+    Integer constants, structures with fields of fundamental types, arrays and earlier
+    structures, and requests defined with ``_IO``, ``_IOR``, ``_IOW`` and ``_IOWR`` are
+    converted. Unions, nested definitions, bitfields, pointers and function-like macros
+    are listed in :attr:`Spec.skipped`, along with requests that use them.
+
+    Requests that pass an integer by value are declared with ``_IO`` or ``_IOW`` in the
+    headers, like those that pass a pointer. The generated helpers always pass a pointer,
+    so set the helper of those requests to ``'value'`` in the spec.
+
+    :param text: The contents of the header.
+    :param include: The name of the header for :func:`verify`, e.g. ``'linux/fs.h'``.
+    :return: A :class:`Spec`.
+    """
+
+    text = _comment_re.sub(' ', text.replace('\\\n', ' '))
+    text = _if0_re.sub(' ', text)
+    spec = Spec(headers=[include] if include else [])
+    constants = collections.OrderedDict()
+    known = set()
+
+    # Constants and structures are collected first, since requests can refer to later definitions.
+    defines = _define_re.findall(text)
+    for name, value in defines:
+        number = _parse_int(value, constants)
+        if number is not None:
+            constants[name] = number
+    for name, body, attributes in _struct_re.findall(text):
+        try:
+            struct = _parse_struct(name, body, attributes, constants, known)
+        except ValueError as e:
+            spec.skipped.append(('struct ' + name, str(e)))
+            continue
+        spec.structs.append(struct)
+        known.add(struct.c_name)
+
+    for name, value in defines:
+        match = _request_re.match(value)
+        if not match:
+            continue
+        args = _split_args(match.group(2))
+        direction = _DIRECTIONS[match.group(1)]
+        if len(args) != (2 if direction is None else 3):
+            spec.skipped.append((name, 'wrong number of arguments'))
+            continue
+        request_type = _parse_int(args[0], constants)
+        request_nr = _parse_int(args[1], constants)
+        if request_type is None or request_nr is None:
+            spec.skipped.append((name, 'unable to evaluate {!r}'.format(value)))
+            continue
+        argtype = None
+        if direction is not None:
+            try:
+                base, length = _parse_type(args[2], constants)
+            except ValueError as e:
+                spec.skipped.append((name, str(e)))
+                continue
+            if base not in _C_TYPES and base not in known:
+                spec.skipped.append((name, 'unsupported type {!r}'.format(base)))
+                continue
+            argtype = base if length is None else '{}[{}]'.format(base, length)
+        helper = 'pointer' if argtype is not None and '[' not in argtype else None
+        spec.requests.append(RequestSpec(name, direction, request_type, request_nr, argtype, helper))
+
+    spec.constants = [ (name, value) for name, value in constants.items() if not name.startswith('_') ]
+    return spec
+
+def load_spec(path, include=None):
+    """ Load a spec from a JSON file or a C header.
+
+    :param path: The path of a ``.json`` file with a spec dictionary, or of a C header.
+    :param include: The name of the header for :func:`verify`. Defaults to the absolute path of the header.
+    :return: A :class:`Spec`.
+    """
+
+    with open(path) as f:
+        text = f.read()
+    if path.endswith('.json'):
+        return Spec.from_dict(json.loads(text))
+    return parse_header(text, include=include or os.path.abspath(path))
+
+def _build_types(spec):
+    """ Create the ctypes classes for the structures of a spec. Returns a dictionary mapping C names to types. """
+
+    types = {}
+    for struct in spec.structs:
+        fields = []
+        for field in struct.fields:
+            datatype = _ctype(field.c_type, types)
+            if field.length is not None:
+                datatype = datatype * field.length
+            fields.append((field.name, datatype))
+        namespace = { '_fields_': fields }
+        if struct.pack is not None:
+            namespace['_pack_'] = struct.pack
+        types[struct.c_name] = type(struct.name, (ctypes.Structure,), namespace)
+    return types
+
+def _ctype(c_type, types):
+    if c_type in types:
+        return types[c_type]
+    if c_type in _C_TYPES:
+        return getattr(ctypes, _C_TYPES[c_type])
+    raise ValueError('Unknown type: {!r}'.format(c_type))
+
+def _argtype(argtype, types):
+    """ Get the ctypes type for the argument type of a request, which can be an array like ``char[16]``. """
+
+    base, length = _parse_type(argtype, {})
+    datatype = _ctype(base, types)
+    if length is not None:
+        datatype = datatype * length
+    return datatype
+
+def _requests(spec, types, arch):
+    requests = collections.OrderedDict()
+    for request in spec.requests:
+        size = 0 if request.argtype is None else ctypes.sizeof(_argtype(request.argtype, types))
+        requests[request.name] = linux.IOC(request.direction, request.request_type, request.request_nr, size, arch=arch)
+    return requests
+
+def layout(spec, arch=None):
+    """ Compute the sizes and field offsets of the structures, and the request numbers, of a spec.
+
+    The structure layouts are those of the native architecture, since they are computed with ctypes.
+
+    :param spec: The :class:`Spec`.
+    :param arch: The architecture to compute the request numbers for. Defaults to the native architecture.
+    :return: A dictionary with the same keys as the output of the program from :func:`probe_source`.
+    """
+
+    types = _build_types(spec)
+    values = collections.OrderedDict()
+    for struct in spec.structs:
+        datatype = types[struct.c_name]
+        values['sizeof:' + struct.c_name] = ctypes.sizeof(datatype)
+        for field in struct.fields:
+            values['offsetof:{}.{}'.format(struct.c_name, field.name)] = getattr(datatype, field.name).offset
+    values.update(_requests(spec, types, arch))
+    return values
+
+def probe_source(spec):
+    """ Get the source of a C program that prints the values computed by :func:`layout`, using the C headers.
+
+    The program prints a Python dictionary literal, like ``tests/linux_ioctls.c``.
+
+    :param spec: The :class:`Spec`.
+    :return: The C source, as a string.
+    """
+
+    lines = [
+        '#include <stddef.h>',
+        '#include <stdio.h>',
+        '',
+    ]
+    for header in spec.headers:
+        if header.startswith(('/', '.')):
+            lines.append('#include "{}"'.format(header))
+        else:
+            lines.append('#include <{}>'.format(header))
+    lines.extend([
+        '',
+        'int main(void) {',
+        '  printf("{\\n");',
+    ])
+    for struct in spec.structs:
+        lines.append('  printf("  \'sizeof:{0}\': %zu,\\n", sizeof({0}));'.format(struct.c_name))
+        for field in struct.fields:
+            lines.append('  printf("  \'offsetof:{0}.{1}\': %zu,\\n", offsetof({0}, {1}));'.format(struct.c_name, field.name))
+    for request in spec.requests:
+        lines.append('  printf("  \'{0}\': 0x%08lx,\\n", (unsigned long){0});'.format(request.name))
+    lines.extend([
+        '  printf("}\\n");',
+        '  return 0;',
+        '}',
+        '',
+    ])
+    return '\n'.join(lines)
+
+def verify(spec, compiler='gcc', cflags=('-std=c99', '-Wall')):
+    """ Compare the values computed from a spec with the values from the C headers.
+
+    Compiles and runs the program from :func:`probe_source`.
+
+    :param spec: The :class:`Spec`.
+    :param compiler: The C compiler to use.
+    :param cflags: Extra arguments for the compiler.
+    :return: A list of :class:`Mismatch` tuples, which is empty if all values match.
+    """
+
+    source_fd, source_file = tempfile.mkstemp(suffix='.c')
+    exec_fd, exec_file = tempfile.mkstemp()
+    os.close(exec_fd)
+    try:
+        with os.fdopen(source_fd, 'w') as f:
+            f.write(probe_source(spec))
+        subprocess.check_output([compiler] + list(cflags) + ['-o', exec_file, source_file], stderr=subprocess.STDOUT)
+        output = subprocess.check_output([exec_file])
+    finally:
+        os.unlink(source_file)
+        os.unlink(exec_file)
+    expected = ast.literal_eval(output.decode('ascii'))
+    actual = layout(spec)
+    return [ Mismatch(key, expected[key], actual.get(key)) for key in expected if expected[key] != actual.get(key) ]
+
+_HELPERS = {
+    'r': 'ioctl_fn_ptr_r',
+    'w': 'ioctl_fn_ptr_w',
+    'rw': 'ioctl_fn_ptr_wr',
+}
+
+def _python_type(c_type, spec):
+    struct = spec.struct(c_type)
+    if struct is not None:
+        return struct.name
+    if c_type in _C_TYPES:
+        return 'ctypes.' + _C_TYPES[c_type]
+    raise ValueError('Unknown type: {!r}'.format(c_type))
+
+def generate(spec, arch=None, helpers=True, source=None):
+    """ Generate the source of a Python module for a spec.
+
+    The module only contains literals, class definitions and helper functions, so importing
+    it does not compute anything.
+
+    :param spec: The :class:`Spec`.
+    :param arch: The architecture to compute the request numbers for. Defaults to the native architecture.
+    :param helpers: Whether to create helper functions for the requests, named after the requests in lower case.
+    :param source: A description of the source of the spec, for the module docstring.
+    :return: The source of the module, as a string.
+    """
+
+    types = _build_types(spec)
+    requests = _requests(spec, types, arch)
+    arch = arch or platform.machine()
+
+    lines = [
+        '""" ioctl definitions generated from {}.'.format(source or ', '.join(spec.headers) or 'a spec'),
+        '',
+        'Generated by ioctl.codegen for {}. Do not edit.'.format(arch),
+        '"""',
+        'import ctypes',
+        '',
+    ]
+    if helpers:
+        lines.extend(['import ioctl', ''])
+    lines.extend(['ARCH = {!r}'.format(arch), ''])
+
+    for name, value in spec.constants:
+        lines.append('{} = {}'.format(name, value))
+    if spec.constants:
+        lines.append('')
+
+    for struct in spec.structs:
+        lines.extend([
+            'class {}(ctypes.Structure):'.format(struct.name),
+            '    """ ``{}`` ({} bytes). """'.format(struct.c_name, ctypes.sizeof(types[struct.c_name])),
+            '',
+        ])
+        if struct.pack is not None:
+            lines.append('    _pack_ = {}'.format(struct.pack))
+        lines.append('    _fields_ = [')
+        for field in struct.fields:
+            datatype = _python_type(field.c_type, spec)
+            if field.length is not None:
+                datatype = '{} * {}'.format(datatype, field.length)
+            lines.append('        ({!r}, {}),'.format(field.name, datatype))
+        lines.extend(['    ]', ''])
+
+    for name, value in requests.items():
+        lines.append('{} = 0x{:08x}'.format(name, value))
+    if requests:
+        lines.append('')
+
+    if helpers:
+        helper_lines = []
+        for request in spec.requests:
+            if request.helper is None:
+                continue
+            base, length = _parse_type(request.argtype, {})
+            if length is not None:
+                raise ValueError('{} takes an array, which is not supported by helpers'.format(request.name))
+            if request.helper == 'value':
+                fn = 'ioctl_fn_w'
+            elif request.helper == 'pointer':
+                fn = _HELPERS[request.direction]
+            else:
+                raise ValueError('Unknown helper for {}: {!r}'.format(request.name, request.helper))
+            helper_lines.append('{} = ioctl.{}({}, {})'.format(request.name.lower(), fn, request.name, _python_type(base, spec)))
+        if helper_lines:
+            lines.extend(helper_lines + [''])
+
+    while lines[-1] == '':
+        lines.pop()
+    return '\n'.join(lines) + '\n'
+
+def main(argv=None):
+    """ Command line interface. Run ``python -m ioctl.codegen --help`` for usage. """
+
+    parser = argparse.ArgumentParser(prog='python -m ioctl.codegen', description='Generate a Python module with ioctl definitions.')
+    parser.add_argument('spec', help='A .json spec file or a C header.')
+    parser.add_argument('-o', '--output', help='The file to write the module to. Defaults to standard output.')
+    parser.add_argument('--include', help='The name to include the header as in the verification program, e.g. linux/fs.h.')
+    parser.add_argument('--arch', help='The architecture to generate the request numbers for.')
+    parser.add_argument('--no-helpers', action='store_true', help='Do not create helper functions.')
+    parser.add_argument('--verify', action='store_true', help='Compare the values with a compiled C program before generating the module.')
+    parser.add_argument('--compiler', default='gcc', help='The C compiler for --verify.')
+    args = parser.parse_args(argv)
+
+    spec = load_spec(args.spec, include=args.include)
+    for name, reason in spec.skipped:
+        sys.stderr.write('Skipped {}: {}\n'.format(name, reason))
+    if args.verify:
+        mismatches = verify(spec, compiler=args.compiler)
+        for mismatch in mismatches:
+            sys.stderr.write('Mismatch {}: C headers {}, spec {}\n'.format(mismatch.key, mismatch.expected, mismatch.actual))
+        if mismatches:
+            return 1
+    source = generate(spec, arch=args.arch, helpers=not args.no_helpers, source=args.include or os.path.basename(args.spec))
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(source)
+    else:
+        sys.stdout.write(source)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,282 @@
+""" Capabilities and events of Linux input devices.
+
+:func:`get_capabilities` reads the identity, name, event type and code bitmaps, and
+absolute axis ranges of an input device. Devices of the same model report the same
+capabilities, so the result is cached by the identity returned by ``EVIOCGID``. Later
+calls for any device with the same identity only need a single ioctl() call.
+
+:class:`EventReader` reads ``struct input_event`` records in bulk into a preallocated
+array, either a ctypes array of :class:`InputEvent` or a NumPy structured array.
+
+:Example:
+  ::
+
+      import os
+      import ioctl.evdev
+      fd = os.open('/dev/input/event0', os.O_RDONLY)
+      caps = ioctl.evdev.get_capabilities(fd)
+      if ioctl.evdev.EV_ABS in caps.events:
+          print(caps.abs)
+      reader = ioctl.evdev.EventReader(fd)
+      for event in reader.events():
+          print(event.type, event.code, event.value)
+"""
+import collections
+import ctypes
+import os
+import struct
+import threading
+
+import ioctl
+from . import linux
+
+__all__ = (
+    'AbsInfo',
+    'Capabilities',
+    'EVIOCGABS',
+    'EVIOCGBIT',
+    'EVIOCGID',
+    'EVIOCGNAME',
+    'EVIOCGVERSION',
+    'EV_ABS',
+    'EV_FF',
+    'EV_KEY',
+    'EV_LED',
+    'EV_MSC',
+    'EV_REL',
+    'EV_REP',
+    'EV_SND',
+    'EV_SW',
+    'EV_SYN',
+    'Event',
+    'EventReader',
+    'InputAbsinfo',
+    'InputEvent',
+    'InputId',
+    'clear_cache',
+    'get_capabilities',
+)
+
+class InputId(ctypes.Structure):
+    """ ``struct input_id`` from ``<linux/input.h>``. """
+
+    _fields_ = [
+        ('bustype', ctypes.c_uint16),
+        ('vendor', ctypes.c_uint16),
+        ('product', ctypes.c_uint16),
+        ('version', ctypes.c_uint16),
+    ]
+
+class InputAbsinfo(ctypes.Structure):
+    """ ``struct input_absinfo`` from ``<linux/input.h>``. """
+
+    _fields_ = [
+        ('value', ctypes.c_int32),
+        ('minimum', ctypes.c_int32),
+        ('maximum', ctypes.c_int32),
+        ('fuzz', ctypes.c_int32),
+        ('flat', ctypes.c_int32),
+        ('resolution', ctypes.c_int32),
+    ]
+
+class InputEvent(ctypes.Structure):
+    """ ``struct input_event`` from ``<linux/input.h>``. """
+
+    _fields_ = [
+        ('sec', ctypes.c_long),
+        ('usec', ctypes.c_long),
+        ('type', ctypes.c_uint16),
+        ('code', ctypes.c_uint16),
+        ('value', ctypes.c_int32),
+    ]
+
+EV_SYN = 0x00
+EV_KEY = 0x01
+EV_REL = 0x02
+EV_ABS = 0x03
+EV_MSC = 0x04
+EV_SW = 0x05
+EV_LED = 0x11
+EV_SND = 0x12
+EV_REP = 0x14
+EV_FF = 0x15
+EV_MAX = 0x1f
+
+# The highest code of each event type, which determines the size of its bitmap. EV_SYN
+# is missing since EVIOCGBIT(0) returns the bitmap of event types instead of its codes.
+_CODE_MAX = {
+    EV_KEY: 0x2ff,
+    EV_REL: 0x0f,
+    EV_ABS: 0x3f,
+    EV_MSC: 0x07,
+    EV_SW: 0x11,
+    EV_LED: 0x0f,
+    EV_SND: 0x07,
+    EV_REP: 0x01,
+    EV_FF: 0x7f,
+}
+
+EVIOCGVERSION = linux.IOR('E', 0x01, ctypes.c_int)
+EVIOCGID = linux.IOR('E', 0x02, ctypes.sizeof(InputId))
+
+def EVIOCGNAME(length):
+    """ Get the request number for reading the device name into a buffer of the given length. """
+
+    return linux.IOC('r', 'E', 0x06, length)
+
+def EVIOCGBIT(ev, length):
+    """ Get the request number for reading the bitmap of event type ``ev`` into a buffer of the given length.
+
+    Event type 0 returns the bitmap of supported event types.
+    """
+
+    return linux.IOC('r', 'E', 0x20 + ev, length)
+
+def EVIOCGABS(axis):
+    """ Get the request number for reading the range of an absolute axis. """
+
+    return linux.IOR('E', 0x40 + axis, ctypes.sizeof(InputAbsinfo))
+
+class AbsInfo(collections.namedtuple('AbsInfo', ('value', 'minimum', 'maximum', 'fuzz', 'flat', 'resolution'))):
+    """ The range of an absolute axis. """
+
+    __slots__ = ()
+
+class Capabilities(collections.namedtuple('Capabilities', ('id', 'name', 'events', 'abs'))):
+    """ The capabilities of an input device.
+
+    :ivar id: The ``(bustype, vendor, product, version)`` tuple returned by ``EVIOCGID``.
+    :ivar name: The name of the device, as bytes.
+    :ivar events: A dictionary mapping each supported event type to a frozenset of the supported codes.
+    :ivar abs: A dictionary mapping each absolute axis to its :class:`AbsInfo`. The value is the value when the capabilities were read.
+    """
+
+    __slots__ = ()
+
+class Event(collections.namedtuple('Event', ('sec', 'usec', 'type', 'code', 'value'))):
+    """ An input event, as returned by :meth:`EventReader.events`. """
+
+    __slots__ = ()
+
+_event = struct.Struct('@llHHi')
+
+_eviocgid = ioctl.compile(EVIOCGID, InputId, 'r')
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+def clear_cache():
+    """ Forget all cached capabilities. """
+
+    with _cache_lock:
+        _cache.clear()
+
+def _bits(fd, ev, max_code):
+    words = max_code // (8 * ctypes.sizeof(ctypes.c_ulong)) + 1
+    data = (ctypes.c_ulong * words)()
+    ioctl.ioctl(fd, EVIOCGBIT(ev, ctypes.sizeof(data)), ctypes.byref(data))
+    word_bits = 8 * ctypes.sizeof(ctypes.c_ulong)
+    codes = []
+    for index, word in enumerate(data):
+        while word:
+            low = word & -word
+            codes.append(index * word_bits + low.bit_length() - 1)
+            word ^= low
+    return frozenset(code for code in codes if code <= max_code)
+
+def _read_capabilities(fd, input_id):
+    name = ctypes.create_string_buffer(256)
+    ioctl.ioctl(fd, EVIOCGNAME(ctypes.sizeof(name)), ctypes.byref(name))
+    events = {}
+    for ev in _bits(fd, 0, EV_MAX):
+        max_code = _CODE_MAX.get(ev)
+        events[ev] = _bits(fd, ev, max_code) if max_code is not None else frozenset()
+    absinfo = {}
+    for axis in sorted(events.get(EV_ABS, ())):
+        info = InputAbsinfo()
+        ioctl.ioctl(fd, EVIOCGABS(axis), ctypes.byref(info))
+        absinfo[axis] = AbsInfo(info.value, info.minimum, info.maximum, info.fuzz, info.flat, info.resolution)
+    return Capabilities(input_id, name.value, events, absinfo)
+
+def get_capabilities(fd, cache=True):
+    """ Get the capabilities of an input device.
+
+    :param fd: File descriptor of the input device.
+    :param cache: Whether to use and update the cache. The cache is keyed by the identity
+                  returned by ``EVIOCGID``, so it is shared by all devices of the same model.
+    :return: A :class:`Capabilities` tuple.
+    """
+
+    res = _eviocgid(fd)
+    input_id = (res.bustype, res.vendor, res.product, res.version)
+    if cache:
+        capabilities = _cache.get(input_id)
+        if capabilities is not None:
+            return capabilities
+    capabilities = _read_capabilities(fd, input_id)
+    if cache:
+        with _cache_lock:
+            _cache[input_id] = capabilities
+    return capabilities
+
+class EventReader(object):
+    """ Reader for input events in bulk.
+
+    Each :meth:`read` reads as many events as are available, up to the size of the
+    preallocated array, with a single system call.
+
+    :param f: The input device, as a file descriptor or an object with a ``fileno()`` method.
+    :param count: The maximum number of events to read at once.
+    :param numpy: Whether to read into a NumPy structured array instead of a ctypes array of :class:`InputEvent`.
+
+    :ivar buffer: The preallocated array.
+    """
+
+    def __init__(self, f, count=64, numpy=False):
+        if count < 1:
+            raise ValueError('count must be at least 1')
+        self.fd = f if isinstance(f, int) else f.fileno()
+        self.numpy = numpy
+        if numpy:
+            import numpy as np
+            from . import codec
+            self.buffer = np.zeros(count, dtype=codec.get_codec(InputEvent).numpy_dtype)
+        else:
+            self.buffer = (InputEvent * count)()
+
+    def _read(self):
+        n = os.readv(self.fd, [self.buffer])
+        count, rest = divmod(n, ctypes.sizeof(InputEvent))
+        if rest:
+            # Input devices only return whole events, so this is not an input device.
+            raise ValueError('Read {} bytes, which is not a whole number of input events'.format(n))
+        return count
+
+    def read(self):
+        """ Read the available events into the buffer.
+
+        Blocks until at least one event is available, unless the file descriptor is non-blocking.
+
+        :return: The events that were read, as a slice of the NumPy array, or a list of :class:`InputEvent` instances
+                 that refer to the ctypes array. An empty result means end of file.
+        :raises ValueError: If the read returned a partial event.
+        """
+
+        count = self._read()
+        return self.buffer[:count]
+
+    def events(self):
+        """ Iterate over the events until end of file.
+
+        :return: An iterator of :class:`Event` tuples.
+        :raises ValueError: If a read returned a partial event.
+        """
+
+        size = ctypes.sizeof(InputEvent)
+        view = memoryview(self.buffer).cast('B')
+        while True:
+            count = self._read()
+            if count == 0:
+                return
+            for event in _event.iter_unpack(view[:count * size]):
+                yield Event._make(event)
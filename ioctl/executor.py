@@ -0,0 +1,243 @@
+""" Run blocking ioctl() calls on a thread pool.
+
+Some ioctl() calls, such as ``BLKRRPART``, ``FIFREEZE`` or cache flushes, can block
+for a long time. :class:`IoctlExecutor` runs such calls on a bounded pool of worker
+threads, so that calls to many devices run concurrently.
+
+The C library is called through :class:`ctypes.CDLL` function pointers, and
+:func:`fcntl.ioctl` is used by the fcntl backend. Both release the GIL for the
+duration of the ioctl() system call, so calls on different worker threads really
+run in parallel.
+"""
+import collections
+import concurrent.futures
+import functools
+import os
+import stat
+import threading
+import time
+
+import ioctl
+
+__all__ = (
+    'GatherResult',
+    'IoctlExecutor',
+)
+
+class GatherResult(collections.namedtuple('GatherResult', ('results', 'errors'))):
+    """ Result of :meth:`IoctlExecutor.gather`.
+
+    :ivar results: The result of each call, or None if the call failed.
+    :ivar errors: The exception raised by each call, or None if the call succeeded.
+    """
+
+    __slots__ = ()
+
+def _device_key(fd):
+    st = os.fstat(fd)
+    if stat.S_ISBLK(st.st_mode) or stat.S_ISCHR(st.st_mode):
+        return ('dev', st.st_rdev)
+    return ('inode', st.st_dev, st.st_ino)
+
+class _DeviceState(object):
+    __slots__ = ('active', 'pending')
+
+    def __init__(self):
+        self.active = 0
+        self.pending = collections.deque()
+
+class IoctlExecutor(object):
+    """ Executor for running ioctl() calls on a thread pool.
+
+    Calls are submitted with :meth:`submit` or :meth:`ioctl`, and return
+    :class:`concurrent.futures.Future` objects.
+
+    Calls are grouped by device. By default the device is identified by the device
+    number of device files, and by the inode of other files, but any hashable value can
+    be passed as the ``device`` parameter. If ``per_device_limit`` is set, at most that
+    many calls run concurrently for each device. Further calls for the same device
+    wait in a queue without occupying a worker thread.
+
+    :param max_workers: The maximum number of worker threads.
+    :param per_device_limit: The maximum number of concurrent calls per device, or None for no limit.
+
+    :Example:
+      ::
+
+          import ioctl
+          import ioctl.linux
+          from ioctl.executor import IoctlExecutor
+          BLKRRPART = ioctl.linux.IO(0x12, 95)
+          with IoctlExecutor(max_workers=16, per_device_limit=1) as executor:
+              futures = [ executor.ioctl(fd, BLKRRPART) for fd in fds ]
+              res = executor.gather(futures, timeout=60)
+    """
+
+    def __init__(self, max_workers=None, per_device_limit=None):
+        if per_device_limit is not None:
+            if not isinstance(per_device_limit, int):
+                raise TypeError('per_device_limit must be None or an integer, but was {}'.format(per_device_limit.__class__.__name__))
+            if per_device_limit < 1:
+                raise ValueError('per_device_limit must be at least 1')
+        self.per_device_limit = per_device_limit
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+        self._devices = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown(wait=True)
+        return False
+
+    def submit(self, fn, fd, *args, **kwargs):
+        """ Submit a call to the executor.
+
+        The function is called as ``fn(fd, *args)``. It can be :func:`ioctl.ioctl`,
+        a compiled call from :func:`ioctl.compile`, or any of the helper functions.
+
+        :param fn: The function to call.
+        :param fd: File descriptor to operate on.
+        :param args: Additional arguments to the function.
+        :param device: Keyword-only. The device the call operates on. Defaults to the device of the file descriptor.
+        :param timeout: Keyword-only. If the call has not started within this many seconds, it fails with
+                        :class:`concurrent.futures.TimeoutError` instead of running.
+        :return: A :class:`concurrent.futures.Future` for the result of the call.
+        """
+
+        device = kwargs.pop('device', None)
+        timeout = kwargs.pop('timeout', None)
+        if kwargs:
+            raise TypeError('Unexpected keyword arguments: {}'.format(', '.join(sorted(kwargs))))
+
+        future = concurrent.futures.Future()
+        if device is None and self.per_device_limit is not None:
+            try:
+                device = _device_key(fd)
+            except OSError as e:
+                # A bad file descriptor fails the call, like any other error of the call itself.
+                future.set_running_or_notify_cancel()
+                future.set_exception(e)
+                return future
+        deadline = time.monotonic() + timeout if timeout is not None else None
+
+        task = (future, fn, (fd,) + args, deadline)
+        with self._lock:
+            state = self._devices.get(device)
+            if state is None:
+                state = self._devices[device] = _DeviceState()
+            if self.per_device_limit is None or state.active < self.per_device_limit:
+                try:
+                    self._pool.submit(self._run, device, task)
+                except BaseException:
+                    if state.active == 0 and not state.pending:
+                        del self._devices[device]
+                    raise
+                state.active += 1
+            else:
+                state.pending.append(task)
+        return future
+
+    def ioctl(self, fd, request, *args, **kwargs):
+        """ Submit a :func:`ioctl.ioctl` call to the executor.
+
+        :param fd: File descriptor to operate on.
+        :param request: The ioctl request to call.
+        :param args: parameter to pass to ioctl.
+        :param kwargs: ``check`` and ``retry_eintr``, as for :func:`ioctl.ioctl`, and ``device`` and ``timeout``, as for :meth:`submit`.
+        :return: A :class:`concurrent.futures.Future` for the result of the call.
+        """
+
+        check = kwargs.pop('check', True)
+        retry_eintr = kwargs.pop('retry_eintr', False)
+        fn = ioctl.ioctl
+        if check is not True or retry_eintr is not False:
+            fn = functools.partial(ioctl.ioctl, check=check, retry_eintr=retry_eintr)
+        return self.submit(fn, fd, request, *args, **kwargs)
+
+    def map(self, fn, fds, *args, **kwargs):
+        """ Submit the same call for many file descriptors.
+
+        :param fn: The function to call, as for :meth:`submit`.
+        :param fds: An iterable of file descriptors.
+        :param args: Additional arguments passed to every call.
+        :param kwargs: ``timeout``, as for :meth:`submit`.
+        :return: A list of :class:`concurrent.futures.Future` objects, in the same order as the file descriptors.
+        """
+
+        return [ self.submit(fn, fd, *args, **kwargs) for fd in fds ]
+
+    def gather(self, futures, timeout=None):
+        """ Wait for many calls and collect their results.
+
+        Calls that have not completed within the timeout are cancelled if they have not
+        started yet, and reported with a :class:`concurrent.futures.TimeoutError`.
+
+        :param futures: An iterable of futures returned by this executor.
+        :param timeout: The maximum number of seconds to wait, or None to wait for all calls.
+        :return: A :class:`GatherResult`, with results and errors in the same order as the futures.
+        """
+
+        futures = list(futures)
+        concurrent.futures.wait(futures, timeout=timeout)
+        results = []
+        errors = []
+        for future in futures:
+            if not future.done():
+                future.cancel()
+                results.append(None)
+                errors.append(concurrent.futures.TimeoutError('ioctl() call did not complete in time'))
+            elif future.cancelled():
+                results.append(None)
+                errors.append(concurrent.futures.CancelledError())
+            elif future.exception() is not None:
+                results.append(None)
+                errors.append(future.exception())
+            else:
+                results.append(future.result())
+                errors.append(None)
+        return GatherResult(results, errors)
+
+    def shutdown(self, wait=True):
+        """ Shut down the executor.
+
+        :param wait: Whether to wait for submitted calls to complete.
+        """
+
+        if not wait:
+            with self._lock:
+                for state in self._devices.values():
+                    for future, fn, args, deadline in state.pending:
+                        future.cancel()
+        self._pool.shutdown(wait=wait)
+
+    def _run(self, device, task):
+        # Calls queued for the same device run on this worker thread once this call completes.
+        while task is not None:
+            self._execute(task)
+            task = self._next(device)
+
+    def _execute(self, task):
+        future, fn, args, deadline = task
+        if not future.set_running_or_notify_cancel():
+            return
+        if deadline is not None and time.monotonic() > deadline:
+            future.set_exception(concurrent.futures.TimeoutError('ioctl() call did not start in time'))
+            return
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+
+    def _next(self, device):
+        with self._lock:
+            state = self._devices[device]
+            if state.pending:
+                return state.pending.popleft()
+            state.active -= 1
+            if state.active == 0:
+                del self._devices[device]
+            return None
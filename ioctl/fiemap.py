@@ -0,0 +1,175 @@
+""" Read the extent layout of files with ``FS_IOC_FIEMAP``.
+
+:func:`iter_extents` walks the extents of a file in chunks. It reuses one buffer for all
+calls, and continues each call from the end of the last extent returned by the previous
+call, so files with millions of extents are mapped with constant memory.
+
+:Example:
+  ::
+
+      import os
+      import ioctl.fiemap
+      fd = os.open('/data/big.img', os.O_RDONLY)
+      fragments = sum(1 for extent in ioctl.fiemap.iter_extents(fd))
+"""
+import collections
+import ctypes
+import struct
+
+import ioctl
+from . import linux
+
+__all__ = (
+    'Extent',
+    'FIEMAP_EXTENT_DATA_ENCRYPTED',
+    'FIEMAP_EXTENT_DATA_INLINE',
+    'FIEMAP_EXTENT_DATA_TAIL',
+    'FIEMAP_EXTENT_DELALLOC',
+    'FIEMAP_EXTENT_ENCODED',
+    'FIEMAP_EXTENT_LAST',
+    'FIEMAP_EXTENT_MERGED',
+    'FIEMAP_EXTENT_NOT_ALIGNED',
+    'FIEMAP_EXTENT_SHARED',
+    'FIEMAP_EXTENT_UNKNOWN',
+    'FIEMAP_EXTENT_UNWRITTEN',
+    'FIEMAP_FLAG_CACHE',
+    'FIEMAP_FLAG_SYNC',
+    'FIEMAP_FLAG_XATTR',
+    'FIEMAP_MAX_OFFSET',
+    'FS_IOC_FIEMAP',
+    'Fiemap',
+    'FiemapExtent',
+    'iter_extent_chunks',
+    'iter_extents',
+)
+
+class Fiemap(ctypes.Structure):
+    """ ``struct fiemap`` from ``<linux/fiemap.h>``, without the extent array. """
+
+    _fields_ = [
+        ('fm_start', ctypes.c_uint64),
+        ('fm_length', ctypes.c_uint64),
+        ('fm_flags', ctypes.c_uint32),
+        ('fm_mapped_extents', ctypes.c_uint32),
+        ('fm_extent_count', ctypes.c_uint32),
+        ('fm_reserved', ctypes.c_uint32),
+    ]
+
+class FiemapExtent(ctypes.Structure):
+    """ ``struct fiemap_extent`` from ``<linux/fiemap.h>``. """
+
+    _fields_ = [
+        ('fe_logical', ctypes.c_uint64),
+        ('fe_physical', ctypes.c_uint64),
+        ('fe_length', ctypes.c_uint64),
+        ('fe_reserved64', ctypes.c_uint64 * 2),
+        ('fe_flags', ctypes.c_uint32),
+        ('fe_reserved', ctypes.c_uint32 * 3),
+    ]
+
+FS_IOC_FIEMAP = linux.IOWR('f', 11, ctypes.sizeof(Fiemap))
+
+FIEMAP_MAX_OFFSET = 2**64 - 1
+
+FIEMAP_FLAG_SYNC = 0x00000001
+FIEMAP_FLAG_XATTR = 0x00000002
+FIEMAP_FLAG_CACHE = 0x00000004
+
+FIEMAP_EXTENT_LAST = 0x00000001
+FIEMAP_EXTENT_UNKNOWN = 0x00000002
+FIEMAP_EXTENT_DELALLOC = 0x00000004
+FIEMAP_EXTENT_ENCODED = 0x00000008
+FIEMAP_EXTENT_DATA_ENCRYPTED = 0x00000080
+FIEMAP_EXTENT_NOT_ALIGNED = 0x00000100
+FIEMAP_EXTENT_DATA_INLINE = 0x00000200
+FIEMAP_EXTENT_DATA_TAIL = 0x00000400
+FIEMAP_EXTENT_UNWRITTEN = 0x00000800
+FIEMAP_EXTENT_MERGED = 0x00001000
+FIEMAP_EXTENT_SHARED = 0x00002000
+
+class Extent(collections.namedtuple('Extent', ('logical', 'physical', 'length', 'flags'))):
+    """ An extent of a file.
+
+    :ivar logical: The offset of the extent in the file, in bytes.
+    :ivar physical: The offset of the extent on the device, in bytes.
+    :ivar length: The length of the extent, in bytes.
+    :ivar flags: The ``FIEMAP_EXTENT_*`` flags of the extent.
+    """
+
+    __slots__ = ()
+
+_extent = struct.Struct('=QQQ16xI12x')
+
+_fiemap = ioctl.ioctl_fn_ptr_var(FS_IOC_FIEMAP, Fiemap, FiemapExtent)
+
+_INITIAL_CHUNK = 32
+
+def iter_extent_chunks(fd, start=0, length=FIEMAP_MAX_OFFSET, flags=0, chunk_size=1024, numpy=False):
+    """ Read the extents of a file in chunks.
+
+    The extents are requested with as many calls as necessary, each returning at most
+    ``chunk_size`` extents. The first calls request fewer extents, so that small files
+    only need a small buffer.
+
+    :param fd: File descriptor of the file.
+    :param start: The offset in the file to start at.
+    :param length: The number of bytes to map, from the start offset.
+    :param flags: ``FIEMAP_FLAG_*`` flags for the calls.
+    :param chunk_size: The maximum number of extents returned by each call.
+    :param numpy: Whether to return each chunk as a NumPy structured array with the fields of
+                  :class:`FiemapExtent`, instead of a list of :class:`Extent` tuples.
+    :return: An iterator of chunks of extents.
+    """
+
+    if not isinstance(chunk_size, int):
+        raise TypeError('chunk_size must be an integer, but was {}'.format(chunk_size.__class__.__name__))
+    if chunk_size < 1:
+        raise ValueError('chunk_size must be at least 1')
+
+    if numpy:
+        import numpy as np
+        from . import codec
+        dtype = codec.get_codec(FiemapExtent).numpy_dtype
+
+    end = min(start + length, FIEMAP_MAX_OFFSET)
+    count = min(_INITIAL_CHUNK, chunk_size)
+    buf = ioctl.VarBuffer(Fiemap, FiemapExtent, count)
+    while start < end:
+        header = buf.header
+        header.fm_start = start
+        header.fm_length = end - start
+        header.fm_flags = flags
+        header.fm_mapped_extents = 0
+        header.fm_extent_count = count
+        _fiemap(fd, buf)
+        mapped = header.fm_mapped_extents
+        if mapped == 0:
+            return
+        data = buf.item_bytes(mapped)
+        last = _extent.unpack_from(data, (mapped - 1) * buf.item_size)
+        if numpy:
+            yield np.frombuffer(data, dtype=dtype).copy()
+        else:
+            yield [ Extent._make(extent) for extent in _extent.iter_unpack(data) ]
+        logical, physical, extent_length, extent_flags = last
+        if extent_flags & FIEMAP_EXTENT_LAST:
+            return
+        start = logical + extent_length
+        if mapped == count and count < chunk_size:
+            count = min(2 * count, chunk_size)
+            buf.reserve(count)
+
+def iter_extents(fd, start=0, length=FIEMAP_MAX_OFFSET, flags=0, chunk_size=1024):
+    """ Read the extents of a file.
+
+    :param fd: File descriptor of the file.
+    :param start: The offset in the file to start at.
+    :param length: The number of bytes to map, from the start offset.
+    :param flags: ``FIEMAP_FLAG_*`` flags for the calls.
+    :param chunk_size: The maximum number of extents returned by each call.
+    :return: An iterator of :class:`Extent` tuples.
+    """
+
+    for chunk in iter_extent_chunks(fd, start, length, flags, chunk_size):
+        for extent in chunk:
+            yield extent
@@ -0,0 +1,274 @@
+""" Poll many devices with the same ioctl() call on a pool of processes.
+
+A single process can only make ioctl() calls from one core at a time. :class:`FleetPoller`
+splits a list of device paths into one shard per worker process. Each worker opens the
+devices of its shard once, and keeps them open between polls.
+
+The results do not travel back as pickled objects. The workers write the data and errno of
+each call directly into a block of shared memory, and only send a short message when their
+shard is done. :meth:`FleetPoller.poll` copies the results from that block into columns,
+like the result of :func:`ioctl.ioctl_many`.
+
+The call is given as an :class:`ioctl.IoctlCall`, which is pickled and compiled again in
+each worker.
+
+:Example:
+  ::
+
+      import ctypes
+      import ioctl
+      import ioctl.fleet
+      import ioctl.linux
+
+      BLKGETSIZE64 = ioctl.linux.IOR(0x12, 114, ctypes.c_size_t)
+      call = ioctl.compile(BLKGETSIZE64, ctypes.c_uint64, 'r', check=False)
+      with ioctl.fleet.FleetPoller(device_paths, call, processes=4) as poller:
+          res = poller.poll()
+          for path, size, err in zip(device_paths, res.values, res.errnos):
+              print(path, size, err)
+"""
+import array
+import ctypes
+import multiprocessing
+import os
+
+import ioctl
+from ._many import (
+    IoctlManyResult,
+    _values_column,
+)
+
+try:
+    from multiprocessing import shared_memory as _shared_memory
+except ImportError:
+    # Python < 3.8
+    _shared_memory = None
+
+__all__ = (
+    'FleetError',
+    'FleetPoller',
+)
+
+class FleetError(Exception):
+    """ Raised when a worker process fails. """
+
+def _default_context():
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
+def _layout(count, datatype):
+    """ Get the offset of the values column and the total size of the shared memory block. """
+
+    errnos_size = count * ctypes.sizeof(ctypes.c_int)
+    values_offset = (errnos_size + 15) & ~15
+    return values_offset, max(values_offset + count * ctypes.sizeof(datatype), 1)
+
+def _open(paths, flags):
+    fds = []
+    open_errnos = []
+    for path in paths:
+        try:
+            fds.append(os.open(path, flags))
+            open_errnos.append(0)
+        except OSError as e:
+            fds.append(-1)
+            open_errnos.append(e.errno)
+    return fds, open_errnos
+
+def _worker(conn, shm_name, start, paths, flags, call, total):
+    """ Main function of a worker process. """
+
+    fds = []
+    shm = None
+    try:
+        shm = _shared_memory.SharedMemory(shm_name)
+        datatype = call.datatype
+        size = ctypes.sizeof(datatype)
+        values_offset = _layout(total, datatype)[0]
+        count = len(paths)
+        errnos = (ctypes.c_int * count).from_buffer(shm.buf, start * ctypes.sizeof(ctypes.c_int))
+        slots = [ datatype.from_buffer(shm.buf, values_offset + (start + index) * size) for index in range(count) ]
+        fds, open_errnos = _open(paths, flags)
+        conn.send(None)
+        while conn.recv():
+            for index, fd in enumerate(fds):
+                if fd < 0:
+                    errnos[index] = open_errnos[index]
+                    continue
+                err = call(fd, into=slots[index])[1]
+                if err:
+                    ctypes.memset(ctypes.addressof(slots[index]), 0, size)
+                errnos[index] = err
+            conn.send(None)
+    except Exception as e:
+        conn.send(e)
+    finally:
+        for fd in fds:
+            if fd >= 0:
+                os.close(fd)
+        # Release the views of the shared memory before closing it.
+        errnos = slots = None
+        if shm is not None:
+            shm.close()
+        conn.close()
+
+class FleetPoller(object):
+    """ Poller for the same ioctl() read call on many devices, using a pool of worker processes.
+
+    The call must be an :class:`ioctl.IoctlCall` with direction ``'r'``, compiled with
+    ``check=False``. Its datatype must be defined at module level, so that it can be pickled.
+
+    The values of failed calls are 0. Devices that could not be opened are reported with the
+    errno of the failed open() call.
+
+    :param paths: The paths of the devices.
+    :param call: The :class:`ioctl.IoctlCall` to make for each device.
+    :param processes: The number of worker processes. Defaults to the number of CPUs.
+    :param flags: The flags for opening the devices.
+    :param numpy: Whether to return the result columns as NumPy arrays.
+    :param mp_context: The :mod:`multiprocessing` context to start the workers with. Defaults to the
+                       ``forkserver`` context where it is available, and to ``spawn`` elsewhere. A ``fork``
+                       context can be passed explicitly, but forking a process that runs other threads can
+                       deadlock the workers.
+
+    If a worker process fails, :meth:`poll` raises :class:`FleetError`, and the poller is broken:
+    every later call to :meth:`poll` raises :class:`FleetError` as well, until it is closed.
+
+    :ivar paths: The paths of the devices.
+    :ivar call: The call.
+    """
+
+    def __init__(self, paths, call, processes=None, flags=os.O_RDONLY, numpy=False, mp_context=None):
+        if _shared_memory is None:
+            raise NotImplementedError('FleetPoller requires multiprocessing.shared_memory')
+        if not isinstance(call, ioctl.IoctlCall):
+            raise TypeError('call must be an IoctlCall, but was {}'.format(call.__class__.__name__))
+        if call.direction != 'r' or not call.pointer:
+            raise ValueError('call must be a read call')
+        if call.check:
+            raise ValueError('call must be compiled with check=False')
+        if not isinstance(numpy, bool):
+            raise TypeError('numpy must be a boolean, but was {}'.format(numpy.__class__.__name__))
+        self.paths = list(paths)
+        self.call = call
+        self.numpy = numpy
+        count = len(self.paths)
+        if processes is None:
+            processes = os.cpu_count() or 1
+        processes = max(1, min(processes, count))
+
+        values_offset, size = _layout(count, call.datatype)
+        self._shm = _shared_memory.SharedMemory(create=True, size=size)
+        self._values = (call.datatype * count).from_buffer(self._shm.buf, values_offset)
+        self._errnos = (ctypes.c_int * count).from_buffer(self._shm.buf)
+        self._workers = []
+        self._error = None
+        context = mp_context or _default_context()
+        try:
+            for shard in range(processes):
+                start = count * shard // processes
+                end = count * (shard + 1) // processes
+                conn, child_conn = context.Pipe()
+                process = context.Process(
+                    target=_worker,
+                    args=(child_conn, self._shm.name, start, self.paths[start:end], flags, call, count),
+                    daemon=True,
+                )
+                process.start()
+                child_conn.close()
+                self._workers.append((process, conn))
+            self._wait()
+        except:
+            self.close()
+            raise
+
+    def _wait(self):
+        # Every worker is drained, so that a failure in one of them does not leave unread
+        # messages behind in the pipes of the others.
+        for process, conn in self._workers:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                message = 'exited unexpectedly'
+            else:
+                if message is None:
+                    continue
+                message = 'failed: {!r}'.format(message)
+            if self._error is None:
+                self._error = 'Worker process {} {}'.format(process.pid, message)
+        if self._error is not None:
+            raise FleetError(self._error)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def poll(self, out=None):
+        """ Make the call for all devices.
+
+        The workers write the results to shared memory, and they are copied from there to
+        the result columns with one copy per column. Like :func:`ioctl.ioctl_many`, values
+        for fundamental ctypes data types are returned as an :class:`array.array`, and other
+        data types as a ctypes array of the datatype.
+
+        :param out: A tuple ``(values, errnos)`` of preallocated columns to fill, as for :func:`ioctl.ioctl_many`.
+        :return: A :class:`ioctl.IoctlManyResult` with the ``values`` and ``errnos`` columns, in the order of the paths.
+        """
+
+        if self._shm is None:
+            raise ValueError('FleetPoller is closed')
+        if self._error is not None:
+            raise FleetError(self._error)
+        for process, conn in self._workers:
+            try:
+                conn.send(True)
+            except OSError:
+                # The worker is gone, which _wait() reports.
+                pass
+        self._wait()
+
+        count = len(self.paths)
+        datatype = self.call.datatype
+        if out is None:
+            values = value_data = (datatype * count)()
+            errnos = array.array('i', [0]) * count
+            errno_data = (ctypes.c_int * count).from_buffer(errnos)
+        else:
+            values, errnos = out
+            try:
+                value_data = (datatype * count).from_buffer(values)
+                errno_data = (ctypes.c_int * count).from_buffer(errnos)
+            except (TypeError, ValueError) as e:
+                raise ValueError('out must be a tuple of writable buffers with room for {} items: {}'.format(count, e))
+        ctypes.memmove(value_data, self._values, ctypes.sizeof(self._values))
+        ctypes.memmove(errno_data, self._errnos, ctypes.sizeof(self._errnos))
+        if out is not None:
+            return IoctlManyResult(values, errnos)
+        if self.numpy:
+            import numpy as np
+            return IoctlManyResult(np.ctypeslib.as_array(values), np.array(errnos, dtype=np.intc))
+        return IoctlManyResult(_values_column(values, datatype), errnos)
+
+    def close(self):
+        """ Stop the worker processes, and release the shared memory. """
+
+        for process, conn in self._workers:
+            try:
+                conn.send(False)
+            except (OSError, ValueError):
+                pass
+        for process, conn in self._workers:
+            process.join()
+            conn.close()
+        self._workers = []
+        if self._shm is not None:
+            self._values = self._errnos = None
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,426 @@
+""" Per-request latency and error instrumentation.
+
+Instrumentation is disabled by default, and then costs nothing. When enabled with
+:func:`enable`, every ioctl() call made through :func:`ioctl.ioctl`, the helper
+functions, :func:`ioctl.ioctl_many` and calls compiled without an explicit backend
+is recorded, keyed by request number:
+
+* The number of calls.
+* The number of failed calls, per errno.
+* The number of bytes transferred through pointer arguments.
+* A latency histogram with fixed memory use. Latencies are recorded in log-linear
+  buckets with 8 sub-buckets per power of two, which gives a relative error below 12.5%.
+
+Instrumentation works by pinning a wrapping backend with :func:`ioctl.backends.set_backend`.
+Each thread records into its own statistics, which are merged by :func:`snapshot`. When a
+thread exits, its statistics are folded into a shared total, so threads that come and go do
+not accumulate memory.
+
+:Example:
+  ::
+
+      import ioctl.instrument
+      ioctl.instrument.enable()
+      ...
+      print(ioctl.instrument.to_prometheus())
+"""
+import array
+import ctypes
+import json
+import threading
+import time
+import weakref
+
+from . import backends as _backends
+
+__all__ = (
+    'InstrumentedBackend',
+    'RequestStats',
+    'disable',
+    'enable',
+    'is_enabled',
+    'reset',
+    'snapshot',
+    'to_json',
+    'to_prometheus',
+)
+
+_SUB_BUCKET_BITS = 3
+_SUB_BUCKETS = 1 << _SUB_BUCKET_BITS
+_MAX_BITS = 42 # About 73 minutes in nanoseconds.
+_BUCKETS = (_MAX_BITS - _SUB_BUCKET_BITS + 1) * _SUB_BUCKETS
+
+def _bucket_index(ns):
+    if ns < 2 * _SUB_BUCKETS:
+        return ns if ns > 0 else 0
+    shift = ns.bit_length() - _SUB_BUCKET_BITS - 1
+    index = shift * _SUB_BUCKETS + (ns >> shift)
+    return index if index < _BUCKETS else _BUCKETS - 1
+
+def _bucket_upper_bound(index):
+    """ The largest latency, in nanoseconds, recorded in a bucket. """
+
+    if index < 2 * _SUB_BUCKETS:
+        return index
+    shift = index // _SUB_BUCKETS - 1
+    mantissa = index % _SUB_BUCKETS + _SUB_BUCKETS
+    return ((mantissa + 1) << shift) - 1
+
+class RequestStats(object):
+    """ Statistics for a single request number.
+
+    :ivar request: The request number.
+    :ivar count: The number of calls.
+    :ivar errors: The number of failed calls.
+    :ivar errnos: A dictionary mapping errno values to the number of calls that failed with that errno.
+    :ivar bytes: The number of bytes transferred through pointer arguments.
+    :ivar latency_sum: The total latency, in nanoseconds.
+    :ivar latency_min: The lowest latency, in nanoseconds.
+    :ivar latency_max: The highest latency, in nanoseconds.
+    :ivar buckets: The latency histogram, as an :class:`array.array` of counts.
+    """
+
+    __slots__ = (
+        'request',
+        'count',
+        'errors',
+        'errnos',
+        'bytes',
+        'latency_sum',
+        'latency_min',
+        'latency_max',
+        'buckets',
+    )
+
+    def __init__(self, request):
+        self.request = request
+        self.count = 0
+        self.errors = 0
+        self.errnos = {}
+        self.bytes = 0
+        self.latency_sum = 0
+        self.latency_min = None
+        self.latency_max = None
+        self.buckets = array.array('Q', [0]) * _BUCKETS
+
+    def _record(self, ns, err, size):
+        self.count += 1
+        self.latency_sum += ns
+        if self.latency_min is None or ns < self.latency_min:
+            self.latency_min = ns
+        if self.latency_max is None or ns > self.latency_max:
+            self.latency_max = ns
+        self.buckets[_bucket_index(ns)] += 1
+        if err:
+            self.errors += 1
+            self.errnos[err] = self.errnos.get(err, 0) + 1
+        else:
+            self.bytes += size
+
+    def _merge(self, other):
+        self.count += other.count
+        self.errors += other.errors
+        for err, count in list(other.errnos.items()):
+            self.errnos[err] = self.errnos.get(err, 0) + count
+        self.bytes += other.bytes
+        self.latency_sum += other.latency_sum
+        for value in (other.latency_min, other.latency_max):
+            if value is None:
+                continue
+            if self.latency_min is None or value < self.latency_min:
+                self.latency_min = value
+            if self.latency_max is None or value > self.latency_max:
+                self.latency_max = value
+        buckets = self.buckets
+        for index, count in enumerate(other.buckets):
+            if count:
+                buckets[index] += count
+
+    def percentile(self, q):
+        """ Estimate a latency percentile.
+
+        :param q: The percentile, between 0 and 100.
+        :return: The estimated latency in nanoseconds, or None if there are no calls.
+        """
+
+        if not 0 <= q <= 100:
+            raise ValueError('q must be between 0 and 100')
+        total = sum(self.buckets)
+        if total == 0:
+            return None
+        threshold = max(1, int(total * q / 100.0 + 0.5))
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= threshold:
+                return min(_bucket_upper_bound(index), self.latency_max)
+        return self.latency_max
+
+    def to_dict(self):
+        """ Convert the statistics to a dictionary of plain Python values. """
+
+        return {
+            'request': self.request,
+            'count': self.count,
+            'errors': self.errors,
+            'errnos': dict(self.errnos),
+            'bytes': self.bytes,
+            'latency_ns': {
+                'sum': self.latency_sum,
+                'min': self.latency_min,
+                'max': self.latency_max,
+                'p50': self.percentile(50),
+                'p99': self.percentile(99),
+                'buckets': [ [_bucket_upper_bound(index), count] for index, count in enumerate(self.buckets) if count ],
+            },
+        }
+
+def _merge_into(merged, shard):
+    for request, stats in list(shard.items()):
+        target = merged.get(request)
+        if target is None:
+            target = merged[request] = RequestStats(request)
+        target._merge(stats)
+
+class _Sentinel(object):
+    """ Object kept in a thread-local, which is released when its thread exits. """
+
+    __slots__ = ('__weakref__',)
+
+def _retire_shard(backend_ref, key):
+    backend = backend_ref()
+    if backend is not None:
+        backend._retire(key)
+
+class InstrumentedBackend(_backends.Backend):
+    """ Backend that records statistics for calls passed to another backend.
+
+    :param inner: The backend to pass calls to, or None to pick backends automatically.
+    """
+
+    name = 'instrumented'
+
+    def __init__(self, inner=None):
+        self.inner = inner
+        self._local = threading.local()
+        # The statistics of each live thread, and the merged statistics of threads that exited.
+        self._shards = {}
+        self._retired = {}
+        self._shards_lock = threading.Lock()
+
+    def _stats(self):
+        try:
+            return self._local.stats
+        except AttributeError:
+            stats = self._local.stats = {}
+            sentinel = self._local.sentinel = _Sentinel()
+            key = id(sentinel)
+            with self._shards_lock:
+                self._shards[key] = stats
+            finalizer = weakref.finalize(sentinel, _retire_shard, weakref.ref(self), key)
+            finalizer.atexit = False
+            return stats
+
+    def _retire(self, key):
+        """ Fold the statistics of a thread that exited into the retired statistics. """
+
+        with self._shards_lock:
+            shard = self._shards.pop(key, None)
+            if shard is not None:
+                _merge_into(self._retired, shard)
+
+    def _record(self, request, ns, err, size):
+        stats = self._stats()
+        record = stats.get(request)
+        if record is None:
+            record = stats[request] = RequestStats(request)
+        record._record(ns, err, size)
+
+    def _inner_for(self, kind, datatype):
+        if self.inner is None:
+            return _backends._auto_backend(kind, datatype)
+        return self.inner
+
+    def supports(self, kind, datatype):
+        return self.inner is None or self.inner.supports(kind, datatype)
+
+    def ioctl(self, fd, request, arg=None):
+        inner = self.inner
+        if inner is None:
+            inner = _backends.get_backend('ctypes')
+        size = ctypes.sizeof(arg) if arg is not None and not isinstance(arg, int) else 0
+        start = time.perf_counter_ns()
+        res = inner.ioctl(fd, request, arg)
+        elapsed = time.perf_counter_ns() - start
+        if res < 0:
+            res = -inner.errno(res)
+            self._record(request, elapsed, -res, size)
+        else:
+            self._record(request, elapsed, 0, size)
+        return res
+
+    def bind(self, kind, datatype):
+        inner = self._inner_for(kind, datatype)
+        fn = inner.bind(kind, datatype)
+        size = ctypes.sizeof(datatype) if kind == 'pointer' else 0
+        record = self._record
+        perf_counter_ns = time.perf_counter_ns
+        def instrumented(fd, request, arg):
+            start = perf_counter_ns()
+            res = fn(fd, request, arg)
+            elapsed = perf_counter_ns() - start
+            if res < 0:
+                res = -inner.errno(res)
+                record(request, elapsed, -res, size)
+            else:
+                record(request, elapsed, 0, size)
+            return res
+        return instrumented
+
+    def snapshot(self):
+        """ Merge the statistics of all threads.
+
+        :return: A dictionary mapping request numbers to :class:`RequestStats` objects.
+        """
+
+        merged = {}
+        with self._shards_lock:
+            shards = list(self._shards.values())
+            _merge_into(merged, self._retired)
+        for shard in shards:
+            _merge_into(merged, shard)
+        return merged
+
+    def reset(self):
+        """ Discard all recorded statistics. """
+
+        with self._shards_lock:
+            for shard in self._shards.values():
+                shard.clear()
+            self._retired = {}
+
+_instrumented = None
+
+def enable():
+    """ Enable instrumentation.
+
+    Calls are passed on to the backend that was pinned before instrumentation was enabled,
+    or to automatically selected backends if no backend was pinned.
+    Enabling instrumentation again keeps the statistics recorded so far.
+    """
+
+    global _instrumented
+    if _instrumented is not None and _backends.pinned_backend() is _instrumented:
+        return
+    _instrumented = InstrumentedBackend(_backends.pinned_backend())
+    _backends.set_backend(_instrumented)
+
+def disable():
+    """ Disable instrumentation.
+
+    The backend that was pinned before instrumentation was enabled is restored.
+    The recorded statistics are kept until :func:`reset` is called.
+    """
+
+    if _instrumented is not None and _backends.pinned_backend() is _instrumented:
+        _backends.set_backend(_instrumented.inner)
+
+def is_enabled():
+    """ Check whether instrumentation is enabled. """
+
+    return _instrumented is not None and _backends.pinned_backend() is _instrumented
+
+def snapshot():
+    """ Get the recorded statistics.
+
+    :return: A dictionary mapping request numbers to :class:`RequestStats` objects.
+    """
+
+    if _instrumented is None:
+        return {}
+    return _instrumented.snapshot()
+
+def reset():
+    """ Discard all recorded statistics. """
+
+    if _instrumented is not None:
+        _instrumented.reset()
+
+def to_json(stats=None):
+    """ Export statistics as JSON.
+
+    :param stats: The statistics to export, as returned by :func:`snapshot`. Defaults to a new snapshot.
+    :return: A JSON document with a list of per-request statistics.
+    """
+
+    if stats is None:
+        stats = snapshot()
+    from . import linux
+    entries = []
+    for request in sorted(stats):
+        entry = stats[request].to_dict()
+        entry['name'] = linux.registry.lookup(request)
+        entries.append(entry)
+    return json.dumps(entries, sort_keys=True)
+
+# Prometheus histogram bucket boundaries, in seconds.
+_PROMETHEUS_BUCKETS = (
+    1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4,
+    1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0,
+)
+
+def to_prometheus(stats=None):
+    """ Export statistics in the Prometheus text exposition format.
+
+    :param stats: The statistics to export, as returned by :func:`snapshot`. Defaults to a new snapshot.
+    :return: The metrics, as a string.
+    """
+
+    import errno as errno_module
+    if stats is None:
+        stats = snapshot()
+    from . import linux
+
+    def labels(request, **extra):
+        values = [ ('request', '0x{:08x}'.format(request)) ]
+        name = linux.registry.lookup(request)
+        if name is not None:
+            values.append(('name', name))
+        values.extend(sorted(extra.items()))
+        return '{' + ','.join('{}="{}"'.format(k, v) for k, v in values) + '}'
+
+    lines = [
+        '# HELP ioctl_calls_total Number of ioctl() calls.',
+        '# TYPE ioctl_calls_total counter',
+    ]
+    for request in sorted(stats):
+        lines.append('ioctl_calls_total{} {}'.format(labels(request), stats[request].count))
+    lines.extend([
+        '# HELP ioctl_errors_total Number of failed ioctl() calls.',
+        '# TYPE ioctl_errors_total counter',
+    ])
+    for request in sorted(stats):
+        for err, count in sorted(stats[request].errnos.items()):
+            errno_name = errno_module.errorcode.get(err, str(err))
+            lines.append('ioctl_errors_total{} {}'.format(labels(request, errno=errno_name), count))
+    lines.extend([
+        '# HELP ioctl_bytes_total Number of bytes transferred by ioctl() calls.',
+        '# TYPE ioctl_bytes_total counter',
+    ])
+    for request in sorted(stats):
+        lines.append('ioctl_bytes_total{} {}'.format(labels(request), stats[request].bytes))
+    lines.extend([
+        '# HELP ioctl_latency_seconds Latency of ioctl() calls.',
+        '# TYPE ioctl_latency_seconds histogram',
+    ])
+    for request in sorted(stats):
+        entry = stats[request]
+        bounds = [ (_bucket_upper_bound(index), count) for index, count in enumerate(entry.buckets) if count ]
+        for le in _PROMETHEUS_BUCKETS:
+            cumulative = sum(count for bound, count in bounds if bound <= le * 1e9)
+            lines.append('ioctl_latency_seconds_bucket{} {}'.format(labels(request, le=repr(le)), cumulative))
+        lines.append('ioctl_latency_seconds_bucket{} {}'.format(labels(request, le='+Inf'), entry.count))
+        lines.append('ioctl_latency_seconds_sum{} {!r}'.format(labels(request), entry.latency_sum / 1e9))
+        lines.append('ioctl_latency_seconds_count{} {}'.format(labels(request), entry.count))
+    return '\n'.join(lines) + '\n'
@@ -1,13 +1,19 @@
+import array
 import ctypes
-import fcntl
-import platform
 
 __all__ = (
     'IOC',
+    'IOC_DIR',
+    'IOC_NR',
+    'IOC_SIZE',
+    'IOC_TYPE',
+    'IOC_many',
     'IO',
     'IOR',
     'IOW',
     'IOWR',
+    'IoctlRegistry',
+    'registry',
 )
 
 class _IoctlGeneric(object):
@@ -19,17 +25,27 @@ class _IoctlGeneric(object):
     _IOC_WRITE = 1
     _IOC_READ = 2
 
+    @classmethod
+    def _init_shifts(cls):
+        cls._IOC_NRSHIFT = 0
+        cls._IOC_TYPESHIFT = cls._IOC_NRSHIFT + cls._IOC_NRBITS
+        cls._IOC_SIZESHIFT = cls._IOC_TYPESHIFT + cls._IOC_TYPEBITS
+        cls._IOC_DIRSHIFT = cls._IOC_SIZESHIFT + cls._IOC_SIZEBITS
+        cls._IOC_DIRECTIONS = {
+            None: cls._IOC_NONE,
+            'r': cls._IOC_READ,
+            'w': cls._IOC_WRITE,
+            'rw': cls._IOC_READ | cls._IOC_WRITE,
+        }
+        cls._IOC_DIRECTION_NAMES = dict((v, k) for k, v in cls._IOC_DIRECTIONS.items())
+
     @classmethod
     def ioc(cls, direction, request_type, request_nr, size):
-        _IOC_NRSHIFT = 0
-        _IOC_TYPESHIFT = _IOC_NRSHIFT + cls._IOC_NRBITS
-        _IOC_SIZESHIFT = _IOC_TYPESHIFT + cls._IOC_TYPEBITS
-        _IOC_DIRSHIFT = _IOC_SIZESHIFT + cls._IOC_SIZEBITS
         return (
-            (direction << _IOC_DIRSHIFT) |
-            (request_type << _IOC_TYPESHIFT) |
-            (request_nr << _IOC_NRSHIFT) |
-            (size << _IOC_SIZESHIFT)
+            (direction << cls._IOC_DIRSHIFT) |
+            (request_type << cls._IOC_TYPESHIFT) |
+            (request_nr << cls._IOC_NRSHIFT) |
+            (size << cls._IOC_SIZESHIFT)
             )
 
 class _IoctlAlpha(_IoctlGeneric):
@@ -83,9 +99,19 @@ _machine_ioctl_map = {
     'sparc64': _IoctlSparc,
 }
 
-def _machine_ioctl_calculator():
-    machine = platform.machine()
-    return _machine_ioctl_map.get(machine, _IoctlGeneric)
+for _calc in (_IoctlGeneric,) + tuple(_machine_ioctl_map.values()):
+    _calc._init_shifts()
+del _calc
+
+_native_calculator = None
+def _machine_ioctl_calculator(arch=None):
+    global _native_calculator
+    if arch is not None:
+        return _machine_ioctl_map.get(arch, _IoctlGeneric)
+    if _native_calculator is None:
+        import platform
+        _native_calculator = _machine_ioctl_map.get(platform.machine(), _IoctlGeneric)
+    return _native_calculator
 
 def _ioc_type_size(size):
     if isinstance(size, type) and issubclass(size, ctypes._SimpleCData):
@@ -108,7 +134,35 @@ def _ioc_request_type(request_type):
         raise ValueError('request_type must be an integer or a string, but was: {request_type_type}'
                          .format(request_type_type=request_type.__class__.__name__))
 
-def IOC(direction, request_type, request_nr, size):
+_IOC_CACHE_MAX = 4096
+_ioc_cache = {}
+
+def _ioc_uncached(arch, direction, request_type, request_nr, size):
+    calc = _machine_ioctl_calculator(arch)
+    try:
+        direction = calc._IOC_DIRECTIONS[direction]
+    except (KeyError, TypeError):
+        raise ValueError('direction must be None, \'r\', \'w\' or \'rw\'.')
+    request_type = _ioc_request_type(request_type)
+    size = _ioc_type_size(size)
+    return calc.ioc(direction, request_type, request_nr, size)
+
+def _ioc(arch, direction, request_type, request_nr, size):
+    key = (arch, direction, request_type, request_nr, size, request_nr.__class__, size.__class__)
+    try:
+        return _ioc_cache[key]
+    except KeyError:
+        pass
+    except TypeError:
+        # Unhashable parameter. Let the calculation report the error.
+        return _ioc_uncached(arch, direction, request_type, request_nr, size)
+    value = _ioc_uncached(arch, direction, request_type, request_nr, size)
+    if len(_ioc_cache) >= _IOC_CACHE_MAX:
+        _ioc_cache.clear()
+    _ioc_cache[key] = value
+    return value
+
+def IOC(direction, request_type, request_nr, size, arch=None):
     """ Python implementation of the ``_IOC(...)`` macro from Linux.
 
     This is a portable implementation of the ``_IOC(...)`` macro from Linux.
@@ -123,26 +177,13 @@ def IOC(direction, request_type, request_nr, size):
     :param request_type: The ioctl request type. This can be specified as either a string ``'R'`` or an integer ``123``.
     :param request_nr: The ioctl request number. This is an integer.
     :param size: The number of data bytes transferred in this ioctl.
+    :param arch: The machine type to calculate the request number for, as returned by :func:`platform.machine`. Defaults to the current machine.
     :return: The calculated ioctl request number.
     """
 
-    calc = _machine_ioctl_calculator()
-
-    if direction is None:
-        direction = calc._IOC_NONE
-    elif direction == 'r':
-        direction = calc._IOC_READ
-    elif direction == 'w':
-        direction = calc._IOC_WRITE
-    elif direction == 'rw':
-        direction = calc._IOC_READ | calc._IOC_WRITE
-    else:
-        raise ValueError('direction must be None, \'r\', \'w\' or \'rw\'.')
-
-    request_type = _ioc_request_type(request_type)
-    return calc.ioc(direction, request_type, request_nr, size)
+    return _ioc(arch, direction, request_type, request_nr, size)
 
-def IO(request_type, request_nr):
+def IO(request_type, request_nr, arch=None):
     """ Python implementation of the ``_IO(...)`` macro from Linux.
 
     This is a portable implementation of the ``_IO(...)`` macro from Linux.
@@ -150,14 +191,13 @@ def IO(request_type, request_nr):
 
     :param request_type: The ioctl request type. This can be specified as either a string ``'R'`` or an integer ``123``.
     :param request_nr: The ioctl request number. This is an integer.
+    :param arch: The machine type to calculate the request number for, as returned by :func:`platform.machine`. Defaults to the current machine.
     :return: The calculated ioctl request number.
     """
 
-    calc = _machine_ioctl_calculator()
-    request_type = _ioc_request_type(request_type)
-    return calc.ioc(calc._IOC_NONE, request_type, request_nr, 0)
+    return _ioc(arch, None, request_type, request_nr, 0)
 
-def IOR(request_type, request_nr, size):
+def IOR(request_type, request_nr, size, arch=None):
     """ Python implementation of the ``_IOR(...)`` macro from Linux.
 
     This is a portable implementation of the ``_IOR(...)`` macro from Linux.
@@ -166,15 +206,13 @@ def IOR(request_type, request_nr, size):
     :param request_type: The ioctl request type. This can be specified as either a string ``'R'`` or an integer ``123``.
     :param request_nr: The ioctl request number. This is an integer.
     :param size: The size of the associated data. This can either be an integer or a ctypes type.
+    :param arch: The machine type to calculate the request number for, as returned by :func:`platform.machine`. Defaults to the current machine.
     :return: The calculated ioctl request number.
     """
 
-    calc = _machine_ioctl_calculator()
-    request_type = _ioc_request_type(request_type)
-    size = _ioc_type_size(size)
-    return calc.ioc(calc._IOC_READ, request_type, request_nr, size)
+    return _ioc(arch, 'r', request_type, request_nr, size)
 
-def IOW(request_type, request_nr, size):
+def IOW(request_type, request_nr, size, arch=None):
     """ Python implementation of the ``_IOW(...)`` macro from Linux.
 
     This is a portable implementation of the ``_IOW(...)`` macro from Linux.
@@ -183,15 +221,13 @@ def IOW(request_type, request_nr, size):
     :param request_type: The ioctl request type. This can be specified as either a string ``'R'`` or an integer ``123``.
     :param request_nr: The ioctl request number. This is an integer.
     :param size: The size of the associated data. This can either be an integer or a ctypes type.
+    :param arch: The machine type to calculate the request number for, as returned by :func:`platform.machine`. Defaults to the current machine.
     :return: The calculated ioctl request number.
     """
 
-    calc = _machine_ioctl_calculator()
-    request_type = _ioc_request_type(request_type)
-    size = _ioc_type_size(size)
-    return calc.ioc(calc._IOC_WRITE, request_type, request_nr, size)
+    return _ioc(arch, 'w', request_type, request_nr, size)
 
-def IOWR(request_type, request_nr, size):
+def IOWR(request_type, request_nr, size, arch=None):
     """ Python implementation of the ``_IOWR(...)`` macro from Linux.
 
     This is a portable implementation of the ``_IOWR(...)`` macro from Linux.
@@ -200,10 +236,224 @@ def IOWR(request_type, request_nr, size):
     :param request_type: The ioctl request type. This can be specified as either a string ``'R'`` or an integer ``123``.
     :param request_nr: The ioctl request number. This is an integer.
     :param size: The size of the associated data. This can either be an integer or a ctypes type.
+    :param arch: The machine type to calculate the request number for, as returned by :func:`platform.machine`. Defaults to the current machine.
     :return: The calculated ioctl request number.
     """
 
-    calc = _machine_ioctl_calculator()
-    request_type = _ioc_request_type(request_type)
-    size = _ioc_type_size(size)
-    return calc.ioc(calc._IOC_READ|calc._IOC_WRITE, request_type, request_nr, size)
+    return _ioc(arch, 'rw', request_type, request_nr, size)
+
+def IOC_many(requests, arch=None):
+    """ Calculate many ioctl request numbers in one call.
+
+    This is equivalent to calling :func:`IOC` for each entry, but the machine type
+    is only resolved once, and the request numbers are not memoized.
+
+    :param requests: An iterable of ``(direction, request_type, request_nr, size)`` tuples, with the same meaning as the parameters to :func:`IOC`.
+    :param arch: The machine type to calculate the request numbers for, as returned by :func:`platform.machine`. Defaults to the current machine.
+    :return: An :class:`array.array` of the calculated ioctl request numbers.
+
+    :Example:
+      ::
+
+          import ioctl.linux
+          RNDGETENTCNT, RNDADDTOENTCNT = ioctl.linux.IOC_many([
+              ('r', 'R', 0x00, 4),
+              ('w', 'R', 0x01, 4),
+          ])
+    """
+
+    calc = _machine_ioctl_calculator(arch)
+    directions = calc._IOC_DIRECTIONS
+    dir_shift = calc._IOC_DIRSHIFT
+    type_shift = calc._IOC_TYPESHIFT
+    nr_shift = calc._IOC_NRSHIFT
+    size_shift = calc._IOC_SIZESHIFT
+
+    result = array.array('L')
+    append = result.append
+    for direction, request_type, request_nr, size in requests:
+        try:
+            direction = directions[direction]
+        except (KeyError, TypeError):
+            raise ValueError('direction must be None, \'r\', \'w\' or \'rw\'.')
+        if request_type.__class__ is not int:
+            request_type = _ioc_request_type(request_type)
+        if size.__class__ is not int:
+            size = _ioc_type_size(size)
+        append(
+            (direction << dir_shift) |
+            (request_type << type_shift) |
+            (request_nr << nr_shift) |
+            (size << size_shift)
+            )
+    return result
+
+def IOC_DIR(request, arch=None):
+    """ Python implementation of the ``_IOC_DIR(...)`` macro from Linux.
+
+    :param request: The ioctl request number.
+    :param arch: The machine type the request number was calculated for. Defaults to the current machine.
+    :return: The direction of data transfer, as ``None``, ``'r'``, ``'w'`` or ``'rw'``.
+             Direction bits that do not correspond to a direction on the machine type are returned as ``None``.
+    """
+
+    calc = _machine_ioctl_calculator(arch)
+    direction = (request >> calc._IOC_DIRSHIFT) & ((1 << calc._IOC_DIRBITS) - 1)
+    return calc._IOC_DIRECTION_NAMES.get(direction)
+
+def IOC_TYPE(request, arch=None):
+    """ Python implementation of the ``_IOC_TYPE(...)`` macro from Linux.
+
+    :param request: The ioctl request number.
+    :param arch: The machine type the request number was calculated for. Defaults to the current machine.
+    :return: The ioctl request type, as an integer.
+    """
+
+    calc = _machine_ioctl_calculator(arch)
+    return (request >> calc._IOC_TYPESHIFT) & ((1 << calc._IOC_TYPEBITS) - 1)
+
+def IOC_NR(request, arch=None):
+    """ Python implementation of the ``_IOC_NR(...)`` macro from Linux.
+
+    :param request: The ioctl request number.
+    :param arch: The machine type the request number was calculated for. Defaults to the current machine.
+    :return: The ioctl request number within the request type.
+    """
+
+    calc = _machine_ioctl_calculator(arch)
+    return (request >> calc._IOC_NRSHIFT) & ((1 << calc._IOC_NRBITS) - 1)
+
+def IOC_SIZE(request, arch=None):
+    """ Python implementation of the ``_IOC_SIZE(...)`` macro from Linux.
+
+    :param request: The ioctl request number.
+    :param arch: The machine type the request number was calculated for. Defaults to the current machine.
+    :return: The number of data bytes transferred by the ioctl.
+    """
+
+    calc = _machine_ioctl_calculator(arch)
+    return (request >> calc._IOC_SIZESHIFT) & ((1 << calc._IOC_SIZEBITS) - 1)
+
+_describe_macros = {
+    None: 'IO',
+    'r': 'IOR',
+    'w': 'IOW',
+    'rw': 'IOWR',
+}
+
+class IoctlRegistry(object):
+    """ A reverse-lookup index from ioctl request numbers to symbolic names.
+
+    Lookups are a single dictionary lookup, so the registry can be used to annotate
+    large numbers of request numbers, e.g. from traces.
+
+    :param arch: The machine type of the request numbers. Used by :meth:`describe` to decode unknown request numbers.
+
+    :Example:
+      ::
+
+          import ctypes
+          import ioctl.linux
+          registry = ioctl.linux.IoctlRegistry()
+          registry.register('RNDGETENTCNT', ioctl.linux.IOR('R', 0x00, ctypes.c_int))
+          registry.lookup(0x80045200) # 'RNDGETENTCNT'
+          registry.describe(0x40045201) # "IOW('R', 0x01, 4)"
+    """
+
+    def __init__(self, arch=None):
+        self.arch = arch
+        self._names = {}
+        self._aliases = {}
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, request):
+        return request in self._names
+
+    def register(self, name, request):
+        """ Register a symbolic name for a request number.
+
+        A request number can have several names. The first name registered is the primary name returned by :meth:`lookup`.
+
+        :param name: The symbolic name of the request.
+        :param request: The ioctl request number.
+        """
+
+        if not isinstance(name, str):
+            raise TypeError('name must be a string, but was {}'.format(name.__class__.__name__))
+        if not isinstance(request, int):
+            raise TypeError('request must be an integer, but was {}'.format(request.__class__.__name__))
+        names = self._aliases.setdefault(request, [])
+        if name not in names:
+            names.append(name)
+        self._names.setdefault(request, name)
+
+    def update(self, mapping):
+        """ Register many names at once.
+
+        :param mapping: A mapping or an iterable of ``(name, request)`` pairs.
+        """
+
+        if hasattr(mapping, 'items'):
+            mapping = mapping.items()
+        for name, request in mapping:
+            self.register(name, request)
+
+    def lookup(self, request, default=None):
+        """ Look up the primary name of a request number.
+
+        :param request: The ioctl request number.
+        :param default: The value returned for unknown request numbers.
+        :return: The name of the request, or ``default``.
+        """
+
+        return self._names.get(request, default)
+
+    def names(self, request):
+        """ Look up all names registered for a request number.
+
+        :param request: The ioctl request number.
+        :return: A tuple of names.
+        """
+
+        return tuple(self._aliases.get(request, ()))
+
+    def annotate(self, requests, default=None):
+        """ Look up the names of many request numbers.
+
+        :param requests: An iterable of request numbers.
+        :param default: The value used for unknown request numbers.
+        :return: A list of names, in the same order as the request numbers.
+        """
+
+        names = self._names
+        if default is None:
+            return list(map(names.get, requests))
+        return [ names.get(request, default) for request in requests ]
+
+    def describe(self, request):
+        """ Describe a request number.
+
+        :param request: The ioctl request number.
+        :return: The name of the request if it is registered, otherwise the decoded request number, e.g. ``"IOR('R', 0x00, 4)"``.
+        """
+
+        name = self._names.get(request)
+        if name is not None:
+            return name
+        direction = IOC_DIR(request, arch=self.arch)
+        request_type = IOC_TYPE(request, arch=self.arch)
+        request_nr = IOC_NR(request, arch=self.arch)
+        if 0x20 < request_type < 0x7f:
+            request_type = repr(chr(request_type))
+        else:
+            request_type = '0x{:02x}'.format(request_type)
+        macro = _describe_macros[direction]
+        if direction is None:
+            return '{macro}({request_type}, 0x{request_nr:02x})'.format(macro=macro, request_type=request_type, request_nr=request_nr)
+        size = IOC_SIZE(request, arch=self.arch)
+        return '{macro}({request_type}, 0x{request_nr:02x}, {size})'.format(macro=macro, request_type=request_type, request_nr=request_nr, size=size)
+
+registry = IoctlRegistry()
+"""The default :class:`IoctlRegistry` for the current machine."""
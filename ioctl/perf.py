@@ -0,0 +1,348 @@
+""" Count hardware and software events with ``perf_event_open()``.
+
+:class:`CounterGroup` opens a group of performance counters for the calling thread. The
+whole group is enabled, disabled and reset with a single ioctl() call on the group leader,
+using ``PERF_IOC_FLAG_GROUP``, and all counters are read with a single read() call into a
+buffer that is allocated once.
+
+Software events such as ``task-clock`` and ``context-switches`` are counted by the kernel,
+so they are available without hardware support. Whether unprivileged processes may count
+events depends on ``/proc/sys/kernel/perf_event_paranoid``. Counting user space events of
+the own process is usually allowed, which is why kernel events are excluded by default.
+
+:Example:
+  ::
+
+      import ioctl.perf
+
+      with ioctl.perf.CounterGroup(('task-clock', 'context-switches', 'page-faults')) as group:
+          with group.measure() as measurement:
+              run_workload()
+          print(measurement.reading.values)
+
+          @group.profile()
+          def handle(request):
+              ...
+
+          handle(request)
+          print(handle.calls, handle.totals)
+"""
+import collections
+import contextlib
+import ctypes
+import functools
+import os
+import platform
+
+import ioctl
+from . import _libc
+from . import backends as _backends
+from . import linux
+
+__all__ = (
+    'CounterGroup',
+    'EVENTS',
+    'Measurement',
+    'PERF_EVENT_IOC_DISABLE',
+    'PERF_EVENT_IOC_ENABLE',
+    'PERF_EVENT_IOC_ID',
+    'PERF_EVENT_IOC_RESET',
+    'PERF_IOC_FLAG_GROUP',
+    'PerfEventAttr',
+    'Reading',
+    'perf_event_open',
+)
+
+class PerfEventAttr(ctypes.Structure):
+    """ ``struct perf_event_attr`` from ``<linux/perf_event.h>``, up to ``PERF_ATTR_SIZE_VER5``.
+
+    The bitfield after ``read_format`` is represented by the ``flags`` field, which is a
+    combination of the ``FLAG_*`` constants of this module.
+    """
+
+    _fields_ = [
+        ('type', ctypes.c_uint32),
+        ('size', ctypes.c_uint32),
+        ('config', ctypes.c_uint64),
+        ('sample_period', ctypes.c_uint64),
+        ('sample_type', ctypes.c_uint64),
+        ('read_format', ctypes.c_uint64),
+        ('flags', ctypes.c_uint64),
+        ('wakeup_events', ctypes.c_uint32),
+        ('bp_type', ctypes.c_uint32),
+        ('config1', ctypes.c_uint64),
+        ('config2', ctypes.c_uint64),
+        ('branch_sample_type', ctypes.c_uint64),
+        ('sample_regs_user', ctypes.c_uint64),
+        ('sample_stack_user', ctypes.c_uint32),
+        ('clockid', ctypes.c_int32),
+        ('sample_regs_intr', ctypes.c_uint64),
+        ('aux_watermark', ctypes.c_uint32),
+        ('sample_max_stack', ctypes.c_uint16),
+        ('reserved_2', ctypes.c_uint16),
+    ]
+
+PERF_TYPE_HARDWARE = 0
+PERF_TYPE_SOFTWARE = 1
+
+FLAG_DISABLED = 1 << 0
+FLAG_INHERIT = 1 << 1
+FLAG_PINNED = 1 << 2
+FLAG_EXCLUSIVE = 1 << 3
+FLAG_EXCLUDE_USER = 1 << 4
+FLAG_EXCLUDE_KERNEL = 1 << 5
+FLAG_EXCLUDE_HV = 1 << 6
+FLAG_EXCLUDE_IDLE = 1 << 7
+
+PERF_FORMAT_TOTAL_TIME_ENABLED = 1 << 0
+PERF_FORMAT_TOTAL_TIME_RUNNING = 1 << 1
+PERF_FORMAT_ID = 1 << 2
+PERF_FORMAT_GROUP = 1 << 3
+
+PERF_FLAG_FD_CLOEXEC = 1 << 3
+
+PERF_EVENT_IOC_ENABLE = linux.IO('$', 0)
+PERF_EVENT_IOC_DISABLE = linux.IO('$', 1)
+PERF_EVENT_IOC_RESET = linux.IO('$', 3)
+# Defined as _IOR('$', 7, __u64 *), so the size in the request number is the size of a pointer.
+PERF_EVENT_IOC_ID = linux.IOR('$', 7, ctypes.c_void_p)
+
+PERF_IOC_FLAG_GROUP = 1
+
+EVENTS = {
+    'cycles': (PERF_TYPE_HARDWARE, 0),
+    'instructions': (PERF_TYPE_HARDWARE, 1),
+    'cache-references': (PERF_TYPE_HARDWARE, 2),
+    'cache-misses': (PERF_TYPE_HARDWARE, 3),
+    'branch-instructions': (PERF_TYPE_HARDWARE, 4),
+    'branch-misses': (PERF_TYPE_HARDWARE, 5),
+    'cpu-clock': (PERF_TYPE_SOFTWARE, 0),
+    'task-clock': (PERF_TYPE_SOFTWARE, 1),
+    'page-faults': (PERF_TYPE_SOFTWARE, 2),
+    'context-switches': (PERF_TYPE_SOFTWARE, 3),
+    'cpu-migrations': (PERF_TYPE_SOFTWARE, 4),
+    'minor-faults': (PERF_TYPE_SOFTWARE, 5),
+    'major-faults': (PERF_TYPE_SOFTWARE, 6),
+}
+
+# System call numbers of perf_event_open(), which has no wrapper in the C library.
+_syscall_numbers = {
+    'x86_64': 298,
+    'i386': 336,
+    'i686': 336,
+    'aarch64': 241,
+    'armv6l': 364,
+    'armv7l': 364,
+    'ppc64': 319,
+    'ppc64le': 319,
+    's390x': 331,
+    'riscv64': 241,
+}
+
+_enable = ioctl.compile(PERF_EVENT_IOC_ENABLE, ctypes.c_int, 'w', pointer=False)
+_disable = ioctl.compile(PERF_EVENT_IOC_DISABLE, ctypes.c_int, 'w', pointer=False)
+_reset = ioctl.compile(PERF_EVENT_IOC_RESET, ctypes.c_int, 'w', pointer=False)
+_id = ioctl.compile(PERF_EVENT_IOC_ID, ctypes.c_uint64, 'r')
+
+class Reading(collections.namedtuple('Reading', ('time_enabled', 'time_running', 'values'))):
+    """ The counters of a :class:`CounterGroup`.
+
+    :ivar time_enabled: The number of nanoseconds the group was enabled.
+    :ivar time_running: The number of nanoseconds the group was actually counting. This is less
+                        than ``time_enabled`` if the kernel had to multiplex hardware counters.
+    :ivar values: A dictionary mapping each event name to its count.
+    """
+
+    __slots__ = ()
+
+def _delta(after, before):
+    values = collections.OrderedDict((name, value - before.values[name]) for name, value in after.values.items())
+    return Reading(after.time_enabled - before.time_enabled, after.time_running - before.time_running, values)
+
+def perf_event_open(attr, pid=0, cpu=-1, group_fd=-1, flags=PERF_FLAG_FD_CLOEXEC):
+    """ Call the ``perf_event_open()`` system call.
+
+    :param attr: A :class:`PerfEventAttr`. Its size is filled in.
+    :param pid: The process or thread to count events of. 0 means the calling thread.
+    :param cpu: The CPU to count events on, or -1 for any CPU.
+    :param group_fd: The file descriptor of the group leader, or -1 to create a new group.
+    :param flags: ``PERF_FLAG_*`` flags.
+    :return: The file descriptor of the event.
+    """
+
+    number = _syscall_numbers.get(platform.machine())
+    if number is None:
+        raise NotImplementedError('perf_event_open() is not supported on {}'.format(platform.machine()))
+    attr.size = ctypes.sizeof(PerfEventAttr)
+    syscall = _libc.get_libc().syscall
+    fd = syscall(ctypes.c_long(number), ctypes.byref(attr), ctypes.c_int(pid), ctypes.c_int(cpu), ctypes.c_int(group_fd), ctypes.c_ulong(flags))
+    if fd < 0:
+        raise _backends._oserror(ctypes.get_errno())
+    return fd
+
+class Measurement(object):
+    """ The result of :meth:`CounterGroup.measure`.
+
+    :ivar reading: The :class:`Reading` with the events counted in the measured code, or None until the code has finished.
+    """
+
+    def __init__(self):
+        self.reading = None
+
+class CounterGroup(object):
+    """ Group of performance counters that are enabled, disabled and read together.
+
+    The counters count the events of the thread that creates the group. The group starts
+    disabled, and the counts start at zero.
+
+    :param events: The events to count, as names from :data:`EVENTS` or ``(type, config)`` tuples.
+                   The first event is the group leader.
+    :param pid: The process or thread to count events of. 0 means the calling thread.
+    :param cpu: The CPU to count events on, or -1 for any CPU.
+    :param exclude_kernel: Whether to exclude events in the kernel.
+    :param exclude_hv: Whether to exclude events in the hypervisor.
+
+    :ivar names: The names of the events.
+    :ivar fds: The file descriptors of the events.
+    :ivar ids: The kernel ids of the events.
+    :ivar enabled: Whether the group is enabled.
+    """
+
+    def __init__(self, events=('task-clock', 'context-switches'), pid=0, cpu=-1, exclude_kernel=True, exclude_hv=True):
+        self.names = []
+        self.fds = []
+        self.ids = []
+        self.enabled = False
+        configs = []
+        for event in events:
+            if isinstance(event, tuple):
+                name = '{}:{}'.format(*event)
+                configs.append((name, event))
+            elif event in EVENTS:
+                configs.append((event, EVENTS[event]))
+            else:
+                raise ValueError('Unknown event: {!r}'.format(event))
+        if not configs:
+            raise ValueError('events cannot be empty')
+
+        flags = 0
+        if exclude_kernel:
+            flags |= FLAG_EXCLUDE_KERNEL
+        if exclude_hv:
+            flags |= FLAG_EXCLUDE_HV
+        try:
+            for name, (event_type, config) in configs:
+                attr = PerfEventAttr()
+                attr.type = event_type
+                attr.config = config
+                attr.read_format = PERF_FORMAT_GROUP | PERF_FORMAT_ID | PERF_FORMAT_TOTAL_TIME_ENABLED | PERF_FORMAT_TOTAL_TIME_RUNNING
+                # Members follow the state of the leader, so only the leader starts disabled.
+                attr.flags = flags | (FLAG_DISABLED if not self.fds else 0)
+                fd = perf_event_open(attr, pid, cpu, self.fds[0] if self.fds else -1)
+                self.fds.append(fd)
+                self.names.append(name)
+                self.ids.append(_id(fd))
+        except:
+            self.close()
+            raise
+        # nr, time_enabled and time_running, followed by a value and an id for each event.
+        self._buffer = (ctypes.c_uint64 * (3 + 2 * len(self.fds)))()
+        self._positions = dict((event_id, index) for index, event_id in enumerate(self.ids))
+
+    @property
+    def leader(self):
+        """ The file descriptor of the group leader. """
+
+        return self.fds[0]
+
+    def enable(self):
+        """ Start counting. """
+
+        _enable(self.leader, PERF_IOC_FLAG_GROUP)
+        self.enabled = True
+
+    def disable(self):
+        """ Stop counting. The counts are kept. """
+
+        _disable(self.leader, PERF_IOC_FLAG_GROUP)
+        self.enabled = False
+
+    def reset(self):
+        """ Set all counts to zero. """
+
+        _reset(self.leader, PERF_IOC_FLAG_GROUP)
+
+    def read(self):
+        """ Read all counters.
+
+        :return: A :class:`Reading`.
+        """
+
+        buf = self._buffer
+        os.readv(self.leader, [buf])
+        values = [0] * len(self.names)
+        positions = self._positions
+        for offset in range(3, 3 + 2 * buf[0], 2):
+            values[positions[buf[offset + 1]]] = buf[offset]
+        return Reading(buf[1], buf[2], collections.OrderedDict(zip(self.names, values)))
+
+    @contextlib.contextmanager
+    def measure(self):
+        """ Count the events in a block of code.
+
+        The group is enabled for the block, unless it already is. The counts are the difference
+        between readings before and after the block, so measurements can be nested.
+
+        :return: A context manager that returns a :class:`Measurement`.
+        """
+
+        measurement = Measurement()
+        enable = not self.enabled
+        before = self.read()
+        if enable:
+            self.enable()
+        try:
+            yield measurement
+        finally:
+            if enable:
+                self.disable()
+            measurement.reading = _delta(self.read(), before)
+
+    def profile(self, report=None):
+        """ Decorator that counts the events in each call of a function.
+
+        The decorated function has a ``calls`` attribute with the number of calls, and a
+        ``totals`` attribute with a :class:`collections.Counter` of the total counts.
+
+        :param report: A function that is called with the decorated function and the :class:`Reading` after each call.
+        :return: The decorator.
+        """
+
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.measure() as measurement:
+                    result = fn(*args, **kwargs)
+                wrapper.calls += 1
+                wrapper.totals.update(measurement.reading.values)
+                if report is not None:
+                    report(fn, measurement.reading)
+                return result
+            wrapper.calls = 0
+            wrapper.totals = collections.Counter()
+            return wrapper
+        return decorator
+
+    def close(self):
+        """ Close the file descriptors of the events. """
+
+        for fd in reversed(self.fds):
+            os.close(fd)
+        self.fds = []
+        self.enabled = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,149 @@
+""" Read pipes and sockets in chunks sized by ``FIONREAD``.
+
+Reading a stream with a fixed chunk size either wastes memory on small messages, or
+needs several system calls for large bursts. :class:`PendingReader` asks the kernel how
+many bytes are pending with ``FIONREAD``, and reads exactly that many bytes into a ring of
+reusable buffers. The data is returned as :class:`memoryview` slices of the buffers,
+without copying.
+
+:Example:
+  ::
+
+      import ioctl.reader
+      reader = ioctl.reader.PendingReader(sock, coalesce=4096)
+      for data in reader:
+          ship(data)
+"""
+import ctypes
+import os
+import select
+import time
+
+import ioctl
+
+__all__ = (
+    'FIONREAD',
+    'PendingReader',
+)
+
+FIONREAD = 0x541B
+
+_fionread = ioctl.compile(FIONREAD, ctypes.c_int, 'r', scratch=True, retry_eintr=True)
+
+def _fileno(f):
+    if isinstance(f, int):
+        return f
+    return f.fileno()
+
+class PendingReader(object):
+    """ Reader that reads all pending data of a pipe or socket with each call.
+
+    The data returned by :meth:`read` is a view of one of the buffers in the ring. It is
+    only valid until the ring wraps around, i.e. for the next ``ring_size - 1`` reads.
+    Copy it with :func:`bytes` to keep it longer.
+
+    Small reads can be coalesced: if less than ``coalesce`` bytes were read, the reader
+    waits up to ``coalesce_timeout`` seconds for more data, and appends it to the same buffer.
+
+    :param f: The pipe or socket, as a file descriptor or an object with a ``fileno()`` method.
+    :param ring_size: The number of buffers in the ring.
+    :param buffer_size: The initial size of each buffer, in bytes.
+    :param max_read: The maximum number of bytes returned by one read. Buffers grow up to this size when more data is pending.
+    :param coalesce: Keep reading into the same buffer until at least this many bytes have been read, or the timeout expires.
+    :param coalesce_timeout: The maximum number of seconds to wait for more data when coalescing.
+
+    :ivar reads: The number of read system calls made.
+    :ivar bytes_read: The total number of bytes read.
+    """
+
+    def __init__(self, f, ring_size=4, buffer_size=65536, max_read=16 * 1024 * 1024, coalesce=0, coalesce_timeout=0.001):
+        if ring_size < 1:
+            raise ValueError('ring_size must be at least 1')
+        if buffer_size < 1 or max_read < 1:
+            raise ValueError('buffer_size and max_read must be at least 1')
+        self.fd = _fileno(f)
+        self.max_read = max_read
+        self.coalesce = min(coalesce, max_read)
+        self.coalesce_timeout = coalesce_timeout
+        self._ring = [ bytearray(min(buffer_size, max_read)) for n in range(ring_size) ]
+        self._next = 0
+        self._poll = select.poll()
+        self._poll.register(self.fd, select.POLLIN)
+        self.reads = 0
+        self.bytes_read = 0
+
+    def _buffer(self, size):
+        """ Get the next buffer in the ring, grown to at least the given size. """
+
+        index = self._next
+        self._next = (index + 1) % len(self._ring)
+        buf = self._ring[index]
+        if len(buf) < size:
+            # Views of the old buffer may still be in use, so it is replaced instead of resized.
+            buf = self._ring[index] = bytearray(max(size, min(2 * len(buf), self.max_read)))
+        return buf
+
+    def _wait(self, timeout):
+        """ Wait until the stream is readable. Returns False on timeout. """
+
+        timeout_ms = None if timeout is None else max(int(timeout * 1000), 0)
+        while True:
+            try:
+                return bool(self._poll.poll(timeout_ms))
+            except InterruptedError:
+                pass
+
+    def _readinto(self, view):
+        n = os.readv(self.fd, [view])
+        self.reads += 1
+        self.bytes_read += n
+        return n
+
+    def read(self, timeout=None):
+        """ Read the pending data, waiting for data if none is pending.
+
+        :param timeout: The maximum number of seconds to wait for data, or None to wait indefinitely.
+        :return: A :class:`memoryview` of the data. It is empty at end of file. Returns None if the timeout expired.
+        """
+
+        pending = _fionread(self.fd)
+        if pending == 0:
+            if not self._wait(timeout):
+                return None
+            pending = _fionread(self.fd)
+        if pending == 0:
+            # Readable with nothing pending means end of file or an error, which a plain read reports.
+            buf = self._buffer(1)
+            view = memoryview(buf)
+            return view[:self._readinto(view)]
+
+        size = min(max(pending, self.coalesce), self.max_read)
+        buf = self._buffer(size)
+        view = memoryview(buf)
+        filled = self._readinto(view[:min(pending, self.max_read)])
+        if filled < self.coalesce:
+            deadline = time.monotonic() + self.coalesce_timeout
+            while filled < self.coalesce:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._wait(remaining):
+                    break
+                pending = _fionread(self.fd)
+                if pending == 0:
+                    break
+                n = self._readinto(view[filled:filled + min(pending, len(buf) - filled)])
+                if n == 0:
+                    break
+                filled += n
+        return view[:filled]
+
+    def __iter__(self):
+        """ Iterate over the data until end of file.
+
+        :return: An iterator of :class:`memoryview` objects, as returned by :meth:`read`.
+        """
+
+        while True:
+            data = self.read()
+            if not data:
+                return
+            yield data
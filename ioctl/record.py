@@ -0,0 +1,296 @@
+""" Record ioctl() calls to a log, and replay them later.
+
+:class:`RecordingBackend` passes calls on to another backend, and appends every call to a
+compact binary log: a timestamp, the duration, the file descriptor and optionally the identity
+of the file it refers to, the request number, the argument data before and after the call, the
+return value and the errno.
+
+:class:`ReplayBackend` serves the results from such a log without calling ioctl(). Calls
+are matched to recorded calls with the same request number, in the order they were recorded.
+Data that the recorded call returned through a pointer argument is copied into the pointer
+argument of the replayed call. This makes it possible to run code that depends on real
+hardware on any machine.
+
+:Example:
+  ::
+
+      import ioctl.record
+
+      with ioctl.record.recording('calls.log'):
+          run_workload()
+
+      with ioctl.record.replaying('calls.log'):
+          run_workload()
+"""
+import collections
+import contextlib
+import ctypes
+import os
+import struct
+import threading
+import time
+
+from . import backends as _backends
+
+__all__ = (
+    'CallRecord',
+    'RecordingBackend',
+    'ReplayBackend',
+    'ReplayError',
+    'read_log',
+    'recording',
+    'replaying',
+)
+
+_MAGIC = b'IOCTLREC'
+_VERSION = 1
+_file_header = struct.Struct('<8sH')
+_record_header = struct.Struct('<QQiQQQqiBQII')
+# Integer arguments are recorded as the unsigned 64 bit word that the kernel receives.
+_VALUE_MASK = 0xffffffffffffffff
+
+_KIND_NONE = 0
+_KIND_VALUE = 1
+_KIND_POINTER = 2
+
+class CallRecord(collections.namedtuple('CallRecord', (
+    'timestamp',
+    'duration',
+    'fd',
+    'dev',
+    'ino',
+    'request',
+    'result',
+    'errno',
+    'value',
+    'data_in',
+    'data_out',
+))):
+    """ A recorded ioctl() call.
+
+    :ivar timestamp: The time of the call, in nanoseconds since the epoch.
+    :ivar duration: The duration of the call, in nanoseconds.
+    :ivar fd: The file descriptor.
+    :ivar dev: The device number of the file system of the file the file descriptor referred to, or 0 if it was not recorded.
+    :ivar ino: The inode number of the file the file descriptor referred to, or 0 if it was not recorded.
+    :ivar request: The ioctl request number.
+    :ivar result: The return value, or -1 if the call failed.
+    :ivar errno: The errno of a failed call, or 0.
+    :ivar value: The integer argument as an unsigned 64 bit value, for calls with an integer argument. Otherwise None.
+    :ivar data_in: The data pointed to by the argument before the call, for calls with a pointer argument. Otherwise None.
+    :ivar data_out: The data pointed to by the argument after the call, for calls with a pointer argument. Otherwise None.
+    """
+
+    __slots__ = ()
+
+class ReplayError(Exception):
+    """ Raised when a call cannot be matched to a recorded call. """
+
+def _is_path(file):
+    return isinstance(file, (str, bytes)) or hasattr(file, '__fspath__')
+
+def _open(file, mode):
+    if _is_path(file):
+        return open(file, mode), True
+    return file, False
+
+def read_log(file):
+    """ Read the calls from a log.
+
+    :param file: The path of the log, or a binary file object.
+    :return: An iterator of :class:`CallRecord` objects.
+    """
+
+    f, owned = _open(file, 'rb')
+    try:
+        header = f.read(_file_header.size)
+        if len(header) < _file_header.size:
+            return
+        magic, version = _file_header.unpack(header)
+        if magic != _MAGIC:
+            raise ValueError('Not an ioctl call log.')
+        if version != _VERSION:
+            raise ValueError('Unsupported ioctl call log version: {}'.format(version))
+        while True:
+            data = f.read(_record_header.size)
+            if not data:
+                break
+            if len(data) < _record_header.size:
+                raise ValueError('Truncated ioctl call log.')
+            (timestamp, duration, fd, dev, ino, request, result, err,
+             kind, value, in_len, out_len) = _record_header.unpack(data)
+            data_in = f.read(in_len) if kind == _KIND_POINTER else None
+            data_out = f.read(out_len) if kind == _KIND_POINTER else None
+            if kind != _KIND_VALUE:
+                value = None
+            yield CallRecord(timestamp, duration, fd, dev, ino, request, result, err, value, data_in, data_out)
+    finally:
+        if owned:
+            f.close()
+
+class RecordingBackend(_backends.Backend):
+    """ Backend that records calls passed to another backend.
+
+    If the log file already contains calls, new calls are appended to it.
+
+    :param file: The path of the log, or a binary file object opened for appending.
+    :param inner: The backend to pass calls to, or None to pick backends automatically.
+    :param identify: Whether to record the identity of the file each call operates on. This
+                     costs an extra ``fstat()`` call for every recorded call.
+    """
+
+    name = 'recording'
+
+    def __init__(self, file, inner=None, identify=False):
+        self.inner = inner
+        self.identify = identify
+        self._file, self._owned = _open(file, 'ab')
+        self._lock = threading.Lock()
+        if self._file.tell() == 0:
+            self._file.write(_file_header.pack(_MAGIC, _VERSION))
+
+    def close(self):
+        """ Flush the log, and close it if it was opened by this backend. """
+
+        with self._lock:
+            if self._owned:
+                self._file.close()
+            else:
+                self._file.flush()
+
+    def _inner_for(self, kind, datatype):
+        if self.inner is None:
+            return _backends._auto_backend(kind, datatype)
+        return self.inner
+
+    def supports(self, kind, datatype):
+        return self.inner is None or self.inner.supports(kind, datatype)
+
+    def _call(self, inner, fn, fd, request, arg):
+        if arg is None:
+            kind, value, data_in = _KIND_NONE, 0, b''
+        elif isinstance(arg, int):
+            kind, value, data_in = _KIND_VALUE, arg & _VALUE_MASK, b''
+        else:
+            kind, value, data_in = _KIND_POINTER, 0, bytes(arg)
+        timestamp = time.time_ns()
+        start = time.perf_counter_ns()
+        res = fn(fd, request, arg)
+        duration = time.perf_counter_ns() - start
+        err = 0
+        if res < 0:
+            err = inner.errno(res)
+            res = -err
+        data_out = bytes(arg) if kind == _KIND_POINTER else b''
+        dev, ino = 0, 0
+        if self.identify:
+            try:
+                st = os.fstat(fd)
+                dev, ino = st.st_dev, st.st_ino
+            except OSError:
+                pass
+        header = _record_header.pack(
+            timestamp, duration, fd, dev, ino, request,
+            -1 if err else res, err, kind, value, len(data_in), len(data_out),
+            )
+        with self._lock:
+            self._file.write(header + data_in + data_out)
+        return res
+
+    def ioctl(self, fd, request, arg=None):
+        inner = self.inner
+        if inner is None:
+            inner = _backends.get_backend('ctypes')
+        return self._call(inner, inner.ioctl, fd, request, arg)
+
+    def bind(self, kind, datatype):
+        inner = self._inner_for(kind, datatype)
+        fn = inner.bind(kind, datatype)
+        call = self._call
+        def recorded(fd, request, arg):
+            return call(inner, fn, fd, request, arg)
+        return recorded
+
+class ReplayBackend(_backends.Backend):
+    """ Backend that serves recorded results instead of calling ioctl().
+
+    :param file: The path of the log, a binary file object, or an iterable of :class:`CallRecord` objects.
+    :param check_input: Whether to check that the data passed to each call matches the recorded data.
+    """
+
+    name = 'replay'
+
+    def __init__(self, file, check_input=False):
+        self.check_input = check_input
+        if _is_path(file) or hasattr(file, 'read'):
+            records = read_log(file)
+        else:
+            records = file
+        self._queues = {}
+        for record in records:
+            self._queues.setdefault(record.request, collections.deque()).append(record)
+        self._lock = threading.Lock()
+
+    def remaining(self):
+        """ Get the number of recorded calls that have not been replayed yet. """
+
+        with self._lock:
+            return sum(len(queue) for queue in self._queues.values())
+
+    def ioctl(self, fd, request, arg=None):
+        with self._lock:
+            queue = self._queues.get(request)
+            if not queue:
+                raise ReplayError('No recorded call left for request 0x{:08x}'.format(request))
+            record = queue.popleft()
+        if record.data_out is not None:
+            if arg is None or isinstance(arg, int):
+                raise ReplayError('Recorded call for request 0x{:08x} has a pointer argument'.format(request))
+            if self.check_input and bytes(arg) != record.data_in:
+                raise ReplayError('Input data for request 0x{:08x} does not match the recorded call'.format(request))
+            size = min(ctypes.sizeof(arg), len(record.data_out))
+            ctypes.memmove(ctypes.byref(arg), record.data_out, size)
+        elif self.check_input and (arg & _VALUE_MASK if isinstance(arg, int) else arg) != record.value:
+            raise ReplayError('Argument for request 0x{:08x} does not match the recorded call'.format(request))
+        if record.errno:
+            return -record.errno
+        return record.result
+
+@contextlib.contextmanager
+def recording(file, inner=None, identify=False):
+    """ Record all calls while the context is active.
+
+    A :class:`RecordingBackend` is pinned with :func:`ioctl.backends.set_backend` while the
+    context is active. It wraps the backend that was pinned before.
+
+    :param file: The path of the log, or a binary file object opened for appending.
+    :param inner: The backend to pass calls to. Defaults to the backend that is currently pinned.
+    :param identify: Whether to record the identity of the file each call operates on, as for :class:`RecordingBackend`.
+    :return: The :class:`RecordingBackend`.
+    """
+
+    if inner is None:
+        inner = _backends.pinned_backend()
+    backend = RecordingBackend(file, inner, identify)
+    previous = _backends.set_backend(backend)
+    try:
+        yield backend
+    finally:
+        _backends.set_backend(previous)
+        backend.close()
+
+@contextlib.contextmanager
+def replaying(file, check_input=False):
+    """ Replay recorded calls while the context is active.
+
+    :param file: The path of the log, a binary file object, or an iterable of :class:`CallRecord` objects.
+    :param check_input: Whether to check that the data passed to each call matches the recorded data.
+    :return: The :class:`ReplayBackend`.
+    """
+
+    backend = ReplayBackend(file, check_input=check_input)
+    previous = _backends.set_backend(backend)
+    try:
+        yield backend
+    finally:
+        _backends.set_backend(previous)
@@ -0,0 +1,226 @@
+""" Clone files with the ``FICLONE`` and ``FICLONERANGE`` ioctls.
+
+On file systems with reflink support, such as Btrfs and XFS, cloning shares the data
+blocks of the source file with the destination file. This completes almost instantly, and
+uses no additional space until one of the files is modified.
+
+On other file systems the data is copied instead, with :func:`os.copy_file_range` if
+possible, or else with plain reads and writes. File systems without reflink support are
+detected the first time a clone fails, and the result is cached per file system, so later
+clones on the same file system go straight to the fallback.
+
+Every function returns a :class:`CloneResult` with the number of bytes that were cloned,
+and the number of bytes that were copied.
+
+:Example:
+  ::
+
+      import ioctl.reflink
+      res = ioctl.reflink.clone_tree('/data/vm', '/data/vm-snapshot', max_workers=8)
+      print('{} bytes cloned, {} bytes copied'.format(res.cloned, res.copied))
+"""
+import collections
+import concurrent.futures
+import ctypes
+import errno
+import os
+import stat
+import threading
+
+import ioctl
+from . import linux
+
+__all__ = (
+    'CloneResult',
+    'FICLONE',
+    'FICLONERANGE',
+    'FileCloneRange',
+    'clear_cache',
+    'clone_fd',
+    'clone_file',
+    'clone_tree',
+    'is_supported',
+)
+
+class FileCloneRange(ctypes.Structure):
+    """ ``struct file_clone_range`` from ``<linux/fs.h>``. """
+
+    _fields_ = [
+        ('src_fd', ctypes.c_int64),
+        ('src_offset', ctypes.c_uint64),
+        ('src_length', ctypes.c_uint64),
+        ('dest_offset', ctypes.c_uint64),
+    ]
+
+FICLONE = linux.IOW(0x94, 9, ctypes.c_int)
+FICLONERANGE = linux.IOW(0x94, 13, ctypes.sizeof(FileCloneRange))
+
+class CloneResult(collections.namedtuple('CloneResult', ('cloned', 'copied'))):
+    """ The result of a clone operation.
+
+    :ivar cloned: The number of bytes that were cloned.
+    :ivar copied: The number of bytes that were copied, because they could not be cloned.
+    """
+
+    __slots__ = ()
+
+# Errors that mean that the file system does not support reflinks at all.
+_UNSUPPORTED_ERRNOS = frozenset((errno.EOPNOTSUPP, errno.ENOTTY, errno.ENOSYS))
+# Errors that mean that this particular clone is not possible, e.g. across file systems or for unaligned ranges.
+_FALLBACK_ERRNOS = _UNSUPPORTED_ERRNOS | frozenset((errno.EXDEV, errno.EINVAL))
+
+_COPY_CHUNK = 1 << 20
+
+_ficlone = ioctl.compile(FICLONE, ctypes.c_int, 'w', pointer=False, check=False)
+_ficlonerange = ioctl.compile(FICLONERANGE, FileCloneRange, 'w', check=False)
+
+_unsupported = set()
+_unsupported_lock = threading.Lock()
+
+def clear_cache():
+    """ Forget which file systems were found not to support reflinks. """
+
+    with _unsupported_lock:
+        _unsupported.clear()
+
+def is_supported(fd):
+    """ Check whether the file system of a file may support reflinks.
+
+    :param fd: File descriptor of a file on the file system.
+    :return: False if a clone on the file system has failed because reflinks are not supported, otherwise True.
+    """
+
+    return os.fstat(fd).st_dev not in _unsupported
+
+def _mark_unsupported(dev):
+    with _unsupported_lock:
+        _unsupported.add(dev)
+
+def _copy_range(src_fd, dst_fd, offset, length, dst_offset):
+    """ Copy a range of data without cloning. Returns the number of bytes copied. """
+
+    copied = 0
+    use_copy_file_range = hasattr(os, 'copy_file_range')
+    while copied < length:
+        count = min(length - copied, _COPY_CHUNK)
+        if use_copy_file_range:
+            try:
+                n = os.copy_file_range(src_fd, dst_fd, count, offset + copied, dst_offset + copied)
+            except OSError as e:
+                if e.errno not in _FALLBACK_ERRNOS:
+                    raise
+                use_copy_file_range = False
+                continue
+        else:
+            data = os.pread(src_fd, count, offset + copied)
+            n = len(data)
+            view = memoryview(data)
+            while view:
+                written = os.pwrite(dst_fd, view, dst_offset + copied + n - len(view))
+                view = view[written:]
+        if n == 0:
+            break
+        copied += n
+    return copied
+
+def clone_fd(src_fd, dst_fd, offset=0, length=None, dst_offset=None, fallback=True):
+    """ Clone data from one open file to another.
+
+    Without range parameters the whole source file is cloned with ``FICLONE``, and the
+    destination file ends up with the same contents and size as the source file.
+    Otherwise the range is cloned with ``FICLONERANGE``.
+
+    :param src_fd: File descriptor of the source file, open for reading.
+    :param dst_fd: File descriptor of the destination file, open for writing.
+    :param offset: The offset in the source file to start at.
+    :param length: The number of bytes to clone, or None to clone up to the end of the source file.
+                   A length of 0 clones nothing.
+    :param dst_offset: The offset in the destination file to clone to. Defaults to ``offset``.
+    :param fallback: Whether to copy the data if it cannot be cloned. If False, an :class:`OSError` is raised instead.
+    :return: A :class:`CloneResult`.
+    """
+
+    src_size = os.fstat(src_fd).st_size
+    dev = os.fstat(dst_fd).st_dev
+    whole = offset == 0 and length is None and dst_offset is None
+    if dst_offset is None:
+        dst_offset = offset
+    if length is None:
+        length = max(src_size - offset, 0)
+    if length == 0 and not whole:
+        # FICLONERANGE treats a length of 0 as "up to the end of the source file".
+        return CloneResult(0, 0)
+
+    err = errno.EOPNOTSUPP
+    if dev not in _unsupported:
+        if whole:
+            err = _ficlone(dst_fd, src_fd)[1]
+        else:
+            arg = FileCloneRange(src_fd, offset, length, dst_offset)
+            err = _ficlonerange(dst_fd, arg)[1]
+        if not err:
+            return CloneResult(length, 0)
+        if err in _UNSUPPORTED_ERRNOS:
+            _mark_unsupported(dev)
+    if not fallback or err not in _FALLBACK_ERRNOS:
+        raise OSError(err, os.strerror(err))
+
+    copied = _copy_range(src_fd, dst_fd, offset, length, dst_offset)
+    if whole:
+        os.ftruncate(dst_fd, copied)
+    return CloneResult(0, copied)
+
+def clone_file(src, dst, fallback=True):
+    """ Clone a file.
+
+    The destination file is created with the permission bits of the source file, or
+    truncated if it exists.
+
+    :param src: The path of the source file.
+    :param dst: The path of the destination file.
+    :param fallback: Whether to copy the data if it cannot be cloned.
+    :return: A :class:`CloneResult`.
+    """
+
+    src_fd = os.open(src, os.O_RDONLY | os.O_CLOEXEC)
+    try:
+        mode = stat.S_IMODE(os.fstat(src_fd).st_mode)
+        dst_fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_CLOEXEC, mode)
+        try:
+            return clone_fd(src_fd, dst_fd, fallback=fallback)
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+
+def clone_tree(src, dst, max_workers=None, fallback=True):
+    """ Clone a directory tree.
+
+    Directories and symbolic links are recreated, and regular files are cloned with
+    :func:`clone_file` on a thread pool. Other files, such as device nodes, are skipped.
+
+    :param src: The path of the source directory.
+    :param dst: The path of the destination directory. It is created if it does not exist.
+    :param max_workers: The maximum number of files to clone concurrently.
+    :param fallback: Whether to copy the data of files that cannot be cloned.
+    :return: A :class:`CloneResult` with the totals for all files.
+    """
+
+    cloned = copied = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ioctl-reflink') as executor:
+        futures = []
+        for root, dirs, files in os.walk(src):
+            target = os.path.join(dst, os.path.relpath(root, src))
+            os.makedirs(target, mode=stat.S_IMODE(os.stat(root).st_mode), exist_ok=True)
+            for name in dirs + files:
+                path = os.path.join(root, name)
+                st = os.lstat(path)
+                if stat.S_ISLNK(st.st_mode):
+                    os.symlink(os.readlink(path), os.path.join(target, name))
+                elif stat.S_ISREG(st.st_mode):
+                    futures.append(executor.submit(clone_file, path, os.path.join(target, name), fallback))
+        for future in futures:
+            res = future.result()
+            cloned += res.cloned
+            copied += res.copied
+    return CloneResult(cloned, copied)
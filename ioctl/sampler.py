@@ -0,0 +1,261 @@
+""" Sample read ioctl() calls at a fixed rate.
+
+:class:`Sampler` runs a set of compiled read calls on a dedicated thread. The samples are
+scheduled against absolute deadlines, ``start + n * interval``, so the sampling rate does not
+drift with the time spent in the calls. If the thread falls behind, the deadlines it missed
+are skipped and counted instead of being sampled in a burst.
+
+The samples are written to a ring buffer that is allocated once. Each sample has a
+timestamp, the delay after its deadline, and a value and an errno per call. Consumers copy
+windows of samples out of the ring with :meth:`Sampler.window` and :meth:`Sampler.since`
+without taking a lock, so they never block the sampling thread.
+
+:Example:
+  ::
+
+      import ctypes
+      import os
+      import time
+      import ioctl
+      import ioctl.linux
+      import ioctl.sampler
+
+      RNDGETENTCNT = ioctl.linux.IOR('R', 0x00, ctypes.c_int)
+      fd = os.open('/dev/random', os.O_RDONLY)
+      sampler = ioctl.sampler.Sampler(0.01, capacity=6000)
+      sampler.add('entropy', fd, ioctl.compile(RNDGETENTCNT, ctypes.c_int, 'r', check=False))
+      with sampler:
+          while True:
+              time.sleep(60)
+              window = sampler.window()
+              print(max(window.values['entropy']), sampler.missed)
+"""
+import array
+import collections
+import threading
+import time
+
+import ioctl
+
+__all__ = (
+    'Sampler',
+    'Window',
+)
+
+class Window(collections.namedtuple('Window', ('start', 'timestamps', 'delays', 'values', 'errnos'))):
+    """ Samples copied out of the ring buffer of a :class:`Sampler`.
+
+    :ivar start: The sequence number of the first sample. The next sample has sequence number ``start + len(timestamps)``.
+    :ivar timestamps: The :func:`time.monotonic` time when each sample was started.
+    :ivar delays: The number of seconds each sample was started after its deadline.
+    :ivar values: A dictionary mapping the name of each call to its values. Values of failed calls are 0.
+    :ivar errnos: A dictionary mapping the name of each call to its errnos, which are 0 for calls that succeeded.
+    """
+
+    __slots__ = ()
+
+class Sampler(object):
+    """ Sampler for read ioctl() calls at a fixed rate.
+
+    Calls are added with :meth:`add` before the sampler is started. They must be read
+    calls compiled with :func:`ioctl.compile` with ``check=False``, and return integers.
+
+    If a call raises an exception, the sampling thread stops. The exception is kept in
+    :attr:`error`, and :attr:`running` becomes False.
+
+    :param interval: The number of seconds between samples.
+    :param capacity: The number of samples kept in the ring buffer.
+    :param numpy: Whether to store the ring buffer in NumPy arrays instead of :class:`array.array` objects.
+
+    :ivar interval: The number of seconds between samples.
+    :ivar capacity: The number of samples kept in the ring buffer.
+    :ivar count: The number of samples taken.
+    :ivar missed: The number of deadlines that were skipped because the sampling thread was late.
+    :ivar error: The exception that stopped the sampling thread, or None.
+    """
+
+    def __init__(self, interval, capacity=4096, numpy=False):
+        if interval <= 0:
+            raise ValueError('interval must be positive')
+        if capacity < 1:
+            raise ValueError('capacity must be at least 1')
+        if not isinstance(numpy, bool):
+            raise TypeError('numpy must be a boolean, but was {}'.format(numpy.__class__.__name__))
+        self.interval = interval
+        self.capacity = capacity
+        self.numpy = numpy
+        self.count = 0
+        self.missed = 0
+        self.error = None
+        self._writing = 0
+        self._sources = []
+        self._timestamps = self._column('d')
+        self._delays = self._column('d')
+        self._values = collections.OrderedDict()
+        self._errnos = collections.OrderedDict()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _column(self, typecode):
+        if self.numpy:
+            import numpy as np
+            return np.zeros(self.capacity, dtype={ 'd': np.float64, 'q': np.int64, 'Q': np.uint64, 'i': np.intc }[typecode])
+        return array.array(typecode, [0]) * self.capacity
+
+    def add(self, name, fd, call):
+        """ Add a call to sample.
+
+        :param name: The name of the call in the samples.
+        :param fd: The file descriptor to make the call on.
+        :param call: An :class:`ioctl.IoctlCall` with direction ``'r'`` and an integer datatype, compiled with ``check=False``.
+        """
+
+        if self._thread is not None:
+            raise ValueError('Calls cannot be added to a running sampler')
+        if name in self._values:
+            raise ValueError('Duplicate name: {!r}'.format(name))
+        if not isinstance(call, ioctl.IoctlCall):
+            raise TypeError('call must be an IoctlCall, but was {}'.format(call.__class__.__name__))
+        if call.direction != 'r' or not call.pointer:
+            raise ValueError('call must be a read call')
+        if call.check:
+            raise ValueError('call must be compiled with check=False')
+        typecode = getattr(call.datatype, '_type_', None)
+        if not isinstance(typecode, str) or typecode not in 'bBhHiIlLqQ' or not call.return_python:
+            raise ValueError('call must return integers')
+        # Unsigned values can be larger than the largest signed 64 bit integer.
+        self._values[name] = self._column('Q' if typecode in 'BHILQ' else 'q')
+        self._errnos[name] = self._column('i')
+        self._sources.append((fd, call, self._values[name], self._errnos[name]))
+
+    @property
+    def running(self):
+        """ Whether the sampling thread is running. """
+
+        return self._thread is not None and self.error is None
+
+    def start(self):
+        """ Start the sampling thread. The first sample is taken immediately. """
+
+        if self.running:
+            raise ValueError('Sampler is already running')
+        # Clean up after a sampling thread that was stopped by an error.
+        self.stop()
+        self.error = None
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='ioctl-sampler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """ Stop the sampling thread, and wait for it to finish. The samples are kept. """
+
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _run(self):
+        try:
+            self._sample()
+        except Exception as e:
+            self.error = e
+
+    def _sample(self):
+        interval = self.interval
+        capacity = self.capacity
+        sources = self._sources
+        timestamps = self._timestamps
+        delays = self._delays
+        stop = self._stop
+        monotonic = time.monotonic
+        start = monotonic()
+        tick = 0
+        while True:
+            deadline = start + tick * interval
+            delay = deadline - monotonic()
+            if delay > 0 and stop.wait(delay):
+                return
+            if stop.is_set():
+                return
+
+            count = self.count
+            index = count % capacity
+            # Announce the sample before overwriting the oldest one, see since().
+            self._writing = count + 1
+            now = monotonic()
+            timestamps[index] = now
+            delays[index] = max(now - deadline, 0.0)
+            for fd, call, values, errnos in sources:
+                value, err = call(fd)
+                values[index] = value if not err else 0
+                errnos[index] = err
+            # Publish the sample after it is complete.
+            self.count = count + 1
+
+            now = monotonic()
+            tick += 1
+            late = int((now - start) / interval) + 1 - tick
+            if late > 0:
+                self.missed += late
+                tick += late
+
+    def _slice(self, column, first, end):
+        capacity = self.capacity
+        a = first % capacity
+        b = a + (end - first)
+        if b <= capacity:
+            return column[a:b].copy() if self.numpy else column[a:b]
+        if self.numpy:
+            import numpy as np
+            return np.concatenate((column[a:], column[:b - capacity]))
+        return column[a:] + column[:b - capacity]
+
+    def since(self, sequence):
+        """ Copy the samples starting with a sequence number out of the ring buffer.
+
+        Samples that were already overwritten are left out.
+
+        :param sequence: The sequence number of the first sample, e.g. the ``start`` plus the
+                         number of samples of the previous window.
+        :return: A :class:`Window`.
+        """
+
+        end = self.count
+        first = max(sequence, end - self.capacity, 0)
+        end = max(end, first)
+        timestamps = self._slice(self._timestamps, first, end)
+        delays = self._slice(self._delays, first, end)
+        values = collections.OrderedDict((name, self._slice(column, first, end)) for name, column in self._values.items())
+        errnos = collections.OrderedDict((name, self._slice(column, first, end)) for name, column in self._errnos.items())
+
+        # The sampling thread may have overwritten the oldest samples while they were copied.
+        # Only the samples after the one that the sample being written replaces are intact.
+        valid = self._writing - self.capacity
+        if valid > first:
+            skip = min(valid - first, end - first)
+            first += skip
+            timestamps = timestamps[skip:]
+            delays = delays[skip:]
+            values = collections.OrderedDict((name, column[skip:]) for name, column in values.items())
+            errnos = collections.OrderedDict((name, column[skip:]) for name, column in errnos.items())
+        return Window(first, timestamps, delays, values, errnos)
+
+    def window(self, n=None):
+        """ Copy the latest samples out of the ring buffer.
+
+        :param n: The number of samples, or None for all samples in the ring buffer.
+        :return: A :class:`Window`.
+        """
+
+        count = self.count
+        n = self.capacity if n is None else min(n, self.capacity)
+        return self.since(max(count - n, 0))
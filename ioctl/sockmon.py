@@ -0,0 +1,156 @@
+""" Monitor the queue depths of many sockets.
+
+:class:`QueueMonitor` reads the receive and send queue depths of a set of sockets with
+``SIOCINQ``, ``SIOCOUTQ`` and ``SIOCOUTQNSD``. The columns are allocated once, and each
+:meth:`QueueMonitor.scrape` fills them in place with :func:`ioctl.ioctl_many`, so a scrape
+of tens of thousands of sockets reuses the same columns instead of building new result
+objects for each socket.
+
+:Example:
+  ::
+
+      import ioctl.sockmon
+      monitor = ioctl.sockmon.QueueMonitor(connections)
+      monitor.scrape()
+      for fd, depth in monitor.top(10, 'outq'):
+          print(fd, depth)
+"""
+import array
+import ctypes
+import heapq
+
+import ioctl
+
+__all__ = (
+    'COLUMNS',
+    'QueueMonitor',
+    'SIOCINQ',
+    'SIOCOUTQ',
+    'SIOCOUTQNSD',
+)
+
+SIOCINQ = 0x541B
+SIOCOUTQ = 0x5411
+SIOCOUTQNSD = 0x894B
+
+COLUMNS = {
+    'inq': SIOCINQ,
+    'outq': SIOCOUTQ,
+    'outq_nsd': SIOCOUTQNSD,
+}
+
+def _fileno(sock):
+    if isinstance(sock, int):
+        return sock
+    return sock.fileno()
+
+class QueueMonitor(object):
+    """ Monitor for the queue depths of a set of sockets.
+
+    Each column holds one value per socket, in the order of the sockets:
+
+    * ``inq``: The number of bytes in the receive queue (``SIOCINQ``).
+    * ``outq``: The number of bytes in the send queue, including unacknowledged data (``SIOCOUTQ``).
+    * ``outq_nsd``: The number of bytes in the send queue that have not been sent yet (``SIOCOUTQNSD``, TCP only).
+
+    Every column has a matching errno column, which is 0 for sockets where the call
+    succeeded. The value of a failed call is 0.
+
+    :param sockets: An iterable of socket objects or file descriptors.
+    :param columns: The columns to read on each scrape.
+    :param numpy: Whether to store the columns as NumPy arrays instead of :class:`array.array` objects.
+
+    :ivar fds: The file descriptors of the sockets.
+    :ivar values: A dictionary mapping column names to the values of the last scrape.
+    :ivar errnos: A dictionary mapping column names to the errnos of the last scrape.
+    """
+
+    def __init__(self, sockets=(), columns=('inq', 'outq'), numpy=False):
+        columns = tuple(columns)
+        for column in columns:
+            if column not in COLUMNS:
+                raise ValueError('Unknown column: {!r}'.format(column))
+        if not isinstance(numpy, bool):
+            raise TypeError('numpy must be a boolean, but was {}'.format(numpy.__class__.__name__))
+        self.columns = columns
+        self.numpy = numpy
+        self.set_sockets(sockets)
+
+    def _column(self, count):
+        if self.numpy:
+            import numpy as np
+            return np.zeros(count, dtype=np.intc)
+        return array.array('i', [0]) * count
+
+    def set_sockets(self, sockets):
+        """ Replace the set of sockets, and reallocate the columns.
+
+        :param sockets: An iterable of socket objects or file descriptors.
+        """
+
+        self.fds = array.array('i', [ _fileno(sock) for sock in sockets ])
+        count = len(self.fds)
+        self.values = { column: self._column(count) for column in self.columns }
+        self.errnos = { column: self._column(count) for column in self.columns }
+
+    def __len__(self):
+        return len(self.fds)
+
+    def scrape(self):
+        """ Read the queue depths of all sockets into the columns. """
+
+        for column in self.columns:
+            ioctl.ioctl_many(self.fds, COLUMNS[column], ctypes.c_int, out=(self.values[column], self.errnos[column]))
+
+    def _check_column(self, column):
+        if column not in self.values:
+            raise ValueError('Column {!r} is not monitored'.format(column))
+
+    def top(self, n, column='outq'):
+        """ Get the sockets with the deepest queues.
+
+        :param n: The number of sockets to return.
+        :param column: The column to sort by.
+        :return: A list of ``(fd, value)`` tuples, with the largest value first.
+        """
+
+        self._check_column(column)
+        values = self.values[column]
+        if self.numpy:
+            import numpy as np
+            n = min(n, len(values))
+            if n <= 0:
+                return []
+            indexes = np.argpartition(values, len(values) - n)[len(values) - n:]
+            indexes = indexes[np.argsort(values[indexes], kind='stable')[::-1]]
+            return [ (self.fds[i], int(values[i])) for i in indexes.tolist() ]
+        indexes = heapq.nlargest(n, range(len(values)), key=values.__getitem__)
+        return [ (self.fds[i], values[i]) for i in indexes ]
+
+    def above(self, threshold, column='outq'):
+        """ Get the sockets with queues deeper than a threshold.
+
+        :param threshold: The threshold, in bytes.
+        :param column: The column to check.
+        :return: A list of ``(fd, value)`` tuples for the sockets with a value larger than the threshold, in the order of the sockets.
+        """
+
+        self._check_column(column)
+        values = self.values[column]
+        if self.numpy:
+            import numpy as np
+            indexes = np.flatnonzero(values > threshold).tolist()
+        else:
+            indexes = [ i for i, value in enumerate(values) if value > threshold ]
+        return [ (self.fds[i], int(values[i])) for i in indexes ]
+
+    def failed(self, column='inq'):
+        """ Get the sockets where the last scrape failed.
+
+        :param column: The column to check.
+        :return: A list of ``(fd, errno)`` tuples.
+        """
+
+        self._check_column(column)
+        errnos = self.errnos[column]
+        return [ (self.fds[i], int(err)) for i, err in enumerate(errnos) if err ]
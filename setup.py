@@ -1,11 +1,6 @@
 import os
-import sys
 from setuptools import setup, find_packages
 
-tests_require = [ ]
-if sys.version_info < (3, 3):
-    tests_require.append('mock') # mock became available as unittest.mock from Python 3.3.
-
 setup(
     name = 'ioctl',
     packages = find_packages(),
@@ -17,6 +12,18 @@ setup(
     url = 'https://github.com/olavmrk/python-ioctl',
     download_url = 'https://github.com/olavmrk/python-ioctl/releases',
     setup_requires = [ 'setuptools_scm' ],
-    tests_require = tests_require,
+    # time.perf_counter_ns(), time.time_ns() and asyncio.run() are new in Python 3.7.
+    python_requires = '>=3.7',
+    classifiers = [
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
+        'Programming Language :: Python :: 3.12',
+        'Programming Language :: Python :: 3.13',
+    ],
     test_suite = 'tests',
 )
@@ -0,0 +1,85 @@
+import asyncio
+import ctypes
+import errno
+import os
+import threading
+import unittest
+
+import ioctl
+import ioctl.aio
+
+FIONREAD = 0x541B
+FIONBIO = 0x5421
+
+class TestAio(unittest.TestCase):
+
+    def setUp(self):
+        self.rfd, self.wfd = os.pipe()
+
+    def tearDown(self):
+        os.close(self.rfd)
+        os.close(self.wfd)
+
+    def test_helpers(self):
+        async def main():
+            os.write(self.wfd, b'abc')
+            fionread = ioctl.aio.ioctl_fn_ptr_r(FIONREAD, ctypes.c_int)
+            fionbio = ioctl.aio.ioctl_fn_ptr_w(FIONBIO, ctypes.c_int)
+            await fionbio(self.rfd, 1)
+            assert not os.get_blocking(self.rfd)
+            return await asyncio.gather(*[ fionread(self.rfd) for _ in range(10) ])
+        self.assertEqual(asyncio.run(main()), [3] * 10)
+
+    def test_ioctl(self):
+        async def main():
+            os.write(self.wfd, b'ab')
+            value = ctypes.c_int()
+            await ioctl.aio.ioctl(self.rfd, FIONREAD, ctypes.byref(value))
+            return value.value
+        self.assertEqual(asyncio.run(main()), 2)
+
+    def test_error(self):
+        async def main():
+            fionread = ioctl.aio.wrap(ioctl.compile(FIONREAD, ctypes.c_int, 'r'))
+            await fionread(1000000)
+        with self.assertRaises(OSError) as context:
+            asyncio.run(main())
+        self.assertEqual(context.exception.errno, errno.EBADF)
+
+    def test_wait_readable(self):
+        async def main():
+            fionread = ioctl.aio.ioctl_fn_ptr_r(FIONREAD, ctypes.c_int)
+            task = asyncio.ensure_future(fionread(self.rfd, wait_readable=True))
+            await asyncio.sleep(0.01)
+            assert not task.done()
+            os.write(self.wfd, b'abcd')
+            return await task
+        self.assertEqual(asyncio.run(main()), 4)
+
+    def test_timeout(self):
+        event = threading.Event()
+        async def main():
+            blocking = ioctl.aio.wrap(lambda fd: event.wait(5))
+            try:
+                with self.assertRaises(asyncio.TimeoutError):
+                    await blocking(self.rfd, timeout=0.01)
+                loop = asyncio.get_running_loop()
+                with self.assertRaises(asyncio.TimeoutError):
+                    await blocking(self.rfd, deadline=loop.time() + 0.01)
+                with self.assertRaises(asyncio.TimeoutError):
+                    await ioctl.aio.ioctl(self.rfd, FIONREAD, ctypes.byref(ctypes.c_int()), wait_readable=True, timeout=0.01)
+            finally:
+                event.set()
+        asyncio.run(main())
+
+    def test_set_max_workers(self):
+        with self.assertRaises(ValueError):
+            ioctl.aio.set_max_workers(0)
+        ioctl.aio.set_max_workers(4)
+        try:
+            assert ioctl.aio.get_executor()._max_workers == 4
+        finally:
+            ioctl.aio.set_max_workers(ioctl.aio.DEFAULT_MAX_WORKERS)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+import ctypes
+import errno
+import os
+import threading
+import unittest
+
+import ioctl
+import ioctl.backends
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+FIONREAD = 0x541B
+FIONBIO = 0x5421
+FIOCLEX = 0x5451
+
+class TestBackends(unittest.TestCase):
+
+    def setUp(self):
+        self.rfd, self.wfd = os.pipe()
+        os.write(self.wfd, b'abc')
+
+    def tearDown(self):
+        ioctl.backends.set_backend(None)
+        os.close(self.rfd)
+        os.close(self.wfd)
+
+    def _test_backend(self, backend):
+        fionread = ioctl.compile(FIONREAD, ctypes.c_int, 'r', backend=backend)
+        assert fionread.backend.name == backend
+        assert fionread(self.rfd) == 3
+        fionbio = ioctl.compile(FIONBIO, ctypes.c_int, 'w', backend=backend)
+        fionbio(self.rfd, 1)
+        assert not os.get_blocking(self.rfd)
+        fioclex = ioctl.compile(FIOCLEX, backend=backend)
+        os.set_inheritable(self.rfd, True)
+        fioclex(self.rfd)
+        assert not os.get_inheritable(self.rfd)
+        with self.assertRaises(OSError) as context:
+            fionread(1000000)
+        self.assertEqual(context.exception.errno, errno.EBADF)
+
+    def test_ctypes(self):
+        self._test_backend('ctypes')
+
+    def test_fcntl(self):
+        self._test_backend('fcntl')
+
+    def test_auto(self):
+        assert ioctl.compile(FIONREAD, ctypes.c_int, 'r').backend.name == 'fcntl'
+        assert ioctl.compile(FIONBIO, ctypes.c_int, 'w', pointer=False).backend.name == 'fcntl'
+        assert ioctl.compile(FIONBIO, ctypes.c_ulong, 'w', pointer=False).backend.name == 'ctypes'
+        with self.assertRaises(ValueError):
+            ioctl.compile(FIONBIO, ctypes.c_ulong, 'w', pointer=False, backend='fcntl')
+        with self.assertRaises(ValueError):
+            ioctl.backends.get_backend('unknown')
+
+    def test_mock(self):
+        def handler(fd, request, arg):
+            if fd == 13:
+                raise OSError(errno.ENOTTY, os.strerror(errno.ENOTTY))
+            arg.value = 42
+        backend = ioctl.backends.MockBackend(handler)
+        fn = ioctl.compile(FIONREAD, ctypes.c_int, 'r', backend=backend)
+        assert fn(12) == 42
+        with self.assertRaises(OSError) as context:
+            fn(13)
+        self.assertEqual(context.exception.errno, errno.ENOTTY)
+        self.assertEqual([ call[:2] for call in backend.calls ], [ (12, FIONREAD), (13, FIONREAD) ])
+
+    def test_set_backend(self):
+        compiled = ioctl.compile(FIONREAD, ctypes.c_int, 'r')
+        pinned = ioctl.compile(FIONREAD, ctypes.c_int, 'r', backend='ctypes')
+        helper = ioctl.ioctl_fn_ptr_r(FIONREAD, ctypes.c_int)
+        backend = ioctl.backends.MockBackend(lambda fd, request, arg: setattr(arg, 'value', 7))
+        assert ioctl.backends.set_backend(backend) is None
+        assert ioctl.backends.pinned_backend() is backend
+        assert compiled(self.rfd) == 7
+        assert helper(self.rfd) == 7
+        assert pinned(self.rfd) == 3
+        assert ioctl.ioctl_many([self.rfd], FIONREAD, ctypes.c_int).values.tolist() == [7]
+        assert ioctl.ioctl(self.rfd, FIONREAD, ctypes.byref(ctypes.c_int())) == 0
+        self.assertEqual(len(backend.calls), 4)
+        assert ioctl.backends.set_backend(None) is backend
+        assert compiled(self.rfd) == 3
+        assert compiled.backend.name == 'fcntl'
+
+    def test_pinned_variadic(self):
+        backend = ioctl.backends.MockBackend()
+        ioctl.backends.set_backend(backend)
+        value = ctypes.c_int()
+        # Extra arguments are ignored by FIONREAD, but backends cannot pass them.
+        assert ioctl.ioctl(self.rfd, FIONREAD, ctypes.byref(value), ctypes.c_int(0)) == 0
+        assert value.value == 3
+        assert ioctl.ioctl(self.rfd, FIONREAD, ctypes.c_char_p(b'xxxx')) == 0
+        assert backend.calls == []
+
+    def test_value_ctypes_instance(self):
+        backend = ioctl.backends.MockBackend()
+        fn = ioctl.compile(FIONBIO, ctypes.c_int, 'w', pointer=False, backend=backend)
+        fn(3, ctypes.c_int(5))
+        assert backend.calls == [(3, FIONBIO, 5)]
+        fn = ioctl.compile(FIOCLEX, ctypes.c_int, 'w', pointer=False, backend='fcntl')
+        os.set_inheritable(self.rfd, True)
+        fn(self.rfd, ctypes.c_int(0))
+        assert not os.get_inheritable(self.rfd)
+
+    def test_register_auto_call_rebinds(self):
+        # Simulates a backend being pinned between selecting the backend of a call and registering it.
+        call = ioctl.compile(FIONREAD, ctypes.c_int, 'r')
+        backend = ioctl.backends.MockBackend(lambda fd, request, arg: setattr(arg, 'value', 9))
+        with mock.patch.object(ioctl.backends, '_pinned', backend):
+            ioctl.backends._register_auto_call(call)
+            assert call.backend is backend
+            assert call(self.rfd) == 9
+
+    def test_bound_together(self):
+        # A call reads its backend and the function bound from it in one step.
+        call = ioctl.compile(FIONREAD, ctypes.c_int, 'r', check=False)
+        backend, fn = call._bound
+        assert backend is call.backend
+        ioctl.backends.set_backend('ctypes')
+        assert call._bound[0] is ioctl.backends.get_backend('ctypes')
+        assert call(1000000) == (None, errno.EBADF)
+
+    def test_get_backend_shared(self):
+        backends = []
+        def worker():
+            backends.append(ioctl.backends.get_backend('ctypes'))
+        with mock.patch.dict(ioctl.backends._backends, clear=True):
+            threads = [ threading.Thread(target=worker) for n in range(8) ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert all(backend is backends[0] for backend in backends)
+
+    def test_unwrap_arg(self):
+        value = ctypes.c_int(5)
+        array = (ctypes.c_int * 2)()
+        assert ioctl.backends._unwrap_arg(None) == ('none', None, None)
+        assert ioctl.backends._unwrap_arg(3) == ('value', ctypes.c_int, 3)
+        assert ioctl.backends._unwrap_arg(2**40) == ('value', ctypes.c_longlong, 2**40)
+        assert ioctl.backends._unwrap_arg(ctypes.c_ulong(5)) == ('value', ctypes.c_ulong, 5)
+        assert ioctl.backends._unwrap_arg(ctypes.byref(value)) == ('pointer', ctypes.c_int, value)
+        assert ioctl.backends._unwrap_arg(ctypes.byref(value))[2] is value
+        assert ioctl.backends._unwrap_arg(ctypes.pointer(value))[2].value == 5
+        assert ioctl.backends._unwrap_arg(array)[2] is array
+        with self.assertRaises(TypeError):
+            ioctl.backends._unwrap_arg('x')
+        with self.assertRaises(TypeError):
+            ioctl.backends._unwrap_arg(ctypes.c_char_p(b'x'))
+        with self.assertRaises(TypeError):
+            ioctl.backends._unwrap_arg(ctypes.byref(array, 4))
+
+    def _test_pinned_fallback(self, backend):
+        ioctl.backends.set_backend(backend)
+        # A pointer into the middle of an array.
+        array = (ctypes.c_int * 2)()
+        assert ioctl.ioctl(self.rfd, FIONREAD, ctypes.byref(array, ctypes.sizeof(ctypes.c_int))) == 0
+        assert list(array) == [0, 3]
+        # Values that do not fit in a C int. FIONBIO takes a pointer, so the call fails with EFAULT.
+        for value in (ctypes.c_ulong(2**40), 2**40):
+            with self.assertRaises(OSError) as context:
+                ioctl.ioctl(self.rfd, FIONBIO, value)
+            self.assertEqual(context.exception.errno, errno.EFAULT)
+
+    def test_pinned_fallback_ctypes(self):
+        self._test_pinned_fallback('ctypes')
+
+    def test_pinned_fallback_fcntl(self):
+        self._test_pinned_fallback('fcntl')
+
+if __name__ == '__main__':
+    unittest.main()
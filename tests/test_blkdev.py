@@ -0,0 +1,191 @@
+import ctypes
+import errno
+import os
+import stat
+import threading
+import unittest
+
+import ioctl.backends
+import ioctl.blkdev
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+_values = {
+    ioctl.blkdev.BLKSSZGET: 512,
+    ioctl.blkdev.BLKPBSZGET: 4096,
+    ioctl.blkdev.BLKIOMIN: 4096,
+    ioctl.blkdev.BLKIOOPT: 131072,
+    ioctl.blkdev.BLKGETSIZE64: 1 << 40,
+}
+
+def _handler(fd, request, arg):
+    arg.value = _values[request]
+
+def _fstat(fd):
+    return mock.Mock(st_mode=stat.S_IFBLK | 0o660, st_rdev=os.makedev(8, fd))
+
+class TestGeometry(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = ioctl.backends.MockBackend(_handler)
+        ioctl.backends.set_backend(self.backend)
+        ioctl.blkdev.clear_cache()
+
+    def tearDown(self):
+        ioctl.backends.set_backend(None)
+        ioctl.blkdev.clear_cache()
+
+    @mock.patch('os.fstat', new=_fstat)
+    def test_get_geometry(self):
+        geometry = ioctl.blkdev.get_geometry(3)
+        assert geometry == (512, 4096, 4096, 131072, 1 << 40)
+        assert geometry.optimal_io_size == 131072
+        assert len(self.backend.calls) == 5
+
+    @mock.patch('os.fstat', new=_fstat)
+    def test_cache(self):
+        assert ioctl.blkdev.get_geometry(3) is ioctl.blkdev.get_geometry(3)
+        assert len(self.backend.calls) == 5
+        ioctl.blkdev.get_geometry(4)
+        assert len(self.backend.calls) == 10
+        ioctl.blkdev.get_geometry(3, cache=False)
+        assert len(self.backend.calls) == 15
+        ioctl.blkdev.clear_cache(os.makedev(8, 3))
+        ioctl.blkdev.get_geometry(4)
+        ioctl.blkdev.get_geometry(3)
+        assert len(self.backend.calls) == 20
+
+    def test_not_block_device(self):
+        rfd, wfd = os.pipe()
+        try:
+            with self.assertRaises(OSError) as context:
+                ioctl.blkdev.get_geometry(rfd)
+            self.assertEqual(context.exception.errno, errno.ENOTBLK)
+        finally:
+            os.close(rfd)
+            os.close(wfd)
+
+    def test_request_numbers(self):
+        assert ioctl.blkdev.BLKSSZGET == 0x1268
+        assert ioctl.blkdev.BLKPBSZGET == 0x127b
+        assert ioctl.blkdev.BLKGETSIZE64 == 0x80081272
+
+class TestIoPlanner(unittest.TestCase):
+
+    geometry = ioctl.blkdev.Geometry(512, 4096, 4096, 65536, 1 << 20)
+
+    def test_plan(self):
+        planner = ioctl.blkdev.IoPlanner(self.geometry)
+        chunks = list(planner.plan(1000, 200000))
+        assert chunks[0] == (512, 65536 - 512)
+        assert chunks[1] == (65536, 65536)
+        assert chunks[-1].offset + chunks[-1].length == planner.align_up(201000)
+        assert all(chunk.offset % 512 == 0 and chunk.length % 512 == 0 for chunk in chunks)
+        assert sum(chunk.length for chunk in chunks) == planner.align_up(201000) - 512
+
+    def test_plan_device_end(self):
+        planner = ioctl.blkdev.IoPlanner(self.geometry)
+        chunks = list(planner.plan((1 << 20) - 1000, 10000))
+        assert chunks[-1].offset + chunks[-1].length == 1 << 20
+
+    def test_chunk_size(self):
+        planner = ioctl.blkdev.IoPlanner(self.geometry, chunk_size=5000)
+        assert planner.chunk_size == 8192
+        planner = ioctl.blkdev.IoPlanner(self.geometry._replace(optimal_io_size=0))
+        assert planner.chunk_size == ioctl.blkdev.DEFAULT_CHUNK_SIZE
+        with self.assertRaises(ValueError):
+            ioctl.blkdev.IoPlanner(self.geometry, chunk_size=0)
+
+    def test_buffer(self):
+        planner = ioctl.blkdev.IoPlanner(self.geometry)
+        buf = planner.buffer(1000)
+        assert len(buf) == 1024
+        address = ctypes.addressof(ctypes.c_char.from_buffer(buf))
+        assert address % 4096 == 0
+
+class TestRangeOperations(unittest.TestCase):
+
+    def setUp(self):
+        self.ranges = []
+        self.lock = threading.Lock()
+        def handler(fd, request, arg):
+            if request in _values:
+                arg.value = _values[request] if request != ioctl.blkdev.BLKGETSIZE64 else 1 << 30
+                return
+            with self.lock:
+                self.ranges.append((request, arg[0], arg[1]))
+        ioctl.backends.set_backend(ioctl.backends.MockBackend(handler))
+        ioctl.blkdev.clear_cache()
+        patcher = mock.patch('os.fstat', new=_fstat)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('ioctl.blkdev._read_queue_attribute', return_value=1 << 20)
+        self.read_queue_attribute = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        ioctl.backends.set_backend(None)
+        ioctl.blkdev.clear_cache()
+
+    def test_discard(self):
+        reports = []
+        res = ioctl.blkdev.discard(3, chunk_size=300 << 20, progress=reports.append)
+        assert res.done == res.total == 1 << 30
+        assert not res.cancelled
+        assert res.throughput > 0
+        assert [ r[1:] for r in self.ranges ] == [(0, 300 << 20), (300 << 20, 300 << 20), (600 << 20, 300 << 20), (900 << 20, 124 << 20)]
+        assert all(r[0] == ioctl.blkdev.BLKDISCARD for r in self.ranges)
+        assert [ r.done for r in reports[:3] ] == [300 << 20, 600 << 20, 900 << 20]
+
+    def test_discard_granularity(self):
+        ioctl.blkdev.discard(3, offset=1 << 20, length=3 << 20, chunk_size=1000)
+        assert [ r[1:] for r in self.ranges ] == [(1 << 20, 1 << 20), (2 << 20, 1 << 20), (3 << 20, 1 << 20)]
+
+    def test_zeroout_parallel(self):
+        res = ioctl.blkdev.zeroout(3, length=64 << 20, chunk_size=1 << 20, max_workers=4)
+        assert res.done == 64 << 20
+        assert sorted(r[1] for r in self.ranges) == [ n << 20 for n in range(64) ]
+        assert all(r[0] == ioctl.blkdev.BLKZEROOUT for r in self.ranges)
+
+    def test_cancel(self):
+        cancel = threading.Event()
+        def progress(res):
+            if res.done >= 2 << 20:
+                cancel.set()
+        res = ioctl.blkdev.zeroout(3, length=8 << 20, chunk_size=1 << 20, progress=progress, cancel=cancel)
+        assert res.cancelled
+        assert res.done == 2 << 20
+        assert len(self.ranges) == 2
+
+    def test_cancel_parallel(self):
+        cancel = threading.Event()
+        cancel.set()
+        res = ioctl.blkdev.discard(3, max_workers=4, cancel=cancel)
+        assert res.cancelled
+        assert res.done == 0
+        assert self.ranges == []
+
+    def test_error(self):
+        def handler(fd, request, arg):
+            if request in _values:
+                arg.value = _values[request]
+                return
+            raise OSError(errno.EOPNOTSUPP, 'Not supported')
+        ioctl.backends.set_backend(ioctl.backends.MockBackend(handler))
+        for max_workers in (1, 2):
+            with self.assertRaises(OSError):
+                ioctl.blkdev.discard(3, length=4 << 20, chunk_size=1 << 20, max_workers=max_workers)
+
+    def test_unaligned(self):
+        with self.assertRaises(ValueError):
+            ioctl.blkdev.zeroout(3, offset=100, length=512)
+
+    def test_granularity_fallback(self):
+        self.read_queue_attribute.return_value = None
+        assert ioctl.blkdev.get_discard_granularity(3) == 512
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+import ctypes
+import unittest
+
+import ioctl.codec
+
+class Point(ctypes.Structure):
+    _fields_ = [
+        ('x', ctypes.c_short),
+        ('y', ctypes.c_short),
+    ]
+
+class Data(ctypes.Structure):
+    _fields_ = [
+        ('flag', ctypes.c_ubyte),
+        ('value', ctypes.c_uint64),
+        ('point', Point),
+        ('points', Point * 2),
+        ('values', ctypes.c_int * 3),
+        ('name', ctypes.c_char * 8),
+        ('ratio', ctypes.c_double),
+    ]
+
+class Bits(ctypes.Structure):
+    _fields_ = [
+        ('a', ctypes.c_uint, 3),
+        ('b', ctypes.c_int, 5),
+        ('c', ctypes.c_uint, 24),
+        ('d', ctypes.c_ushort),
+    ]
+
+class Value(ctypes.Union):
+    _fields_ = [
+        ('i', ctypes.c_uint32),
+        ('b', ctypes.c_uint8 * 4),
+    ]
+
+class Tagged(ctypes.Structure):
+    _fields_ = [
+        ('tag', ctypes.c_int),
+        ('value', Value),
+    ]
+
+class BigEndian(ctypes.BigEndianStructure):
+    _fields_ = [
+        ('a', ctypes.c_uint16),
+        ('b', ctypes.c_int32),
+    ]
+
+def _data():
+    return Data(
+        flag=1,
+        value=2**40 + 5,
+        point=Point(-1, 2),
+        points=(Point * 2)(Point(3, 4), Point(5, 6)),
+        values=(ctypes.c_int * 3)(7, -8, 9),
+        name=b'abc',
+        ratio=0.5,
+        )
+
+class TestCodec(unittest.TestCase):
+
+    def test_tuple(self):
+        codec = ioctl.codec.Codec(Data)
+        assert codec.to_tuple(_data()) == (1, 2**40 + 5, (-1, 2), ((3, 4), (5, 6)), (7, -8, 9), b'abc', 0.5)
+
+    def test_namedtuple(self):
+        codec = ioctl.codec.Codec(Data)
+        res = codec.to_namedtuple(_data())
+        assert res.value == 2**40 + 5
+        assert res.point.x == -1
+        assert res.points[1].y == 6
+        assert res.name == b'abc'
+        assert res._fields == codec.field_names
+
+    def test_dict(self):
+        codec = ioctl.codec.Codec(Data)
+        res = codec.to_dict(_data())
+        assert res['point'] == { 'x': -1, 'y': 2 }
+        assert res['points'][0] == { 'x': 3, 'y': 4 }
+        assert res['values'] == (7, -8, 9)
+
+    def test_buffer(self):
+        codec = ioctl.codec.Codec(Data)
+        assert codec.to_tuple(bytes(_data())) == codec.to_tuple(_data())
+        assert codec.to_tuple(memoryview(bytearray(_data()))) == codec.to_tuple(_data())
+
+    def test_matches_ctypes(self):
+        data = _data()
+        res = ioctl.codec.Codec(Data).to_namedtuple(data)
+        for name in ('flag', 'value', 'name', 'ratio'):
+            assert getattr(res, name) == getattr(data, name)
+
+    def test_bitfields(self):
+        bits = Bits(a=5, b=-3, c=0x123456, d=0xbeef)
+        res = ioctl.codec.Codec(Bits).to_namedtuple(bits)
+        assert res == (bits.a, bits.b, bits.c, bits.d)
+        assert res == (5, -3, 0x123456, 0xbeef)
+
+    def test_union(self):
+        data = Tagged(tag=1)
+        data.value.i = 0x04030201
+        res = ioctl.codec.Codec(Tagged).to_namedtuple(data)
+        assert res.value.i == 0x04030201
+        assert sorted(res.value.b) == [1, 2, 3, 4]
+
+    def test_big_endian(self):
+        res = ioctl.codec.Codec(BigEndian).to_tuple(BigEndian(a=0x1234, b=-2))
+        assert res == (0x1234, -2)
+
+    def test_simple(self):
+        codec = ioctl.codec.Codec(ctypes.c_long)
+        assert codec.to_tuple(ctypes.c_long(-5)) == -5
+        codec = ioctl.codec.Codec(ctypes.c_uint * 2)
+        assert codec.to_tuple((ctypes.c_uint * 2)(1, 2)) == (1, 2)
+
+    def test_iter_tuples(self):
+        items = (Point * 3)(Point(1, 2), Point(3, 4), Point(5, 6))
+        res = list(ioctl.codec.Codec(Point).iter_tuples(items))
+        assert res == [(1, 2), (3, 4), (5, 6)]
+        with self.assertRaises(ValueError):
+            list(ioctl.codec.Codec(Point).iter_tuples(b'\0' * 5))
+
+    def test_get_codec(self):
+        assert ioctl.codec.get_codec(Point) is ioctl.codec.get_codec(Point)
+
+    def test_invalid_datatype(self):
+        with self.assertRaises(TypeError):
+            ioctl.codec.Codec(int)
+
+    def test_numpy(self):
+        try:
+            import numpy
+        except ImportError:
+            raise unittest.SkipTest('NumPy is not available.')
+        codec = ioctl.codec.Codec(Data)
+        row = codec.to_numpy(_data())
+        assert row['value'] == 2**40 + 5
+        assert row['point']['x'] == -1
+        items = (Data * 2)(_data(), _data())
+        res = codec.decode_many(items)
+        assert res.shape == (2,)
+        assert res['values'].tolist() == [[7, -8, 9], [7, -8, 9]]
+        res = codec.decode_many([ _data(), _data(), _data() ])
+        assert res['ratio'].tolist() == [0.5, 0.5, 0.5]
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,190 @@
+import ctypes
+import io
+import os
+import subprocess
+import tempfile
+import unittest
+
+import ioctl.codegen
+import ioctl.linux
+import ioctl.reflink
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+HEADER = """
+#ifndef _TEST_H
+#define _TEST_H
+#include <linux/types.h>
+
+#define TEST_MAGIC 'T'
+#define TEST_NAME_LEN 16
+
+/* A structure with a nested structure and an array. */
+struct test_inner {
+	__u32 flags;
+	__u16 a, b;
+};
+
+struct test_outer {
+	struct test_inner inner;
+	char name[TEST_NAME_LEN];
+	unsigned long long value;
+};
+
+struct test_bits {
+	__u32 low:4;
+};
+
+#define TEST_GET      _IOR(TEST_MAGIC, 1, struct test_outer)
+#define TEST_SET      _IOW(TEST_MAGIC, 2, struct test_outer)
+#define TEST_RESET    _IO(TEST_MAGIC, 3)
+#define TEST_GET_NAME _IOR(TEST_MAGIC, 4, char[TEST_NAME_LEN])
+#define TEST_BITS     _IOR(TEST_MAGIC, 5, struct test_bits)
+#define TEST_MACRO(n) _IOR(TEST_MAGIC, 0x10 + (n), int)
+#if 0
+#define TEST_OLD      _IO(TEST_MAGIC, 6)
+#endif
+#endif
+"""
+
+SPEC = {
+    'headers': ['linux/fs.h'],
+    'structs': [
+        {'c_name': 'struct file_clone_range', 'fields': [
+            ['src_fd', '__s64'], ['src_offset', '__u64'], ['src_length', '__u64'], ['dest_offset', '__u64']]},
+    ],
+    'requests': [
+        {'name': 'FICLONE', 'direction': 'w', 'type': 0x94, 'nr': 9, 'argtype': 'int', 'helper': 'value'},
+        {'name': 'FICLONERANGE', 'direction': 'w', 'type': 0x94, 'nr': 13, 'argtype': 'struct file_clone_range'},
+        {'name': 'FIFREEZE', 'direction': 'rw', 'type': 'X', 'nr': 119, 'argtype': 'int'},
+    ],
+}
+
+def _load(source):
+    namespace = {}
+    exec(compile(source, '<generated>', 'exec'), namespace)
+    return namespace
+
+class TestParseHeader(unittest.TestCase):
+
+    def test_parse(self):
+        spec = ioctl.codegen.parse_header(HEADER, include='test.h')
+        self.assertEqual(spec.headers, ['test.h'])
+        self.assertEqual(dict(spec.constants), {'TEST_MAGIC': ord('T'), 'TEST_NAME_LEN': 16})
+        outer = spec.struct('struct test_outer')
+        self.assertEqual(outer.name, 'TestOuter')
+        self.assertEqual(outer.fields, (
+            ioctl.codegen.Field('inner', 'struct test_inner', None),
+            ioctl.codegen.Field('name', 'char', 16),
+            ioctl.codegen.Field('value', 'unsigned long long', None),
+        ))
+        self.assertEqual(spec.struct('struct test_inner').fields[2], ioctl.codegen.Field('b', '__u16', None))
+        requests = { request.name: request for request in spec.requests }
+        self.assertEqual(sorted(requests), ['TEST_GET', 'TEST_GET_NAME', 'TEST_RESET', 'TEST_SET'])
+        self.assertEqual(requests['TEST_GET'], ioctl.codegen.RequestSpec('TEST_GET', 'r', ord('T'), 1, 'struct test_outer', 'pointer'))
+        self.assertEqual(requests['TEST_RESET'].helper, None)
+        self.assertEqual(requests['TEST_GET_NAME'].argtype, 'char[16]')
+        skipped = dict(spec.skipped)
+        assert 'struct test_bits' in skipped
+        assert 'TEST_BITS' in skipped
+
+    def test_layout(self):
+        spec = ioctl.codegen.parse_header(HEADER)
+        values = ioctl.codegen.layout(spec, arch='x86_64')
+        self.assertEqual(values['sizeof:struct test_inner'], 8)
+        self.assertEqual(values['offsetof:struct test_outer.name'], 8)
+        self.assertEqual(values['offsetof:struct test_outer.value'], 24)
+        self.assertEqual(values['TEST_GET'], ioctl.linux.IOR('T', 1, 32, arch='x86_64'))
+        self.assertEqual(values['TEST_GET_NAME'], ioctl.linux.IOR('T', 4, 16, arch='x86_64'))
+        self.assertEqual(values['TEST_RESET'], ioctl.linux.IO('T', 3, arch='x86_64'))
+
+class TestGenerate(unittest.TestCase):
+
+    def test_generate_header(self):
+        spec = ioctl.codegen.parse_header(HEADER)
+        module = _load(ioctl.codegen.generate(spec, arch='x86_64'))
+        self.assertEqual(module['ARCH'], 'x86_64')
+        self.assertEqual(module['TEST_NAME_LEN'], 16)
+        self.assertEqual(ctypes.sizeof(module['TestOuter']), 32)
+        self.assertEqual(module['TestOuter'].name.offset, 8)
+        self.assertEqual(module['TEST_SET'], ioctl.linux.IOW('T', 2, 32, arch='x86_64'))
+        assert callable(module['test_get'])
+        assert 'test_get_name' not in module
+
+    def test_generate_spec(self):
+        spec = ioctl.codegen.Spec.from_dict(SPEC)
+        source = ioctl.codegen.generate(spec, arch='x86_64')
+        assert '\nFICLONERANGE = 0x4020940d\n' in source
+        module = _load(source)
+        self.assertEqual(module['FICLONE'], ioctl.reflink.FICLONE)
+        self.assertEqual(module['FICLONERANGE'], ioctl.reflink.FICLONERANGE)
+        self.assertEqual(module['FIFREEZE'], 0xc0045877)
+        self.assertEqual(ctypes.sizeof(module['FileCloneRange']), ctypes.sizeof(ioctl.reflink.FileCloneRange))
+
+    def test_generate_arch(self):
+        spec = ioctl.codegen.Spec.from_dict(SPEC)
+        module = _load(ioctl.codegen.generate(spec, arch='ppc64', helpers=False))
+        self.assertEqual(module['FIFREEZE'], ioctl.linux.IOWR('X', 119, ctypes.c_int, arch='ppc64'))
+        assert 'ficlone' not in module
+        assert 'ioctl' not in module
+
+    def test_array_helper(self):
+        spec = ioctl.codegen.parse_header(HEADER)
+        spec.requests = [ request._replace(helper='pointer') for request in spec.requests if request.name == 'TEST_GET_NAME' ]
+        with self.assertRaises(ValueError):
+            ioctl.codegen.generate(spec)
+
+    def test_main(self):
+        spec_fd, spec_file = tempfile.mkstemp(suffix='.h')
+        out_fd, out_file = tempfile.mkstemp(suffix='.py')
+        os.close(out_fd)
+        try:
+            with os.fdopen(spec_fd, 'w') as f:
+                f.write(HEADER)
+            with mock.patch('sys.stderr', new_callable=io.StringIO) as stderr:
+                self.assertEqual(ioctl.codegen.main([spec_file, '-o', out_file, '--arch', 'x86_64']), 0)
+            with open(out_file) as f:
+                module = _load(f.read())
+        finally:
+            os.unlink(spec_file)
+            os.unlink(out_file)
+        self.assertEqual(module['TEST_RESET'], ioctl.linux.IO('T', 3, arch='x86_64'))
+        self.assertEqual(stderr.getvalue().splitlines(), [
+            'Skipped struct test_bits: bitfields are not supported',
+            "Skipped TEST_BITS: unsupported type 'struct test_bits'",
+        ])
+
+class TestVerify(unittest.TestCase):
+
+    def _verify(self, spec):
+        try:
+            return ioctl.codegen.verify(spec)
+        except (OSError, subprocess.CalledProcessError):
+            if 'IOCTL_FORCE_NATIVE_TEST' in os.environ:
+                raise
+            raise unittest.SkipTest('Unable to build & run native program for dumping ioctl values.')
+
+    def test_verify(self):
+        spec = ioctl.codegen.Spec.from_dict(SPEC)
+        self.assertEqual(self._verify(spec), [])
+
+    def test_verify_mismatch(self):
+        spec = ioctl.codegen.Spec.from_dict(SPEC)
+        struct = spec.structs[0]
+        spec.structs[0] = struct._replace(fields=struct.fields[:3])
+        mismatches = self._verify(spec)
+        self.assertEqual(sorted(mismatch.key for mismatch in mismatches), ['FICLONERANGE', 'sizeof:struct file_clone_range'])
+        self.assertEqual(mismatches[0].expected, 32)
+
+    def test_probe_source(self):
+        spec = ioctl.codegen.Spec.from_dict(SPEC)
+        source = ioctl.codegen.probe_source(spec)
+        assert '#include <linux/fs.h>' in source
+        assert 'sizeof(struct file_clone_range)' in source
+        assert 'offsetof(struct file_clone_range, dest_offset)' in source
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+import ctypes
+import errno
+import os
+import pickle
+import unittest
+
+import ioctl
+import ioctl.backends
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+FIONREAD = 0x541B
+FIONBIO = 0x5421
+FIOCLEX = 0x5451
+
+class PickleData(ctypes.Structure):
+    _fields_ = [('a', ctypes.c_int), ('b', ctypes.c_int)]
+
+class TestCompiled(unittest.TestCase):
+
+    def setUp(self):
+        self.rfd, self.wfd = os.pipe()
+
+    def tearDown(self):
+        os.close(self.rfd)
+        os.close(self.wfd)
+
+    def test_read(self):
+        fionread = ioctl.compile(FIONREAD, ctypes.c_int, 'r')
+        assert fionread(self.rfd) == 0
+        os.write(self.wfd, b'hello')
+        assert fionread(self.rfd) == 5
+
+    def test_read_structure(self):
+        class Data(ctypes.Structure):
+            _fields_ = [('value', ctypes.c_int)]
+        fionread = ioctl.compile(FIONREAD, Data, 'r')
+        os.write(self.wfd, b'abc')
+        res = fionread(self.rfd)
+        assert isinstance(res, Data)
+        assert res.value == 3
+
+    def test_read_into(self):
+        fionread = ioctl.compile(FIONREAD, ctypes.c_int, 'r')
+        os.write(self.wfd, b'abcd')
+        buf = bytearray(4)
+        assert fionread(self.rfd, into=buf) == 4
+        assert ctypes.c_int.from_buffer(buf).value == 4
+
+    def test_read_scratch(self):
+        class Data(ctypes.Structure):
+            _fields_ = [('value', ctypes.c_int)]
+        fionread = ioctl.compile(FIONREAD, Data, 'r', scratch=True)
+        os.write(self.wfd, b'ab')
+        first = fionread(self.rfd)
+        assert first.value == 2
+        assert fionread(self.rfd) is first
+
+    def test_write(self):
+        fionbio = ioctl.compile(FIONBIO, ctypes.c_int, 'w')
+        assert fionbio(self.rfd, 1) is None
+        assert not os.get_blocking(self.rfd)
+        fionbio(self.rfd, 0)
+        assert os.get_blocking(self.rfd)
+
+    def test_none(self):
+        fioclex = ioctl.compile(FIOCLEX)
+        os.set_inheritable(self.rfd, True)
+        assert fioclex(self.rfd) == 0
+        assert not os.get_inheritable(self.rfd)
+
+    def test_value(self):
+        fn = mock.Mock(return_value=7)
+        with mock.patch('ioctl._libc.bind_ioctl', return_value=fn) as bind_ioctl:
+            call = ioctl.compile(32, ctypes.c_ulong, 'w', pointer=False)
+        bind_ioctl.assert_called_once_with(ctypes.c_ulong)
+        assert call(12, 42) == 7
+        fn.assert_called_once_with(12, 32, 42)
+
+    def test_error(self):
+        fionread = ioctl.compile(FIONREAD, ctypes.c_int, 'r')
+        with self.assertRaises(OSError) as context:
+            fionread(1000000)
+        self.assertEqual(context.exception.errno, errno.EBADF)
+
+    def test_write_structure_instance(self):
+        class Data(ctypes.Structure):
+            _fields_ = [('a', ctypes.c_int), ('b', ctypes.c_int)]
+        backend = ioctl.backends.MockBackend()
+        call = ioctl.compile(FIONBIO, Data, 'w', backend=backend)
+        call(3, Data(1, 2))
+        arg = backend.calls[0][2]
+        assert (arg.a, arg.b) == (1, 2)
+
+    def test_check_false(self):
+        fionread = ioctl.compile(FIONREAD, ctypes.c_int, 'r', check=False)
+        os.write(self.wfd, b'abc')
+        assert fionread(self.rfd) == (3, 0)
+        assert fionread(1000000) == (None, errno.EBADF)
+        fioclex = ioctl.compile(FIOCLEX, check=False)
+        assert fioclex(self.rfd) == (0, 0)
+        assert fioclex(1000000) == (None, errno.EBADF)
+        fionbio = ioctl.compile(FIONBIO, ctypes.c_int, 'w', check=False)
+        assert fionbio(self.rfd, 0) == (None, 0)
+        assert fionbio(1000000, 0) == (None, errno.EBADF)
+
+    def test_retry_eintr(self):
+        failures = [ errno.EINTR, errno.EINTR ]
+        def handler(fd, request, arg):
+            if failures:
+                raise OSError(failures.pop(), 'Failed')
+            arg.value = 42
+        backend = ioctl.backends.MockBackend(handler)
+        call = ioctl.compile(FIONREAD, ctypes.c_int, 'r', backend=backend, retry_eintr=True)
+        assert call(3) == 42
+        assert len(backend.calls) == 3
+
+        failures[:] = [ errno.EINTR, errno.EAGAIN ]
+        call = ioctl.compile(FIONREAD, ctypes.c_int, 'r', backend=backend, retry_eintr=True, check=False)
+        assert call(3) == (None, errno.EAGAIN)
+
+        failures[:] = [ errno.EINTR ]
+        call = ioctl.compile(FIONREAD, ctypes.c_int, 'r', backend=backend)
+        with self.assertRaises(OSError) as context:
+            call(3)
+        self.assertEqual(context.exception.errno, errno.EINTR)
+
+    def test_retry_eintr_deadline(self):
+        backend = ioctl.backends.MockBackend(mock.Mock(side_effect=OSError(errno.EINTR, 'Interrupted')))
+        call = ioctl.compile(FIOCLEX, backend=backend, retry_eintr=0.01, check=False)
+        assert call(3) == (None, errno.EINTR)
+        assert len(backend.calls) > 1
+
+    def test_pickle(self):
+        fionread = pickle.loads(pickle.dumps(ioctl.compile(FIONREAD, ctypes.c_int, 'r', scratch=True, check=False)))
+        os.write(self.wfd, b'abc')
+        assert fionread(self.rfd) == (3, 0)
+        assert fionread.scratch
+        call = pickle.loads(pickle.dumps(ioctl.compile(FIONREAD, PickleData, 'rw', backend='ctypes', retry_eintr=1.5)))
+        assert (call.datatype, call.direction, call.backend, call.retry_eintr) == (PickleData, 'rw', ioctl.backends.get_backend('ctypes'), 1.5)
+        # Unpickled auto calls follow the pinned backend.
+        backend = ioctl.backends.MockBackend()
+        ioctl.backends.set_backend(backend)
+        try:
+            pickle.loads(pickle.dumps(fionread))(3)
+        finally:
+            ioctl.backends.set_backend(None)
+        assert len(backend.calls) == 1
+
+    def test_invalid_parameters(self):
+        with self.assertRaises(ValueError):
+            ioctl.compile(FIONREAD, ctypes.c_int, 'x')
+        with self.assertRaises(ValueError):
+            ioctl.compile(FIONREAD, None, 'r')
+        with self.assertRaises(ValueError):
+            ioctl.compile(FIONREAD, ctypes.c_int)
+        with self.assertRaises(ValueError):
+            ioctl.compile(FIONREAD, ctypes.c_int, 'r', pointer=False)
+        with self.assertRaises(TypeError):
+            ioctl.compile(FIONREAD, ctypes.c_int, 'r', return_python=1)
+        with self.assertRaises(TypeError):
+            ioctl.compile(FIONREAD, int, 'r')
+        with self.assertRaises(TypeError):
+            ioctl.compile(FIONREAD, ctypes.c_int, 'r', check=None)
+        with self.assertRaises(ValueError):
+            ioctl.compile(FIONREAD, ctypes.c_int, 'r', retry_eintr=-1)
+
+if __name__ == '__main__':
+    unittest.main()
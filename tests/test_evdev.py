@@ -0,0 +1,131 @@
+import ctypes
+import os
+import unittest
+
+import ioctl.backends
+import ioctl.evdev
+import ioctl.linux
+
+ABS_X = 0x00
+ABS_Y = 0x01
+BTN_TOUCH = 0x14a
+
+class FakeDevice(object):
+    """ Handler for MockBackend that emulates a touch screen. """
+
+    def __init__(self, product=0x1234):
+        self.product = product
+        self.requests = []
+
+    def __call__(self, fd, request, arg):
+        self.requests.append(request)
+        nr = ioctl.linux.IOC_NR(request)
+        if request == ioctl.evdev.EVIOCGID:
+            arg.bustype, arg.vendor, arg.product, arg.version = 3, 0x0eef, self.product, 1
+        elif nr == 0x06:
+            name = b'Fake touch screen'
+            ctypes.memmove(ctypes.addressof(arg), name, len(name))
+        elif 0x20 <= nr < 0x40:
+            # Event type 0 is both EV_SYN and the bitmap of event types.
+            bits = {
+                0: [ioctl.evdev.EV_SYN, ioctl.evdev.EV_KEY, ioctl.evdev.EV_ABS],
+                ioctl.evdev.EV_KEY: [BTN_TOUCH],
+                ioctl.evdev.EV_ABS: [ABS_X, ABS_Y],
+            }[nr - 0x20]
+            data = (ctypes.c_ubyte * ioctl.linux.IOC_SIZE(request)).from_address(ctypes.addressof(arg))
+            for bit in bits:
+                data[bit // 8] |= 1 << (bit % 8)
+        elif 0x40 <= nr < 0x80:
+            arg.minimum = 0
+            arg.maximum = 4095 if nr == 0x40 + ABS_X else 2047
+
+class TestCapabilities(unittest.TestCase):
+
+    def setUp(self):
+        self.device = FakeDevice()
+        ioctl.backends.set_backend(ioctl.backends.MockBackend(self.device))
+        ioctl.evdev.clear_cache()
+
+    def tearDown(self):
+        ioctl.backends.set_backend(None)
+        ioctl.evdev.clear_cache()
+
+    def test_get_capabilities(self):
+        caps = ioctl.evdev.get_capabilities(3)
+        assert caps.id == (3, 0x0eef, 0x1234, 1)
+        assert caps.name == b'Fake touch screen'
+        assert caps.events[ioctl.evdev.EV_SYN] == frozenset()
+        assert caps.events[ioctl.evdev.EV_KEY] == frozenset([BTN_TOUCH])
+        assert caps.events[ioctl.evdev.EV_ABS] == frozenset([ABS_X, ABS_Y])
+        assert caps.abs[ABS_X].maximum == 4095
+        assert caps.abs[ABS_Y].maximum == 2047
+
+    def test_cache(self):
+        first = ioctl.evdev.get_capabilities(3)
+        count = len(self.device.requests)
+        assert ioctl.evdev.get_capabilities(4) is first
+        assert len(self.device.requests) == count + 1
+        self.device.product = 0x5678
+        assert ioctl.evdev.get_capabilities(3).id[2] == 0x5678
+        ioctl.evdev.get_capabilities(3, cache=False)
+        assert len(self.device.requests) == 3 * count + 1
+
+    def test_request_numbers(self):
+        assert ioctl.evdev.EVIOCGID == 0x80084502
+        assert ioctl.evdev.EVIOCGBIT(ioctl.evdev.EV_KEY, 96) == 0x80604521
+        assert ioctl.evdev.EVIOCGABS(ABS_Y) == 0x80184541
+        assert ctypes.sizeof(ioctl.evdev.InputEvent) == 8 + 2 * ctypes.sizeof(ctypes.c_long)
+
+class TestEventReader(unittest.TestCase):
+
+    def setUp(self):
+        self.rfd, self.wfd = os.pipe()
+
+    def tearDown(self):
+        os.close(self.rfd)
+        if self.wfd is not None:
+            os.close(self.wfd)
+
+    def _write(self, *events):
+        data = (ioctl.evdev.InputEvent * len(events))(*[ ioctl.evdev.InputEvent(*event) for event in events ])
+        os.write(self.wfd, bytes(data))
+
+    def test_read(self):
+        reader = ioctl.evdev.EventReader(self.rfd, count=4)
+        self._write((1, 2, ioctl.evdev.EV_ABS, ABS_X, 100), (1, 2, ioctl.evdev.EV_SYN, 0, 0))
+        events = reader.read()
+        assert len(events) == 2
+        assert (events[0].type, events[0].code, events[0].value) == (ioctl.evdev.EV_ABS, ABS_X, 100)
+
+    def test_events(self):
+        reader = ioctl.evdev.EventReader(self.rfd, count=2)
+        self._write(*[ (n, 0, ioctl.evdev.EV_KEY, BTN_TOUCH, n % 2) for n in range(5) ])
+        os.close(self.wfd)
+        self.wfd = None
+        events = list(reader.events())
+        assert [ e.sec for e in events ] == [0, 1, 2, 3, 4]
+        assert events[1] == ioctl.evdev.Event(1, 0, ioctl.evdev.EV_KEY, BTN_TOUCH, 1)
+
+    def test_partial(self):
+        reader = ioctl.evdev.EventReader(self.rfd, count=2)
+        os.write(self.wfd, bytes(ioctl.evdev.InputEvent(1, 2, ioctl.evdev.EV_SYN, 0, 0)) + b'x')
+        with self.assertRaises(ValueError):
+            reader.read()
+        os.write(self.wfd, b'x')
+        os.close(self.wfd)
+        self.wfd = None
+        with self.assertRaises(ValueError):
+            list(reader.events())
+
+    def test_numpy(self):
+        try:
+            import numpy
+        except ImportError:
+            raise unittest.SkipTest('NumPy is not available.')
+        reader = ioctl.evdev.EventReader(self.rfd, count=8, numpy=True)
+        self._write((1, 2, ioctl.evdev.EV_ABS, ABS_Y, 7), (1, 2, ioctl.evdev.EV_SYN, 0, 0))
+        events = reader.read()
+        assert events['value'].tolist() == [7, 0]
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import concurrent.futures
+import ctypes
+import errno
+import os
+import threading
+import time
+import unittest
+
+import ioctl
+import ioctl.backends
+from ioctl import _libc
+from ioctl.executor import IoctlExecutor
+
+FIONREAD = 0x541B
+
+class TestExecutor(unittest.TestCase):
+
+    def setUp(self):
+        self.rfd, self.wfd = os.pipe()
+        os.write(self.wfd, b'abc')
+
+    def tearDown(self):
+        os.close(self.rfd)
+        os.close(self.wfd)
+
+    def test_ioctl(self):
+        fionread = ioctl.compile(FIONREAD, ctypes.c_int, 'r')
+        with IoctlExecutor(max_workers=4) as executor:
+            futures = executor.map(fionread, [ self.rfd, 1000000, self.rfd ])
+            value = ctypes.c_int()
+            futures.append(executor.ioctl(self.rfd, FIONREAD, ctypes.byref(value)))
+            res = executor.gather(futures)
+        self.assertEqual(res.results, [3, None, 3, 0])
+        self.assertEqual(res.errors[1].errno, errno.EBADF)
+        self.assertEqual([ e is None for e in res.errors ], [True, False, True, True])
+        self.assertEqual(value.value, 3)
+
+    def test_ioctl_check_false(self):
+        value = ctypes.c_int()
+        with IoctlExecutor(max_workers=2) as executor:
+            ok = executor.ioctl(self.rfd, FIONREAD, ctypes.byref(value), check=False, retry_eintr=1.0)
+            failed = executor.ioctl(1000000, FIONREAD, ctypes.byref(value), check=False, device='test')
+            self.assertEqual(ok.result(), (0, 0))
+            self.assertEqual(failed.result(), (None, errno.EBADF))
+            with self.assertRaises(TypeError):
+                executor.ioctl(self.rfd, FIONREAD, ctypes.byref(value), checked=False)
+
+    def test_per_device_limit(self):
+        lock = threading.Lock()
+        active = {}
+        peak = {}
+        def fn(fd, device):
+            with lock:
+                active[device] = active.get(device, 0) + 1
+                peak[device] = max(peak.get(device, 0), active[device])
+            time.sleep(0.01)
+            with lock:
+                active[device] -= 1
+            return device
+
+        with IoctlExecutor(max_workers=8, per_device_limit=2) as executor:
+            futures = [ executor.submit(fn, self.rfd, n % 2, device=n % 2) for n in range(12) ]
+            res = executor.gather(futures)
+        self.assertEqual(res.results, [ n % 2 for n in range(12) ])
+        self.assertEqual(peak, {0: 2, 1: 2})
+        self.assertEqual(executor._devices, {})
+
+    def test_default_device(self):
+        with IoctlExecutor(max_workers=4, per_device_limit=1) as executor:
+            futures = executor.map(lambda fd: os.fstat(fd).st_ino, [ self.rfd, self.wfd ])
+            res = executor.gather(futures)
+        self.assertEqual(res.results[0], res.results[1])
+
+    def test_default_device_bad_fd(self):
+        with IoctlExecutor(max_workers=1, per_device_limit=1) as executor:
+            future = executor.submit(lambda fd: fd, 1000000)
+            res = executor.gather([ future ])
+        self.assertEqual(res.errors[0].errno, errno.EBADF)
+        self.assertEqual(executor._devices, {})
+
+    def test_submit_after_shutdown(self):
+        executor = IoctlExecutor(max_workers=1, per_device_limit=1)
+        executor.shutdown()
+        with self.assertRaises(RuntimeError):
+            executor.submit(lambda fd: fd, self.rfd, device='a')
+        self.assertEqual(executor._devices, {})
+
+    def test_timeout(self):
+        event = threading.Event()
+        with IoctlExecutor(max_workers=1, per_device_limit=1) as executor:
+            blocking = executor.submit(lambda fd: event.wait(5), self.rfd, device='a')
+            queued = executor.submit(lambda fd: fd, self.rfd, device='a', timeout=0.01)
+            res = executor.gather([ blocking, queued ], timeout=0.05)
+            assert isinstance(res.errors[0], concurrent.futures.TimeoutError)
+            event.set()
+        assert blocking.result() is True
+        self.assertRaises(concurrent.futures.CancelledError, queued.result)
+
+    def test_start_timeout(self):
+        event = threading.Event()
+        with IoctlExecutor(max_workers=1) as executor:
+            executor.submit(lambda fd: event.wait(5), self.rfd)
+            late = executor.submit(lambda fd: fd, self.rfd, timeout=0.01)
+            time.sleep(0.05)
+            event.set()
+            self.assertRaises(concurrent.futures.TimeoutError, late.result)
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            IoctlExecutor(per_device_limit=0)
+        with IoctlExecutor() as executor:
+            with self.assertRaises(TypeError):
+                executor.submit(len, self.rfd, unknown=1)
+
+    def test_releases_gil(self):
+        fn = _libc.bind_ioctl(ctypes.c_void_p)
+        assert not fn._flags_ & ctypes._FUNCFLAG_PYTHONAPI
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import ctypes
+import errno
+import io
+import os
+import tempfile
+import unittest
+
+import ioctl
+import ioctl.backends
+import ioctl.fiemap
+
+class FakeFile(object):
+    """ Handler for MockBackend that maps a file with many extents. """
+
+    def __init__(self, count, size=4096):
+        self.extents = [ (n * size, 1000000 + 2 * n * size, size) for n in range(count) ]
+        self.requests = []
+
+    def __call__(self, fd, request, data):
+        assert request == ioctl.fiemap.FS_IOC_FIEMAP
+        arg = ioctl.fiemap.Fiemap.from_buffer(data)
+        assert ctypes.sizeof(data) >= ctypes.sizeof(arg) + arg.fm_extent_count * ctypes.sizeof(ioctl.fiemap.FiemapExtent)
+        self.requests.append((arg.fm_start, arg.fm_extent_count))
+        end = arg.fm_start + arg.fm_length
+        selected = [ extent for extent in self.extents if extent[0] + extent[2] > arg.fm_start and extent[0] < end ]
+        selected = selected[:arg.fm_extent_count]
+        items = (ioctl.fiemap.FiemapExtent * arg.fm_extent_count).from_buffer(data, ctypes.sizeof(arg))
+        for item, (logical, physical, length) in zip(items, selected):
+            item.fe_logical = logical
+            item.fe_physical = physical
+            item.fe_length = length
+            item.fe_flags = ioctl.fiemap.FIEMAP_EXTENT_LAST if (logical, physical, length) == self.extents[-1] else 0
+        arg.fm_mapped_extents = len(selected)
+
+class TestFiemap(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakeFile(100)
+        ioctl.backends.set_backend(ioctl.backends.MockBackend(self.fake))
+
+    def tearDown(self):
+        ioctl.backends.set_backend(None)
+
+    def test_iter_extents(self):
+        extents = list(ioctl.fiemap.iter_extents(3))
+        assert [ (e.logical, e.physical, e.length) for e in extents ] == self.fake.extents
+        assert extents[-1].flags == ioctl.fiemap.FIEMAP_EXTENT_LAST
+        assert self.fake.requests == [(0, 32), (32 * 4096, 64), (96 * 4096, 128)]
+
+    def test_chunk_size(self):
+        chunks = list(ioctl.fiemap.iter_extent_chunks(3, chunk_size=40))
+        assert [ len(chunk) for chunk in chunks ] == [32, 40, 28]
+        assert self.fake.requests[-1] == (72 * 4096, 40)
+
+    def test_range(self):
+        extents = list(ioctl.fiemap.iter_extents(3, start=10 * 4096, length=5 * 4096))
+        assert [ e.logical // 4096 for e in extents ] == [10, 11, 12, 13, 14]
+
+    def test_empty(self):
+        self.fake.extents = []
+        assert list(ioctl.fiemap.iter_extents(3)) == []
+
+    def test_invalid_chunk_size(self):
+        with self.assertRaises(ValueError):
+            list(ioctl.fiemap.iter_extent_chunks(3, chunk_size=0))
+
+    def test_numpy(self):
+        try:
+            import numpy
+        except ImportError:
+            raise unittest.SkipTest('NumPy is not available.')
+        chunks = list(ioctl.fiemap.iter_extent_chunks(3, numpy=True))
+        logical = numpy.concatenate([ chunk['fe_logical'] for chunk in chunks ])
+        assert logical.tolist() == [ e[0] for e in self.fake.extents ]
+
+class TestFiemapFile(unittest.TestCase):
+
+    def setUp(self):
+        self.file = tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(__file__)))
+
+    def tearDown(self):
+        ioctl.backends.set_backend(None)
+        self.file.close()
+
+    def _iter_extents(self):
+        try:
+            return list(ioctl.fiemap.iter_extents(self.file.fileno(), flags=ioctl.fiemap.FIEMAP_FLAG_SYNC))
+        except OSError as e:
+            if e.errno in (errno.EOPNOTSUPP, errno.ENOTTY):
+                raise unittest.SkipTest('FIEMAP is not supported by the file system.')
+            raise
+
+    def _fragment(self, count):
+        # Blocks separated by holes cannot be merged into one extent.
+        for n in range(count):
+            self.file.seek(n * 128 * 1024)
+            self.file.write(b'x' * 4096)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def test_file(self):
+        self.file.write(b'x' * 8192)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        extents = self._iter_extents()
+        assert sum(e.length for e in extents) >= 8192
+        assert extents[-1].flags & ioctl.fiemap.FIEMAP_EXTENT_LAST
+
+    def test_fcntl_backend(self):
+        self._fragment(80)
+        expected = self._iter_extents()
+        assert len(expected) == 80
+        ioctl.backends.set_backend('fcntl')
+        assert self._iter_extents() == expected
+
+    def test_record_replay(self):
+        import ioctl.record
+        self._fragment(80)
+        log = io.BytesIO()
+        with ioctl.record.recording(log):
+            expected = self._iter_extents()
+        log.seek(0)
+        with ioctl.record.replaying(log) as backend:
+            assert self._iter_extents() == expected
+            assert backend.remaining() == 0
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import array
+import ctypes
+import errno
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+
+import ioctl
+import ioctl.fleet
+
+FIONREAD = 0x541B
+
+@unittest.skipUnless(ioctl.fleet._shared_memory, 'multiprocessing.shared_memory is not available.')
+class TestFleetPoller(unittest.TestCase):
+
+    def setUp(self):
+        # Forking a process with threads, e.g. from other tests, is deprecated.
+        self.context = multiprocessing.get_context('forkserver')
+        self.directory = tempfile.mkdtemp()
+        self.paths = []
+        for index in range(10):
+            path = os.path.join(self.directory, 'file{}'.format(index))
+            with open(path, 'wb') as f:
+                f.write(b'x' * index * 100)
+            self.paths.append(path)
+        self.call = ioctl.compile(FIONREAD, ctypes.c_int, 'r', check=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_poll(self):
+        paths = self.paths + [os.path.join(self.directory, 'missing')]
+        with ioctl.fleet.FleetPoller(paths, self.call, processes=3, mp_context=self.context) as poller:
+            assert len(poller) == 11
+            res = poller.poll()
+            assert list(res.values) == [ index * 100 for index in range(10) ] + [0]
+            assert list(res.errnos) == [0] * 10 + [errno.ENOENT]
+            with open(self.paths[1], 'ab') as f:
+                f.write(b'y' * 23)
+            values = array.array('i', [-1]) * 11
+            errnos = array.array('i', [-1]) * 11
+            res = poller.poll(out=(values, errnos))
+            assert res.values is values
+            assert values[1] == 123
+            assert errnos[10] == errno.ENOENT
+            with self.assertRaises(ValueError):
+                poller.poll(out=(array.array('i'), errnos))
+        with self.assertRaises(ValueError):
+            poller.poll()
+
+    def test_spawn(self):
+        # Workers started with spawn receive the call by pickling.
+        context = multiprocessing.get_context('spawn')
+        with ioctl.fleet.FleetPoller(self.paths[:4], self.call, processes=2, mp_context=context) as poller:
+            res = poller.poll()
+            assert list(res.values) == [0, 100, 200, 300]
+            assert list(res.errnos) == [0, 0, 0, 0]
+
+    def test_more_processes_than_paths(self):
+        with ioctl.fleet.FleetPoller(self.paths[:2], self.call, processes=8, mp_context=self.context) as poller:
+            assert len(poller._workers) == 2
+            assert list(poller.poll().values) == [0, 100]
+
+    def test_numpy(self):
+        try:
+            import numpy
+        except ImportError:
+            raise unittest.SkipTest('NumPy is not available.')
+        with ioctl.fleet.FleetPoller(self.paths[:3], self.call, processes=2, numpy=True, mp_context=self.context) as poller:
+            res = poller.poll()
+            assert res.values.tolist() == [0, 100, 200]
+
+    def test_default_context(self):
+        with ioctl.fleet.FleetPoller(self.paths[:2], self.call, processes=2) as poller:
+            assert list(poller.poll().values) == [0, 100]
+
+    def test_worker_exit(self):
+        with ioctl.fleet.FleetPoller(self.paths[:4], self.call, processes=2, mp_context=self.context) as poller:
+            process, conn = poller._workers[0]
+            process.kill()
+            process.join()
+            with self.assertRaises(ioctl.fleet.FleetError):
+                poller.poll()
+            # The other worker was drained, and the poller stays broken.
+            assert not poller._workers[1][1].poll()
+            with self.assertRaises(ioctl.fleet.FleetError):
+                poller.poll()
+
+    def test_invalid_call(self):
+        with self.assertRaises(ValueError):
+            ioctl.fleet.FleetPoller(self.paths, ioctl.compile(FIONREAD, ctypes.c_int, 'r'))
+        with self.assertRaises(ValueError):
+            ioctl.fleet.FleetPoller(self.paths, ioctl.compile(FIONREAD, ctypes.c_int, 'w', check=False))
+        with self.assertRaises(TypeError):
+            ioctl.fleet.FleetPoller(self.paths, ioctl.ioctl_fn_ptr_r(FIONREAD, ctypes.c_int))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import ctypes
+import errno
+import gc
+import json
+import os
+import threading
+import unittest
+
+import ioctl
+import ioctl.backends
+import ioctl.instrument
+from ioctl import instrument
+
+FIONREAD = 0x541B
+
+class TestInstrument(unittest.TestCase):
+
+    def setUp(self):
+        self.rfd, self.wfd = os.pipe()
+        os.write(self.wfd, b'abc')
+        instrument.reset()
+
+    def tearDown(self):
+        instrument.disable()
+        instrument.reset()
+        ioctl.backends.set_backend(None)
+        os.close(self.rfd)
+        os.close(self.wfd)
+
+    def test_disabled(self):
+        fionread = ioctl.compile(FIONREAD, ctypes.c_int, 'r')
+        assert not instrument.is_enabled()
+        assert ioctl.backends.pinned_backend() is None
+        fionread(self.rfd)
+        self.assertEqual(instrument.snapshot(), {})
+
+    def test_enabled(self):
+        fionread = ioctl.compile(FIONREAD, ctypes.c_int, 'r')
+        instrument.enable()
+        assert instrument.is_enabled()
+        for _ in range(5):
+            fionread(self.rfd)
+        with self.assertRaises(OSError):
+            fionread(1000000)
+        ioctl.ioctl(self.rfd, FIONREAD, ctypes.byref(ctypes.c_int()))
+        instrument.disable()
+        fionread(self.rfd)
+
+        stats = instrument.snapshot()[FIONREAD]
+        self.assertEqual(stats.count, 7)
+        self.assertEqual(stats.errors, 1)
+        self.assertEqual(stats.errnos, {errno.EBADF: 1})
+        self.assertEqual(stats.bytes, 6 * ctypes.sizeof(ctypes.c_int))
+        self.assertEqual(sum(stats.buckets), 7)
+        assert 0 < stats.latency_min <= stats.percentile(50) <= stats.latency_max
+
+        instrument.reset()
+        self.assertEqual(instrument.snapshot(), {})
+
+    def test_thread_exit(self):
+        instrument.enable()
+        fionread = ioctl.compile(FIONREAD, ctypes.c_int, 'r')
+        def worker():
+            for n in range(3):
+                fionread(self.rfd)
+        for n in range(10):
+            thread = threading.Thread(target=worker)
+            thread.start()
+            thread.join()
+        gc.collect()
+        # The statistics of threads that exited are folded into one total.
+        assert len(instrument._instrumented._shards) <= 1
+        assert instrument.snapshot()[FIONREAD].count == 30
+        instrument.reset()
+        assert instrument.snapshot() == {}
+
+    def test_wraps_pinned_backend(self):
+        backend = ioctl.backends.MockBackend(lambda fd, request, arg: 5)
+        ioctl.backends.set_backend(backend)
+        instrument.enable()
+        assert ioctl.ioctl(self.rfd, 0x1234) == 5
+        instrument.disable()
+        assert ioctl.backends.pinned_backend() is backend
+        self.assertEqual(instrument.snapshot()[0x1234].count, 1)
+        self.assertEqual(len(backend.calls), 1)
+
+    def test_buckets(self):
+        for ns in (0, 1, 15, 16, 17, 18, 1000, 123456789, 1 << 50):
+            index = instrument._bucket_index(ns)
+            assert ns <= instrument._bucket_upper_bound(index) or index == instrument._BUCKETS - 1
+            if index > 0:
+                assert instrument._bucket_upper_bound(index - 1) < ns
+            upper = instrument._bucket_upper_bound(index)
+            assert upper - ns <= max(ns, 16) / 8.0
+
+    def test_exporters(self):
+        instrument.enable()
+        ioctl.ioctl(self.rfd, FIONREAD, ctypes.byref(ctypes.c_int()))
+        with self.assertRaises(OSError):
+            ioctl.ioctl(1000000, FIONREAD, ctypes.byref(ctypes.c_int()))
+        data = json.loads(instrument.to_json())
+        self.assertEqual(len(data), 1)
+        self.assertEqual(data[0]['request'], FIONREAD)
+        self.assertEqual(data[0]['count'], 2)
+        self.assertEqual(data[0]['errnos'], {str(errno.EBADF): 1})
+
+        text = instrument.to_prometheus()
+        assert 'ioctl_calls_total{request="0x0000541b"} 2\n' in text
+        assert 'ioctl_errors_total{request="0x0000541b",errno="EBADF"} 1\n' in text
+        assert 'ioctl_latency_seconds_bucket{request="0x0000541b",le="+Inf"} 2\n' in text
+        assert 'ioctl_latency_seconds_count{request="0x0000541b"} 2\n' in text
+
+if __name__ == '__main__':
+    unittest.main()
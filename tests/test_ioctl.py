@@ -1,4 +1,6 @@
 import ctypes
+import errno
+import os
 import unittest
 
 import ioctl
@@ -8,6 +10,9 @@ try:
 except ImportError:
     import mock
 
+FIONREAD = 0x541B
+FIONBIO = 0x5421
+
 class TestMain(unittest.TestCase):
 
     @mock.patch('ioctl._get_ioctl_fn')
@@ -72,6 +77,57 @@ class TestMain(unittest.TestCase):
         res = fn(12, 24)
         assert res == 42
 
+    @mock.patch('ioctl.ioctl')
+    @mock.patch('ctypes.byref', new=ctypes.pointer) # Ensure that we can access the pointer.
+    def test_ioctl_fn_ptr_r_into(self, ioctl_mock):
+        def _handle_ioctl(fd, request, int_ptr):
+            int_ptr.contents.value = 42
+            return mock.DEFAULT
+        ioctl_mock.side_effect = _handle_ioctl
+
+        fn = ioctl.ioctl_fn_ptr_r(32, ctypes.c_int, return_python=False)
+        buf = bytearray(8)
+        res = fn(12, into=memoryview(buf)[4:])
+        assert res.value == 42
+        assert buf[:4] == bytearray(4)
+        assert buf[4:] == bytearray(ctypes.c_int(42))
+
+        value = ctypes.c_int()
+        assert fn(12, into=value) is value
+        assert value.value == 42
+
+    @mock.patch('ioctl.ioctl')
+    @mock.patch('ctypes.byref', new=ctypes.pointer) # Ensure that we can access the pointer.
+    def test_ioctl_fn_ptr_r_scratch(self, ioctl_mock):
+        def _handle_ioctl(fd, request, int_ptr):
+            assert int_ptr.contents.value == 0
+            int_ptr.contents.value = fd
+            return mock.DEFAULT
+        ioctl_mock.side_effect = _handle_ioctl
+
+        fn = ioctl.ioctl_fn_ptr_r(32, ctypes.c_int, return_python=False, scratch=True)
+        first = fn(12)
+        assert first.value == 12
+        second = fn(13)
+        assert second is first
+        assert second.value == 13
+
+    @mock.patch('ioctl.ioctl')
+    @mock.patch('ctypes.byref', new=ctypes.pointer) # Ensure that we can access the pointer.
+    def test_ioctl_fn_ptr_wr_into(self, ioctl_mock):
+        def _handle_ioctl(fd, request, int_ptr):
+            int_ptr.contents.value = int_ptr.contents.value * 2
+            return mock.DEFAULT
+        ioctl_mock.side_effect = _handle_ioctl
+
+        fn = ioctl.ioctl_fn_ptr_wr(32, ctypes.c_int)
+        buf = bytearray(ctypes.c_int(21))
+        assert fn(12, into=buf) == 42
+        assert fn(12, 5, into=buf) == 10
+        assert ctypes.c_int.from_buffer(buf).value == 10
+        with self.assertRaises(TypeError):
+            ioctl.ioctl_fn_ptr_wr(32, ctypes.c_int, scratch=True)(12)
+
     @mock.patch('ioctl.ioctl')
     def test_ioctl_fn_w(self, ioctl_mock):
         def _handle_ioctl(fd, request, int_val):
@@ -85,5 +141,84 @@ class TestMain(unittest.TestCase):
         fn = ioctl.ioctl_fn_w(32, ctypes.c_int)
         fn(12, 42)
 
+    def test_ioctl_check_false(self):
+        rfd, wfd = os.pipe()
+        try:
+            os.write(wfd, b'abc')
+            value = ctypes.c_int()
+            assert ioctl.ioctl(rfd, FIONREAD, ctypes.byref(value), check=False) == (0, 0)
+            assert value.value == 3
+            res, err = ioctl.ioctl(1000000, FIONREAD, ctypes.byref(value), check=False)
+            assert res is None
+            assert err == errno.EBADF
+            with self.assertRaises(TypeError):
+                ioctl.ioctl(rfd, FIONREAD, ctypes.byref(value), checked=False)
+        finally:
+            os.close(rfd)
+            os.close(wfd)
+
+    @mock.patch('ioctl._get_ioctl_fn')
+    @mock.patch('ctypes.get_errno')
+    def test_ioctl_retry_eintr(self, get_errno_mock, get_ioctl_fn_mock):
+        get_ioctl_fn_mock.return_value = mock.Mock(side_effect=[-1, -1, 5])
+        get_errno_mock.return_value = errno.EINTR
+        assert ioctl.ioctl(1, 2, retry_eintr=True) == 5
+
+    def test_helpers_check_false(self):
+        rfd, wfd = os.pipe()
+        try:
+            os.write(wfd, b'abc')
+            fionread = ioctl.ioctl_fn_ptr_r(FIONREAD, ctypes.c_int, check=False)
+            assert fionread(rfd) == (3, 0)
+            assert fionread(1000000) == (None, errno.EBADF)
+            fionbio = ioctl.ioctl_fn_ptr_w(FIONBIO, ctypes.c_int, check=False)
+            assert fionbio(rfd, 0) == (None, 0)
+            assert fionbio(1000000, 0) == (None, errno.EBADF)
+            fionread = ioctl.ioctl_fn_ptr_wr(FIONREAD, ctypes.c_int, check=False, retry_eintr=1.0)
+            assert fionread(rfd, 0) == (3, 0)
+            with self.assertRaises(TypeError):
+                ioctl.ioctl_fn_w(FIONBIO, ctypes.c_int, check=1)
+        finally:
+            os.close(rfd)
+            os.close(wfd)
+
+    def test_var_buffer(self):
+        class Header(ctypes.Structure):
+            _fields_ = [('count', ctypes.c_uint32)]
+        buf = ioctl.VarBuffer(Header, ctypes.c_uint16, 2)
+        assert len(buf.data) == 8
+        buf.header.count = 7
+        buf.items[1] = 5
+        buf.reserve(3)
+        assert buf.capacity == 4
+        assert buf.header.count == 7
+        assert len(buf.item_bytes(3)) == 6
+        buf.reserve(2)
+        assert buf.capacity == 4
+        with self.assertRaises(ValueError):
+            buf.item_bytes(5)
+
+    @mock.patch('ioctl.ioctl')
+    def test_ioctl_fn_ptr_var(self, ioctl_mock):
+        class Header(ctypes.Structure):
+            _fields_ = [('count', ctypes.c_uint32)]
+        def _handle_ioctl(fd, request, buf_ref):
+            data = buf_ref._obj
+            assert ctypes.sizeof(data) == ctypes.sizeof(Header) + 3 * 4
+            header = Header.from_buffer(data)
+            items = (ctypes.c_uint32 * header.count).from_buffer(data, ctypes.sizeof(header))
+            for n in range(header.count):
+                items[n] = n * 10
+            return 0
+        ioctl_mock.side_effect = _handle_ioctl
+
+        fn = ioctl.ioctl_fn_ptr_var(32, Header, ctypes.c_uint32)
+        buf = ioctl.VarBuffer(Header, ctypes.c_uint32, 3)
+        buf.header.count = 3
+        assert fn(12, buf) == 0
+        assert list(buf.items) == [0, 10, 20]
+        with self.assertRaises(TypeError):
+            fn(12, ioctl.VarBuffer(Header, ctypes.c_uint16, 3))
+
 if __name__ == '__main__':
     unittest.main()
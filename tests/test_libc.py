@@ -0,0 +1,129 @@
+import ctypes
+import ctypes.util
+import os
+import subprocess
+import sys
+import threading
+import time
+import unittest
+
+import ioctl
+import ioctl.backends
+from ioctl import _libc
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+FIONREAD = 0x541B
+
+class TestLibc(unittest.TestCase):
+
+    def setUp(self):
+        ioctl.set_libc(None)
+
+    def tearDown(self):
+        ioctl.set_libc(None)
+
+    @mock.patch('ctypes.util.find_library', side_effect=AssertionError('find_library() called'))
+    def test_no_find_library(self, find_library_mock):
+        with mock.patch.dict(os.environ):
+            os.environ.pop('IOCTL_LIBC', None)
+            libc = _libc.get_libc()
+        assert libc.ioctl is not None
+        assert find_library_mock.call_count == 0
+
+    def test_env_override(self):
+        with mock.patch.dict(os.environ, {'IOCTL_LIBC': 'libc.so.6'}):
+            with mock.patch('ioctl._libc._load', return_value=mock.sentinel.libc) as load_mock:
+                assert _libc.get_libc() is mock.sentinel.libc
+        load_mock.assert_called_once_with('libc.so.6')
+
+    def test_set_libc(self):
+        libc = ctypes.CDLL(None, use_errno=True)
+        ioctl.set_libc(libc)
+        assert _libc.get_libc() is libc
+        rfd, wfd = os.pipe()
+        try:
+            value = ctypes.c_int()
+            ioctl.ioctl(rfd, FIONREAD, ctypes.byref(value))
+        finally:
+            os.close(rfd)
+            os.close(wfd)
+
+    def test_set_libc_ctypes_backend(self):
+        backend = ioctl.backends.CtypesBackend()
+        rfd, wfd = os.pipe()
+        try:
+            value = ctypes.c_int()
+            assert backend.ioctl(rfd, FIONREAD, value) == 0
+            # The C library is not looked up again for each call.
+            with mock.patch('ioctl._libc.get_libc', side_effect=AssertionError('get_libc() called')):
+                assert backend.ioctl(rfd, FIONREAD, value) == 0
+            ioctl.set_libc(ctypes.CDLL(None, use_errno=True))
+            assert backend._generic is None
+            assert backend.ioctl(rfd, FIONREAD, value) == 0
+        finally:
+            os.close(rfd)
+            os.close(wfd)
+
+    def test_set_libc_invalid(self):
+        with self.assertRaises(TypeError):
+            ioctl.set_libc(42)
+
+    def test_warm_up(self):
+        ioctl.warm_up()
+        assert ioctl._ioctl_fn is not None
+
+    def test_concurrent_first_use(self):
+        libc = ctypes.CDLL(None, use_errno=True)
+        def slow_find_libc():
+            time.sleep(0.05)
+            return libc
+        results = []
+        def worker():
+            barrier.wait()
+            results.append(ioctl._get_ioctl_fn())
+        barrier = threading.Barrier(8)
+        threads = [ threading.Thread(target=worker) for n in range(8) ]
+        with mock.patch('ioctl._libc._find_libc', side_effect=slow_find_libc) as find_libc_mock:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(find_libc_mock.call_count, 1)
+        self.assertEqual(len(results), 8)
+        assert all(fn is results[0] for fn in results)
+
+    def test_concurrent_calls(self):
+        rfd, wfd = os.pipe()
+        os.write(wfd, b'abcd')
+        fionread = ioctl.ioctl_fn_ptr_r(FIONREAD, ctypes.c_int)
+        errors = []
+        def worker():
+            try:
+                for n in range(1000):
+                    assert fionread(rfd) == 4
+            except Exception as e:
+                errors.append(e)
+        threads = [ threading.Thread(target=worker) for n in range(8) ]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            os.close(rfd)
+            os.close(wfd)
+        self.assertEqual(errors, [])
+
+    def test_lazy_imports(self):
+        code = 'import sys, ioctl, ioctl.linux; print(\'platform\' in sys.modules, \'fcntl\' in sys.modules)'
+        env = dict(os.environ, IOCTL_EAGER='1')
+        cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.check_output([sys.executable, '-S', '-c', code], env=env, cwd=cwd)
+        self.assertEqual(output.split(), [b'False', b'False'])
+
+if __name__ == '__main__':
+    unittest.main()
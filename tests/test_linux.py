@@ -55,33 +55,51 @@ def _native_values():
 
 class TestLinux(unittest.TestCase):
 
-    def _test_values(self, values):
-        EVIOCSFF = ioctl.linux.IOC('w', 'E', 0x80, values['sizeof_ff_effect'])
+    def _test_values(self, values, arch=None):
+        EVIOCSFF = ioctl.linux.IOC('w', 'E', 0x80, values['sizeof_ff_effect'], arch=arch)
         self.assertEqual(EVIOCSFF, values['EVIOCSFF'])
 
-        BLKRRPART = ioctl.linux.IO(0x12, 95)
+        BLKRRPART = ioctl.linux.IO(0x12, 95, arch=arch)
         self.assertEqual(BLKRRPART, values['BLKRRPART'])
 
-        RNDGETENTCNT = ioctl.linux.IOR('R', 0x00, values['sizeof_int'])
+        RNDGETENTCNT = ioctl.linux.IOR('R', 0x00, values['sizeof_int'], arch=arch)
         self.assertEqual(RNDGETENTCNT, values['RNDGETENTCNT'])
 
-        RNDADDTOENTCNT = ioctl.linux.IOW('R', 0x01, values['sizeof_int'])
+        RNDADDTOENTCNT = ioctl.linux.IOW('R', 0x01, values['sizeof_int'], arch=arch)
         self.assertEqual(RNDADDTOENTCNT, values['RNDADDTOENTCNT'])
 
-        FIFREEZE = ioctl.linux.IOWR('X', 119, values['sizeof_int'])
+        FIFREEZE = ioctl.linux.IOWR('X', 119, values['sizeof_int'], arch=arch)
         self.assertEqual(FIFREEZE, values['FIFREEZE'])
 
+        many = ioctl.linux.IOC_many([
+            ('w', 'E', 0x80, values['sizeof_ff_effect']),
+            (None, 0x12, 95, 0),
+            ('r', 'R', 0x00, values['sizeof_int']),
+            ('w', 'R', 0x01, values['sizeof_int']),
+            ('rw', 'X', 119, values['sizeof_int']),
+            ], arch=arch)
+        self.assertEqual(list(many), [ values[name] for name in ('EVIOCSFF', 'BLKRRPART', 'RNDGETENTCNT', 'RNDADDTOENTCNT', 'FIFREEZE') ])
+
     def test_i386(self):
-        with mock.patch('platform.machine', return_value='i386'):
-            self._test_values(arch_values['i386'])
+        self._test_values(arch_values['i386'], arch='i386')
 
     def test_x86_64(self):
-        with mock.patch('platform.machine', return_value='x86_64'):
-            self._test_values(arch_values['x86_64'])
+        self._test_values(arch_values['x86_64'], arch='x86_64')
 
     def test_armv6l(self):
-        with mock.patch('platform.machine', return_value='armv6l'):
-            self._test_values(arch_values['armv6l'])
+        self._test_values(arch_values['armv6l'], arch='armv6l')
+
+    def test_ppc64(self):
+        self.assertEqual(ioctl.linux.IOR('R', 0x00, ctypes.c_int, arch='ppc64'), 0x40045200)
+        self.assertEqual(ioctl.linux.IOW('R', 0x01, ctypes.c_int, arch='ppc64'), 0x80045201)
+        self.assertEqual(ioctl.linux.IO(0x12, 95, arch='ppc64'), 0x2000125f)
+
+    def test_native_machine_resolved_once(self):
+        with mock.patch('ioctl.linux._native_calculator', new=None), mock.patch('ioctl.linux._ioc_cache', new={}):
+            with mock.patch('platform.machine', return_value='ppc64') as machine_mock:
+                self.assertEqual(ioctl.linux.IOR('R', 0x02, ctypes.c_int), 0x40045202)
+                self.assertEqual(ioctl.linux.IOR('R', 0x03, ctypes.c_int), 0x40045203)
+        self.assertEqual(machine_mock.call_count, 1)
 
     def test_native(self):
         try:
@@ -99,6 +117,48 @@ class TestLinux(unittest.TestCase):
         with self.assertRaises(ValueError) as context:
             ioctl.linux.IOC(direction='wr', request_type=0, request_nr=0, size=0)
         self.assertEqual(str(context.exception), 'direction must be None, \'r\', \'w\' or \'rw\'.')
+        with self.assertRaises(ValueError):
+            ioctl.linux.IOC_many([('wr', 0, 0, 0)])
+
+    def test_ioc_invalid_size(self):
+        ioctl.linux.IOC('r', 'R', 0, 4)
+        with self.assertRaises(TypeError):
+            ioctl.linux.IOC('r', 'R', 0, 4.0)
+
+class TestLinuxDecode(unittest.TestCase):
+
+    def test_decode(self):
+        for arch in ('x86_64', 'ppc64', 'mips', 'alpha', 'parisc', 'sparc64'):
+            for direction in (None, 'r', 'w', 'rw'):
+                request = ioctl.linux.IOC(direction, 'X', 119, 24, arch=arch)
+                self.assertEqual(ioctl.linux.IOC_DIR(request, arch=arch), direction)
+                self.assertEqual(ioctl.linux.IOC_TYPE(request, arch=arch), ord('X'))
+                self.assertEqual(ioctl.linux.IOC_NR(request, arch=arch), 119)
+                self.assertEqual(ioctl.linux.IOC_SIZE(request, arch=arch), 24)
+
+    def test_decode_values(self):
+        values = arch_values['x86_64']
+        self.assertEqual(ioctl.linux.IOC_DIR(values['RNDADDTOENTCNT'], arch='x86_64'), 'w')
+        self.assertEqual(ioctl.linux.IOC_SIZE(values['EVIOCSFF'], arch='x86_64'), values['sizeof_ff_effect'])
+        self.assertEqual(ioctl.linux.IOC_DIR(values['BLKRRPART'], arch='x86_64'), None)
+
+    def test_registry(self):
+        registry = ioctl.linux.IoctlRegistry(arch='x86_64')
+        registry.register('FIONREAD', 0x541B)
+        registry.update({'RNDGETENTCNT': 0x80045200})
+        registry.register('SIOCINQ', 0x541B)
+        self.assertEqual(len(registry), 2)
+        assert 0x541B in registry
+        self.assertEqual(registry.lookup(0x541B), 'FIONREAD')
+        self.assertEqual(registry.names(0x541B), ('FIONREAD', 'SIOCINQ'))
+        self.assertEqual(registry.lookup(0x1234), None)
+        self.assertEqual(registry.annotate([0x80045200, 0x1234, 0x541B]), ['RNDGETENTCNT', None, 'FIONREAD'])
+        self.assertEqual(registry.annotate([0x1234], default='?'), ['?'])
+        self.assertEqual(registry.describe(0x80045200), 'RNDGETENTCNT')
+        self.assertEqual(registry.describe(0x40045201), "IOW('R', 0x01, 4)")
+        self.assertEqual(registry.describe(0x0000125f), 'IO(0x12, 0x5f)')
+        with self.assertRaises(TypeError):
+            registry.register(0x541B, 'FIONREAD')
 
 def _main():
     import platform
@@ -0,0 +1,94 @@
+import array
+import ctypes
+import errno
+import os
+import unittest
+
+import ioctl
+import ioctl.backends
+
+FIONREAD = 0x541B
+
+class TestMany(unittest.TestCase):
+
+    def setUp(self):
+        self.pipes = [ os.pipe() for _ in range(3) ]
+        for n, (rfd, wfd) in enumerate(self.pipes):
+            os.write(wfd, b'x' * n)
+
+    def tearDown(self):
+        for rfd, wfd in self.pipes:
+            os.close(rfd)
+            os.close(wfd)
+
+    def test_ioctl_many(self):
+        fds = [ rfd for rfd, wfd in self.pipes ]
+        res = ioctl.ioctl_many(fds, FIONREAD, ctypes.c_int)
+        assert isinstance(res.values, array.array)
+        assert res.values.tolist() == [0, 1, 2]
+        assert res.errnos.tolist() == [0, 0, 0]
+
+    def test_ioctl_many_errors(self):
+        fds = array.array('i', [ self.pipes[1][0], 1000000, self.pipes[2][0] ])
+        res = ioctl.ioctl_many(fds, FIONREAD, ctypes.c_int)
+        assert res.values.tolist() == [1, 0, 2]
+        assert res.errnos.tolist() == [0, errno.EBADF, 0]
+
+    def test_ioctl_many_structure(self):
+        class Data(ctypes.Structure):
+            _fields_ = [('value', ctypes.c_int)]
+        fds = [ rfd for rfd, wfd in self.pipes ]
+        res = ioctl.ioctl_many(fds, FIONREAD, Data)
+        assert [ v.value for v in res.values ] == [0, 1, 2]
+
+    def test_ioctl_many_empty(self):
+        res = ioctl.ioctl_many([], FIONREAD, ctypes.c_int)
+        assert len(res.values) == 0
+        assert len(res.errnos) == 0
+
+    def test_ioctl_many_out(self):
+        fds = [ rfd for rfd, wfd in self.pipes ] + [1000000]
+        values = array.array('i', [7]) * 4
+        errnos = array.array('i', [7]) * 4
+        res = ioctl.ioctl_many(fds, FIONREAD, ctypes.c_int, out=(values, errnos))
+        assert res.values is values
+        assert res.errnos is errnos
+        assert list(values) == [0, 1, 2, 0]
+        assert list(errnos) == [0, 0, 0, errno.EBADF]
+        with self.assertRaises(ValueError):
+            ioctl.ioctl_many(fds, FIONREAD, ctypes.c_int, out=(array.array('i'), errnos))
+
+    def test_ioctl_many_out_bytes(self):
+        fds = [ rfd for rfd, wfd in self.pipes ] + [1000000]
+        values = array.array('i', [7]) * 4
+        errnos = bytearray(4 * ctypes.sizeof(ctypes.c_int))
+        for backend in (None, 'fcntl'):
+            ioctl.backends.set_backend(backend)
+            try:
+                ioctl.ioctl_many(fds, FIONREAD, ctypes.c_int, out=(values, errnos))
+            finally:
+                ioctl.backends.set_backend(None)
+            assert list((ctypes.c_int * 4).from_buffer(errnos)) == [0, 0, 0, errno.EBADF]
+
+    def test_ioctl_many_invalid(self):
+        with self.assertRaises(TypeError):
+            ioctl.ioctl_many([self.pipes[0][0], 'x'], FIONREAD, ctypes.c_int)
+        with self.assertRaises(ValueError):
+            ioctl.ioctl_many([-1], FIONREAD, ctypes.c_int)
+        values = array.array('i', [0])
+        errnos = array.array('i', [0])
+        with self.assertRaises(ValueError):
+            ioctl.ioctl_many([self.pipes[0][0]], FIONREAD, ctypes.c_int, numpy=True, out=(values, errnos))
+
+    def test_ioctl_many_numpy(self):
+        try:
+            import numpy
+        except ImportError:
+            raise unittest.SkipTest('NumPy is not available.')
+        fds = numpy.array([ rfd for rfd, wfd in self.pipes ])
+        res = ioctl.ioctl_many(fds, FIONREAD, ctypes.c_int, numpy=True)
+        assert res.values.tolist() == [0, 1, 2]
+        assert res.errnos.tolist() == [0, 0, 0]
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import ctypes
+import unittest
+
+import ioctl.backends
+import ioctl.perf
+
+def _group(events=('task-clock', 'context-switches', 'page-faults')):
+    try:
+        return ioctl.perf.CounterGroup(events)
+    except (OSError, NotImplementedError) as e:
+        raise unittest.SkipTest('Unable to open performance counters: {}'.format(e))
+
+def _work():
+    data = [ bytearray(4096) for n in range(256) ]
+    return sum(len(block) for block in data)
+
+class TestPerf(unittest.TestCase):
+
+    def tearDown(self):
+        ioctl.backends.set_backend(None)
+
+    def test_request_numbers(self):
+        self.assertEqual(ctypes.sizeof(ioctl.perf.PerfEventAttr), 112)
+        self.assertEqual(ioctl.linux.IOC_TYPE(ioctl.perf.PERF_EVENT_IOC_ENABLE), ord('$'))
+        self.assertEqual(ioctl.perf.PERF_EVENT_IOC_ENABLE & 0xffff, 0x2400)
+        self.assertEqual(ioctl.perf.PERF_EVENT_IOC_RESET & 0xffff, 0x2403)
+        self.assertEqual(ioctl.linux.IOC_SIZE(ioctl.perf.PERF_EVENT_IOC_ID), ctypes.sizeof(ctypes.c_void_p))
+
+    def test_measure(self):
+        with _group() as group:
+            self.assertEqual(group.names, ['task-clock', 'context-switches', 'page-faults'])
+            self.assertEqual(len(set(group.ids)), 3)
+            with group.measure() as outer:
+                _work()
+                with group.measure() as inner:
+                    _work()
+                assert group.enabled
+            assert not group.enabled
+            assert outer.reading.values['task-clock'] > inner.reading.values['task-clock'] > 0
+            assert outer.reading.values['page-faults'] >= inner.reading.values['page-faults']
+            assert outer.reading.time_enabled >= outer.reading.time_running > 0
+
+    def test_enable_disable_reset(self):
+        with _group() as group:
+            self.assertEqual(group.read().values['task-clock'], 0)
+            group.enable()
+            _work()
+            group.disable()
+            counted = group.read().values['task-clock']
+            assert counted > 0
+            _work()
+            self.assertEqual(group.read().values['task-clock'], counted)
+            group.reset()
+            self.assertEqual(group.read().values['task-clock'], 0)
+
+    def test_single_ioctl(self):
+        with _group() as group:
+            backend = ioctl.backends.MockBackend()
+            ioctl.backends.set_backend(backend)
+            group.enable()
+            group.disable()
+            group.reset()
+            ioctl.backends.set_backend(None)
+            self.assertEqual(backend.calls, [
+                (group.leader, ioctl.perf.PERF_EVENT_IOC_ENABLE, ioctl.perf.PERF_IOC_FLAG_GROUP),
+                (group.leader, ioctl.perf.PERF_EVENT_IOC_DISABLE, ioctl.perf.PERF_IOC_FLAG_GROUP),
+                (group.leader, ioctl.perf.PERF_EVENT_IOC_RESET, ioctl.perf.PERF_IOC_FLAG_GROUP),
+            ])
+
+    def test_profile(self):
+        readings = []
+        with _group() as group:
+            @group.profile(report=lambda fn, reading: readings.append((fn.__name__, reading)))
+            def work():
+                return _work()
+            self.assertEqual(work(), 256 * 4096)
+            work()
+        self.assertEqual(work.calls, 2)
+        self.assertEqual(work.__name__, 'work')
+        self.assertEqual(len(readings), 2)
+        self.assertEqual(readings[0][0], 'work')
+        self.assertEqual(work.totals['task-clock'], sum(reading.values['task-clock'] for name, reading in readings))
+
+    def test_invalid_event(self):
+        with self.assertRaises(ValueError):
+            ioctl.perf.CounterGroup(('no-such-event',))
+        with self.assertRaises(ValueError):
+            ioctl.perf.CounterGroup(())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import socket
+import threading
+import time
+import unittest
+
+import ioctl.reader
+
+class TestPendingReader(unittest.TestCase):
+
+    def setUp(self):
+        self.rfd, self.wfd = os.pipe()
+
+    def tearDown(self):
+        os.close(self.rfd)
+        if self.wfd is not None:
+            os.close(self.wfd)
+
+    def _close_writer(self):
+        os.close(self.wfd)
+        self.wfd = None
+
+    def test_read_pending(self):
+        reader = ioctl.reader.PendingReader(self.rfd)
+        os.write(self.wfd, b'hello world')
+        data = reader.read()
+        assert isinstance(data, memoryview)
+        assert bytes(data) == b'hello world'
+        assert reader.reads == 1
+
+    def test_timeout(self):
+        reader = ioctl.reader.PendingReader(self.rfd)
+        assert reader.read(timeout=0.01) is None
+
+    def test_eof(self):
+        reader = ioctl.reader.PendingReader(self.rfd)
+        os.write(self.wfd, b'abc')
+        self._close_writer()
+        assert bytes(reader.read()) == b'abc'
+        assert len(reader.read()) == 0
+
+    def test_iter(self):
+        reader = ioctl.reader.PendingReader(self.rfd, ring_size=2)
+        def writer():
+            for n in range(20):
+                os.write(self.wfd, b'x' * 1000)
+                time.sleep(0.001)
+            self._close_writer()
+        thread = threading.Thread(target=writer)
+        thread.start()
+        total = sum(len(data) for data in reader)
+        thread.join()
+        assert total == 20000
+        assert reader.bytes_read == 20000
+
+    def test_ring(self):
+        reader = ioctl.reader.PendingReader(self.rfd, ring_size=2)
+        os.write(self.wfd, b'a')
+        first = reader.read()
+        os.write(self.wfd, b'b')
+        second = reader.read()
+        assert bytes(first) == b'a'
+        assert bytes(second) == b'b'
+        os.write(self.wfd, b'c')
+        reader.read()
+        assert bytes(first) == b'c'
+
+    def test_grow(self):
+        reader = ioctl.reader.PendingReader(self.rfd, ring_size=1, buffer_size=16, max_read=1000)
+        os.write(self.wfd, b'y' * 1500)
+        assert len(reader.read()) == 1000
+        assert len(reader.read()) == 500
+
+    def test_coalesce(self):
+        reader = ioctl.reader.PendingReader(self.rfd, coalesce=300, coalesce_timeout=5.0)
+        def writer():
+            for n in range(3):
+                time.sleep(0.01)
+                os.write(self.wfd, b'z' * 100)
+        thread = threading.Thread(target=writer)
+        thread.start()
+        data = reader.read()
+        thread.join()
+        assert bytes(data) == b'z' * 300
+        assert reader.reads == 3
+
+    def test_socket(self):
+        a, b = socket.socketpair()
+        try:
+            reader = ioctl.reader.PendingReader(b)
+            a.sendall(b'ping')
+            assert bytes(reader.read()) == b'ping'
+            a.close()
+            assert len(reader.read()) == 0
+        finally:
+            a.close()
+            b.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import ctypes
+import errno
+import io
+import os
+import tempfile
+import unittest
+
+import ioctl
+import ioctl.backends
+import ioctl.record
+
+FIONREAD = 0x541B
+FIONBIO = 0x5421
+FIOCLEX = 0x5451
+
+class TestRecord(unittest.TestCase):
+
+    def setUp(self):
+        self.rfd, self.wfd = os.pipe()
+        os.write(self.wfd, b'abc')
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        os.unlink(self.path)
+
+    def tearDown(self):
+        ioctl.backends.set_backend(None)
+        os.close(self.rfd)
+        os.close(self.wfd)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def _workload(self, rfd):
+        fionread = ioctl.compile(FIONREAD, ctypes.c_int, 'r')
+        results = [ fionread(rfd) ]
+        ioctl.ioctl_fn_ptr_w(FIONBIO, ctypes.c_int)(rfd, 1)
+        results.append(ioctl.ioctl(rfd, FIOCLEX))
+        try:
+            fionread(1000000)
+        except OSError as e:
+            results.append(e.errno)
+        return results
+
+    def test_record_replay(self):
+        with ioctl.record.recording(self.path, identify=True):
+            recorded = self._workload(self.rfd)
+        self.assertEqual(recorded, [3, 0, errno.EBADF])
+
+        records = list(ioctl.record.read_log(self.path))
+        self.assertEqual([ r.request for r in records ], [FIONREAD, FIONBIO, FIOCLEX, FIONREAD])
+        st = os.fstat(self.rfd)
+        self.assertEqual((records[0].dev, records[0].ino), (st.st_dev, st.st_ino))
+        self.assertEqual(records[0].data_in, bytes(ctypes.c_int(0)))
+        self.assertEqual(records[0].data_out, bytes(ctypes.c_int(3)))
+        self.assertEqual(records[1].data_in, bytes(ctypes.c_int(1)))
+        self.assertEqual(records[2].value, None)
+        self.assertEqual(records[2].data_out, None)
+        self.assertEqual((records[3].result, records[3].errno), (-1, errno.EBADF))
+
+        # Replay against a file descriptor with no pending data.
+        rfd, wfd = os.pipe()
+        try:
+            with ioctl.record.replaying(self.path, check_input=True) as backend:
+                replayed = self._workload(rfd)
+            assert os.get_blocking(rfd)
+        finally:
+            os.close(rfd)
+            os.close(wfd)
+        self.assertEqual(replayed, recorded)
+        self.assertEqual(backend.remaining(), 0)
+
+    def test_unsigned_value(self):
+        backend = ioctl.record.RecordingBackend(self.path, inner=ioctl.backends.MockBackend())
+        try:
+            backend.ioctl(3, FIONBIO, 2**64 - 1)
+            backend.ioctl(3, FIONBIO, -2)
+        finally:
+            backend.close()
+        records = list(ioctl.record.read_log(self.path))
+        self.assertEqual([ r.value for r in records ], [2**64 - 1, 2**64 - 2])
+        replay = ioctl.record.ReplayBackend(self.path, check_input=True)
+        self.assertEqual(replay.ioctl(3, FIONBIO, -1), 0)
+        self.assertEqual(replay.ioctl(3, FIONBIO, 2**64 - 2), 0)
+
+    def test_identify(self):
+        with ioctl.record.recording(self.path):
+            ioctl.ioctl(self.rfd, FIOCLEX)
+        record = next(ioctl.record.read_log(self.path))
+        self.assertEqual((record.dev, record.ino), (0, 0))
+
+    def test_replay_iterable(self):
+        with ioctl.record.recording(self.path):
+            ioctl.ioctl(self.rfd, FIOCLEX)
+            ioctl.ioctl(self.rfd, FIOCLEX)
+        backend = ioctl.record.ReplayBackend(record for record in ioctl.record.read_log(self.path))
+        self.assertEqual(backend.remaining(), 2)
+        with open(self.path, 'rb') as f:
+            self.assertEqual(ioctl.record.ReplayBackend(f).remaining(), 2)
+
+    def test_append(self):
+        with ioctl.record.recording(self.path):
+            ioctl.ioctl(self.rfd, FIOCLEX)
+        with ioctl.record.recording(self.path):
+            ioctl.ioctl(self.rfd, FIOCLEX)
+        self.assertEqual(len(list(ioctl.record.read_log(self.path))), 2)
+
+    def test_replay_errors(self):
+        backend = ioctl.record.ReplayBackend([])
+        with self.assertRaises(ioctl.record.ReplayError):
+            backend.ioctl(3, FIONREAD, ctypes.c_int())
+        record = ioctl.record.CallRecord(0, 0, 3, 0, 0, FIONREAD, 0, 0, None, b'\0' * 4, b'\1\0\0\0')
+        backend = ioctl.record.ReplayBackend([ record ], check_input=True)
+        with self.assertRaises(ioctl.record.ReplayError):
+            backend.ioctl(3, FIONREAD, ctypes.c_int(5))
+
+    def test_invalid_log(self):
+        with self.assertRaises(ValueError):
+            list(ioctl.record.read_log(io.BytesIO(b'NOTALOG!\x01\x00')))
+
+if __name__ == '__main__':
+    unittest.main()
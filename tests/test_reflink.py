@@ -0,0 +1,105 @@
+import ctypes
+import errno
+import os
+import shutil
+import tempfile
+import unittest
+
+import ioctl.backends
+import ioctl.reflink
+
+class TestReflink(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.src = os.path.join(self.dir, 'src')
+        with open(self.src, 'wb') as f:
+            f.write(os.urandom(100000))
+        ioctl.reflink.clear_cache()
+
+    def tearDown(self):
+        ioctl.backends.set_backend(None)
+        ioctl.reflink.clear_cache()
+        shutil.rmtree(self.dir)
+
+    def _read(self, name):
+        with open(os.path.join(self.dir, name), 'rb') as f:
+            return f.read()
+
+    def test_clone_file(self):
+        dst = os.path.join(self.dir, 'dst')
+        res = ioctl.reflink.clone_file(self.src, dst)
+        assert res.cloned + res.copied == 100000
+        assert self._read('dst') == self._read('src')
+
+    def test_clone_fd_range(self):
+        src_fd = os.open(self.src, os.O_RDONLY)
+        dst_fd = os.open(os.path.join(self.dir, 'dst'), os.O_RDWR | os.O_CREAT)
+        try:
+            res = ioctl.reflink.clone_fd(src_fd, dst_fd, offset=4096, length=8192, dst_offset=0)
+        finally:
+            os.close(src_fd)
+            os.close(dst_fd)
+        assert sum(res) == 8192
+        assert self._read('dst') == self._read('src')[4096:4096 + 8192]
+
+    def test_clone_fd_empty_range(self):
+        backend = ioctl.backends.MockBackend()
+        ioctl.backends.set_backend(backend)
+        src_fd = os.open(self.src, os.O_RDONLY)
+        dst_fd = os.open(os.path.join(self.dir, 'dst'), os.O_RDWR | os.O_CREAT)
+        try:
+            assert ioctl.reflink.clone_fd(src_fd, dst_fd, offset=4096, length=0) == (0, 0)
+            assert ioctl.reflink.clone_fd(src_fd, dst_fd, offset=200000) == (0, 0)
+        finally:
+            os.close(src_fd)
+            os.close(dst_fd)
+        assert backend.calls == []
+        assert self._read('dst') == b''
+
+    def test_unsupported_cached(self):
+        def handler(fd, request, arg):
+            raise OSError(errno.EOPNOTSUPP, 'Not supported')
+        backend = ioctl.backends.MockBackend(handler)
+        ioctl.backends.set_backend(backend)
+        assert ioctl.reflink.clone_file(self.src, os.path.join(self.dir, 'a')) == (0, 100000)
+        assert ioctl.reflink.clone_file(self.src, os.path.join(self.dir, 'b')) == (0, 100000)
+        assert len(backend.calls) == 1
+        fd = os.open(self.src, os.O_RDONLY)
+        try:
+            assert not ioctl.reflink.is_supported(fd)
+        finally:
+            os.close(fd)
+        assert self._read('b') == self._read('src')
+
+    def test_no_fallback(self):
+        ioctl.backends.set_backend(ioctl.backends.MockBackend(lambda fd, request, arg: -errno.EOPNOTSUPP))
+        with self.assertRaises(OSError) as context:
+            ioctl.reflink.clone_file(self.src, os.path.join(self.dir, 'dst'), fallback=False)
+        self.assertEqual(context.exception.errno, errno.EOPNOTSUPP)
+
+    def test_cloned(self):
+        backend = ioctl.backends.MockBackend()
+        ioctl.backends.set_backend(backend)
+        assert ioctl.reflink.clone_file(self.src, os.path.join(self.dir, 'dst')) == (100000, 0)
+        fd, request, arg = backend.calls[0]
+        assert request == ioctl.reflink.FICLONE
+
+    def test_clone_tree(self):
+        tree = os.path.join(self.dir, 'tree')
+        os.makedirs(os.path.join(tree, 'sub'))
+        shutil.copy(self.src, os.path.join(tree, 'a'))
+        shutil.copy(self.src, os.path.join(tree, 'sub', 'b'))
+        os.symlink('a', os.path.join(tree, 'link'))
+        res = ioctl.reflink.clone_tree(tree, os.path.join(self.dir, 'copy'), max_workers=2)
+        assert sum(res) == 200000
+        assert self._read('copy/sub/b') == self._read('src')
+        assert os.readlink(os.path.join(self.dir, 'copy', 'link')) == 'a'
+
+    def test_request_numbers(self):
+        assert ioctl.reflink.FICLONE == 0x40049409
+        assert ioctl.reflink.FICLONERANGE == 0x4020940d
+        assert ctypes.sizeof(ioctl.reflink.FileCloneRange) == 32
+
+if __name__ == '__main__':
+    unittest.main()
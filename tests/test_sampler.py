@@ -0,0 +1,137 @@
+import ctypes
+import errno
+import os
+import time
+import unittest
+
+import ioctl
+import ioctl.backends
+import ioctl.sampler
+
+FIONREAD = 0x541B
+
+class TestSampler(unittest.TestCase):
+
+    def setUp(self):
+        self.rfd, self.wfd = os.pipe()
+        self.fionread = ioctl.compile(FIONREAD, ctypes.c_int, 'r', check=False)
+
+    def tearDown(self):
+        ioctl.backends.set_backend(None)
+        os.close(self.rfd)
+        os.close(self.wfd)
+
+    def _wait(self, sampler, count):
+        deadline = time.monotonic() + 5
+        while sampler.count < count and time.monotonic() < deadline:
+            time.sleep(0.001)
+
+    def test_sample(self):
+        sampler = ioctl.sampler.Sampler(0.002, capacity=1000)
+        sampler.add('pipe', self.rfd, self.fionread)
+        sampler.add('bad', 1000000, self.fionread)
+        os.write(self.wfd, b'hello')
+        with sampler:
+            assert sampler.running
+            self._wait(sampler, 20)
+        assert not sampler.running
+        window = sampler.window()
+        assert window.start == 0
+        assert len(window.timestamps) == sampler.count >= 20
+        assert set(window.values['pipe']) == {5}
+        assert set(window.errnos['bad']) == {errno.EBADF}
+        assert set(window.values['bad']) == {0}
+        gaps = [ b - a for a, b in zip(window.timestamps, window.timestamps[1:]) ]
+        assert min(gaps) > 0
+        # Absolute deadlines keep the average rate, even if single samples are late.
+        elapsed = window.timestamps[-1] - window.timestamps[0] - window.delays[-1] + window.delays[0]
+        self.assertAlmostEqual(elapsed / (len(window.timestamps) - 1 + sampler.missed), 0.002, delta=0.0005)
+
+    def test_ring(self):
+        sampler = ioctl.sampler.Sampler(0.001, capacity=8)
+        sampler.add('pipe', self.rfd, self.fionread)
+        with sampler:
+            self._wait(sampler, 20)
+        count = sampler.count
+        window = sampler.window()
+        assert window.start == count - 8
+        assert len(window.timestamps) == 8
+        assert list(window.timestamps) == sorted(window.timestamps)
+        window = sampler.window(3)
+        assert (window.start, len(window.values['pipe'])) == (count - 3, 3)
+        window = sampler.since(0)
+        assert window.start == count - 8
+        window = sampler.since(count)
+        assert (window.start, len(window.timestamps)) == (count, 0)
+
+    def test_missed(self):
+        def handler(fd, request, arg):
+            time.sleep(0.025)
+            arg.value = 1
+        ioctl.backends.set_backend(ioctl.backends.MockBackend(handler))
+        sampler = ioctl.sampler.Sampler(0.01)
+        sampler.add('slow', 3, self.fionread)
+        with sampler:
+            self._wait(sampler, 3)
+        assert sampler.missed >= 2 * (sampler.count - 1)
+        assert max(sampler.window().delays) < 0.01
+
+    def test_numpy(self):
+        try:
+            import numpy
+        except ImportError:
+            raise unittest.SkipTest('NumPy is not available.')
+        sampler = ioctl.sampler.Sampler(0.001, capacity=4, numpy=True)
+        sampler.add('pipe', self.rfd, self.fionread)
+        os.write(self.wfd, b'abc')
+        with sampler:
+            self._wait(sampler, 10)
+        window = sampler.window()
+        assert window.values['pipe'].tolist() == [3, 3, 3, 3]
+
+    def test_unsigned(self):
+        backend = ioctl.backends.MockBackend(lambda fd, request, arg: setattr(arg, 'value', 2**64 - 1))
+        sampler = ioctl.sampler.Sampler(0.001, capacity=4)
+        sampler.add('big', 3, ioctl.compile(FIONREAD, ctypes.c_uint64, 'r', check=False, backend=backend))
+        with sampler:
+            self._wait(sampler, 2)
+        assert sampler.error is None
+        assert set(sampler.window().values['big']) == {2**64 - 1}
+
+    def test_error(self):
+        def handler(fd, request, arg):
+            raise RuntimeError('broken')
+        backend = ioctl.backends.MockBackend(handler)
+        sampler = ioctl.sampler.Sampler(0.001)
+        sampler.add('broken', 3, ioctl.compile(FIONREAD, ctypes.c_int, 'r', check=False, backend=backend))
+        with sampler:
+            deadline = time.monotonic() + 5
+            while sampler.running and time.monotonic() < deadline:
+                time.sleep(0.001)
+            assert not sampler.running
+        assert isinstance(sampler.error, RuntimeError)
+        assert sampler.count == 0
+
+    def test_invalid(self):
+        sampler = ioctl.sampler.Sampler(0.01)
+        with self.assertRaises(ValueError):
+            sampler.add('a', self.rfd, ioctl.compile(FIONREAD, ctypes.c_int, 'r'))
+        with self.assertRaises(TypeError):
+            sampler.add('a', self.rfd, ioctl.ioctl_fn_ptr_r(FIONREAD, ctypes.c_int))
+        with self.assertRaises(ValueError):
+            sampler.add('a', self.rfd, ioctl.compile(FIONREAD, ctypes.c_int, 'r', return_python=False, check=False))
+        with self.assertRaises(ValueError):
+            sampler.add('a', self.rfd, ioctl.compile(FIONREAD, ctypes.c_double, 'r', check=False))
+        sampler.add('a', self.rfd, self.fionread)
+        with self.assertRaises(ValueError):
+            sampler.add('a', self.rfd, self.fionread)
+        with sampler:
+            with self.assertRaises(ValueError):
+                sampler.add('b', self.rfd, self.fionread)
+            with self.assertRaises(ValueError):
+                sampler.start()
+        with self.assertRaises(ValueError):
+            ioctl.sampler.Sampler(0)
+
+if __name__ == '__main__':
+    unittest.main()
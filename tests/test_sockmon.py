@@ -0,0 +1,88 @@
+import errno
+import socket
+import unittest
+
+import ioctl.sockmon
+
+class TestQueueMonitor(unittest.TestCase):
+
+    def setUp(self):
+        self.pairs = [ socket.socketpair() for n in range(4) ]
+        for n, (a, b) in enumerate(self.pairs):
+            a.sendall(b'x' * (n * 100))
+
+    def tearDown(self):
+        for a, b in self.pairs:
+            a.close()
+            b.close()
+
+    def _monitor(self, numpy=False):
+        return ioctl.sockmon.QueueMonitor([ b for a, b in self.pairs ], numpy=numpy)
+
+    def test_scrape(self):
+        monitor = self._monitor()
+        assert len(monitor) == 4
+        monitor.scrape()
+        assert list(monitor.values['inq']) == [0, 100, 200, 300]
+        assert list(monitor.errnos['inq']) == [0, 0, 0, 0]
+
+    def test_outq(self):
+        monitor = ioctl.sockmon.QueueMonitor([ a for a, b in self.pairs ])
+        monitor.scrape()
+        assert list(monitor.errnos['outq']) == [0, 0, 0, 0]
+        assert list(monitor.values['inq']) == [0, 0, 0, 0]
+
+    def test_tcp(self):
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+        client = socket.create_connection(server.getsockname())
+        conn, address = server.accept()
+        try:
+            client.sendall(b'hello')
+            monitor = ioctl.sockmon.QueueMonitor([client, conn], columns=('inq', 'outq', 'outq_nsd'))
+            for attempt in range(100):
+                monitor.scrape()
+                if monitor.values['inq'][1] == 5:
+                    break
+            assert monitor.values['inq'][1] == 5
+            assert monitor.failed('outq_nsd') == []
+        finally:
+            client.close()
+            conn.close()
+            server.close()
+
+    def test_top_and_above(self):
+        monitor = self._monitor()
+        monitor.scrape()
+        fds = monitor.fds
+        assert monitor.top(2, 'inq') == [(fds[3], 300), (fds[2], 200)]
+        assert monitor.above(150, 'inq') == [(fds[2], 200), (fds[3], 300)]
+        assert monitor.top(10, 'inq')[-1] == (fds[0], 0)
+
+    def test_failed(self):
+        monitor = ioctl.sockmon.QueueMonitor([1000000])
+        monitor.scrape()
+        assert monitor.failed() == [(1000000, errno.EBADF)]
+
+    def test_invalid_column(self):
+        with self.assertRaises(ValueError):
+            ioctl.sockmon.QueueMonitor([], columns=('foo',))
+        monitor = self._monitor()
+        with self.assertRaises(ValueError):
+            monitor.top(1, 'outq_nsd')
+
+    def test_numpy(self):
+        try:
+            import numpy
+        except ImportError:
+            raise unittest.SkipTest('NumPy is not available.')
+        monitor = self._monitor(numpy=True)
+        monitor.scrape()
+        fds = monitor.fds
+        assert monitor.values['inq'].tolist() == [0, 100, 200, 300]
+        assert monitor.top(2, 'inq') == [(fds[3], 300), (fds[2], 200)]
+        assert monitor.above(150, 'inq') == [(fds[2], 200), (fds[3], 300)]
+
+if __name__ == '__main__':
+    unittest.main()